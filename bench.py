@@ -0,0 +1,919 @@
+#!/usr/bin/env python3
+# bench.py: timing harness for the Pausch Bridge content generators.
+
+# Each benchmark is a setup function registered with @benchmark.  The setup
+# function does any untimed preparation and returns the callable to be timed.
+# If the timed callable returns a dict, its entries are reported alongside the
+# timings, e.g. frames/sec or bytes/frame.  An entry whose value is True or
+# False is a check, e.g. that two ways of rendering give identical frames: if
+# it is False in any repetition the benchmark is reported as FAILED and the
+# script exits with status 1.  Benchmarks registered with check=True exist
+# mainly for their checks and are run together by --checks.
+#
+#   python3 bench.py                  # run all benchmarks
+#   python3 bench.py pi-phase1 -r 20  # run selected benchmarks
+#   python3 bench.py --checks -r 1    # run the checks
+#   python3 bench.py --list
+
+#================================================================
+# Import standard Python modules.
+import argparse
+import functools
+import itertools
+import os
+import sys
+import time
+
+from pbl import shows
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+#================================================================
+# Benchmark registry.
+
+benchmarks = {}
+checks = set()
+
+def benchmark(name, check=False):
+    def register(setup):
+        benchmarks[name] = setup
+        if check:
+            checks.add(name)
+        return setup
+    return register
+
+def run_benchmark(name, repeat):
+    # Run and report one benchmark, returning the names of its failed checks.
+    timed = benchmarks[name]()
+    times = []
+    failed = set()
+    for i in range(repeat):
+        start = time.perf_counter()
+        extra = timed()
+        times.append(time.perf_counter() - start)
+        if isinstance(extra, dict):
+            failed.update(key for key, value in extra.items() if value is False)
+
+    report = f"{name:28s} best {min(times)*1e3:10.3f} ms   mean {sum(times)/len(times)*1e3:10.3f} ms"
+    if isinstance(extra, dict):
+        report += "".join(f"   {key} {value}" for key, value in extra.items())
+    if failed:
+        report += f"   FAILED {', '.join(sorted(failed))}"
+    print(report, flush=True)
+    return failed
+
+#================================================================
+# Pi phase generation.
+
+def pi_phase(phase):
+    genvideo = shows.load('pi')
+    timeline = genvideo.allocate_timeline()
+    frames = genvideo.phase_view(timeline, phase)
+    if phase == 0:
+        return lambda: genvideo.phase1(frames)
+    elif phase == 1:
+        return lambda: genvideo.phase2(frames)
+    elif phase == 2:
+        lastframe2 = genvideo.phase2_lastframe()
+        return lambda: genvideo.phase3(frames, lastframe2)
+    elif phase == 3:
+        return lambda: genvideo.phase4(frames)
+    else:
+        lastframe4 = genvideo.phase4_lastframe()
+        return lambda: genvideo.phase5(frames, lastframe4)
+
+@benchmark('pi-phase1')
+def bench_pi_phase1():
+    return pi_phase(0)
+
+@benchmark('pi-phase2')
+def bench_pi_phase2():
+    return pi_phase(1)
+
+@benchmark('pi-phase3')
+def bench_pi_phase3():
+    return pi_phase(2)
+
+@benchmark('pi-phase4')
+def bench_pi_phase4():
+    return pi_phase(3)
+
+@benchmark('pi-phase5')
+def bench_pi_phase5():
+    return pi_phase(4)
+
+@benchmark('pi-digits-text')
+def bench_pi_digits_text():
+    shows.load('pi')
+    import pidigits
+    def timed():
+        with open(pidigits.text_file, 'r') as file:
+            digits = file.read()
+        digits = list(map(int, digits[2:].strip()))
+        return {'digits': len(digits)}
+    return timed
+
+@benchmark('pi-digits-store')
+def bench_pi_digits_store():
+    shows.load('pi')
+    import pidigits
+    def timed():
+        store = pidigits.DigitStore()
+        digits = store.digits(1, len(store))
+        return {'digits': len(digits)}
+    return timed
+
+@benchmark('pi-import')
+def bench_pi_import():
+    # Startup cost of the pi generator in a fresh interpreter, including its
+    # peak resident memory in MB.  ru_maxrss carries over the parent's peak
+    # across fork/exec on Linux, so VmHWM is read instead where available.
+    import subprocess
+    script = ("import resource, genvideo\n"
+              "try:\n"
+              "    with open('/proc/self/status') as file:\n"
+              "        print(next(int(line.split()[1]) for line in file if line.startswith('VmHWM')) // 1024)\n"
+              "except OSError:\n"
+              "    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024)\n")
+    def timed():
+        result = subprocess.run([sys.executable, '-c', script], cwd=os.path.join(root, 'pi'),
+                                capture_output=True, text=True, check=True)
+        return {'maxrss MB': result.stdout.strip()}
+    return timed
+
+@benchmark('pi-timeline')
+def bench_pi_timeline():
+    genvideo = shows.load('pi')
+    def timed():
+        begin = time.perf_counter()
+        frames = genvideo.build_timeline(genvideo.allocate_timeline())
+        return {'frames/sec': f"{len(frames) / (time.perf_counter() - begin):.0f}"}
+    return timed
+
+@benchmark('pi-timeline-parallel', check=True)
+def bench_pi_timeline_parallel():
+    # The phases in one process each, written into a shared timeline, which
+    # is checked against the serial build.
+    import numpy as np
+    genvideo = shows.load('pi')
+    reference = genvideo.build_timeline(genvideo.allocate_timeline())
+    workers = min(os.cpu_count(), len(genvideo.PHASE_LENGTHS))
+    def timed():
+        begin = time.perf_counter()
+        frames = genvideo.build_timeline(genvideo.allocate_timeline(), max(workers, 2))
+        elapsed = time.perf_counter() - begin
+        return {'frames/sec': f"{len(frames) / elapsed:.0f}", 'workers': max(workers, 2),
+                'identical': np.array_equal(frames, reference)}
+    return timed
+
+@benchmark('pi-projection')
+def bench_pi_projection():
+    # The pi timeline projected onto the bridge pixels through the fixture map.
+    genvideo = shows.load('pi')
+    import fixtures
+    timeline = genvideo.build_timeline(genvideo.allocate_timeline())
+    fixture_map = fixtures.bridge_map()
+    def timed():
+        begin = time.perf_counter()
+        video = fixture_map.to_physical(timeline)
+        return {'frames/sec': f"{len(video) / (time.perf_counter() - begin):.0f}"}
+    return timed
+
+#================================================================
+# Parameter sweeps: frames for several tempos, generating the keyframes for
+# each tempo versus cross-fading from one shared keyframe table.
+
+sweep_tempos = (20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+sweep_length = 1200
+
+@benchmark('sweep-direct')
+def bench_sweep_direct():
+    import random
+    show = shows.load('perfect_squares_part1')
+    def timed():
+        random.seed(1)
+        count = sum(1 for tempo in sweep_tempos
+                      for frame in itertools.islice(show.frame_generator(False, tempo), sweep_length))
+        return {'frames': count}
+    return timed
+
+@benchmark('sweep-table')
+def bench_sweep_table():
+    import random
+    from pbl import keyframes
+    show = shows.load('perfect_squares_part1')
+    def timed():
+        random.seed(1)
+        table = keyframes.KeyframeTable(show.keyframe_generator(False))
+        timings = [keyframes.schedule(table.interval_seconds, 7.0 / tempo, sweep_length) for tempo in sweep_tempos]
+        arrays = table.arrays()
+        count = sum(1 for timing in timings for frame in keyframes.table_frames(arrays, *timing))
+        return {'frames': count, 'keyframes': len(arrays['frames'])}
+    return timed
+
+# Keyframe timing over one hour at 30 fps, 7 frames per keyframe: the float
+# phase accumulation of schedule() against the exact Timeline, which counts
+# the frames whose keyframe interval differs.
+
+@benchmark('timeline-hour')
+def bench_timeline_hour():
+    import numpy as np
+    from pbl import keyframes
+    length = 30 * 3600
+    legacy = keyframes.schedule(lambda k: np.nan, 7.0 / 30.0, length)
+    def timed():
+        timing = keyframes.Timeline(lambda k: np.nan, 7.0 / 30.0).sample(30, length)
+        return {'frames': len(timing[0]), 'last keyframe': timing[0][-1], 'float schedule': legacy[0][-1],
+                'frames off': int(np.count_nonzero(timing[0] != legacy[0]))}
+    return timed
+
+#================================================================
+# Output stages, on the frames of the pi show and 3000 frames of the
+# pythagorean show, which hold many frames.
+
+def output_frames(name):
+    import argparse
+    import numpy as np
+    show = shows.load(name)
+    args = argparse.Namespace(verbose=False, length=3000, tempo=30.0, beats=None)
+    if name == 'pi':
+        args.length = sum(show.PHASE_LENGTHS)
+    return [np.ascontiguousarray(frame) for frame in show.frames(args)]
+
+def bench_write(name):
+    import tempfile
+    from pbl import video
+    frames = output_frames(name)
+    basename = os.path.join(tempfile.mkdtemp(), name)
+    encoder = video.FrameEncoder()
+    for frame in frames:
+        encoder.encode(frame)
+    def timed():
+        count = video.write_video_file(basename, frames)
+        return {'bytes/frame': os.path.getsize(basename + '.' + video.file_extension) // count,
+                'encoded': encoder.encoded, 'held': encoder.held, 'reused': encoder.reused}
+    return timed
+
+@benchmark('write-pi')
+def bench_write_pi():
+    return bench_write('pi')
+
+@benchmark('write-pythagorean')
+def bench_write_pythagorean():
+    return bench_write('pythagorean')
+
+# Each output backend writing the same frames on the generator's thread,
+# reporting its throughput and the size of its output.
+
+def output_bytes(path):
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+    return os.path.getsize(path) if os.path.isfile(path) else 0
+
+def bench_backend(backend, name):
+    import shutil
+    import tempfile
+    from pbl import backends, video
+    frames = output_frames(name)
+    directory = tempfile.mkdtemp()
+    basename = os.path.join(directory, name)
+    try:
+        video.write_video_file(basename, frames[:1], buffers=0, backend=backend)
+    except ValueError as error:
+        print(f"backend-{backend}: {error}")
+        return lambda: None
+    def timed():
+        begin = time.perf_counter()
+        out = backends.open_backend(backend, basename)
+        for frame in frames:
+            out.write(frame)
+        out.close()
+        elapsed = time.perf_counter() - begin
+        size = output_bytes(out.filename) if out.filename != os.devnull else 0
+        if os.path.isdir(out.filename):
+            shutil.rmtree(out.filename)
+        return {'frames/sec': f"{len(frames) / elapsed:.0f}", 'bytes/frame': size // len(frames)}
+    return timed
+
+for name in ('pythagorean', 'pi'):
+    for backend in ('png-avi', 'ffv1', 'npy', 'png-dir', 'null'):
+        benchmark(f'backend-{backend}-{name}')(functools.partial(bench_backend, backend, name))
+
+# Whole renders, generating and writing, with the frames encoded on the
+# generator's thread, on a background thread, or on two background threads.
+
+def bench_render(name, buffers, encoders):
+    import argparse
+    import tempfile
+    from pbl import video
+    show = shows.load(name)
+    length = sum(show.PHASE_LENGTHS) if name == 'pi' else 3000
+    basename = os.path.join(tempfile.mkdtemp(), name)
+    def timed():
+        args = argparse.Namespace(verbose=False, length=length, tempo=30.0, beats=None)
+        count = video.write_video_file(basename, show.frames(args), buffers=buffers, encoders=encoders)
+        return {'frames': count}
+    return timed
+
+for name in ('primes', 'pythagorean', 'color_bars', 'pi'):
+    for mode, buffers, encoders in (('serial', 0, 1), ('thread', 4, 1), ('threads2', 4, 2)):
+        benchmark(f'render-{name}-{mode}')(functools.partial(bench_render, name, buffers, encoders))
+
+@benchmark('render-pi-segments')
+def bench_render_pi_segments():
+    # The pi show in one segment per CPU, joined into one file.
+    import tempfile
+    from pbl import segments
+    basename = os.path.join(tempfile.mkdtemp(), 'pi')
+    workers = os.cpu_count()
+    def timed():
+        count = segments.render_segments('pi', [basename], workers, workers)
+        return {'frames': count, 'workers': workers}
+    return timed
+
+# Shows rendered in four segments against a serial render of the same show:
+# the joined file must be byte for byte the serial one.  The pi show generates
+# each segment directly; the pythagorean and fibonacci shows replay their
+# frames up to each segment's start, seeded alike in every worker.
+
+def bench_segments_identical(name, argv):
+    import filecmp
+    import tempfile
+    from pbl import cli, segments
+    directory = tempfile.mkdtemp()
+    argv = [option.format(directory=directory) for option in argv]
+    if name == 'fibonacci':
+        import numpy as np
+        import cv2 as cv
+        cv.imwrite(os.path.join(directory, 'image.png'),
+                   np.random.default_rng(1).integers(0, 256, (140, 580, 3), dtype=np.uint8))
+    serial = os.path.join(directory, 'serial')
+    cli.render(name, argv + [serial])
+    def timed():
+        basename = os.path.join(directory, 'segmented')
+        count = segments.render_segments(name, argv + [basename], 4, 4)
+        return {'frames': count,
+                'identical': filecmp.cmp(serial + '.avi', basename + '.avi', shallow=False)}
+    return timed
+
+for name, argv in (('pi', []),
+                   ('pythagorean', ['-l', '6000', '--seed', '1', '-t', '120']),
+                   ('fibonacci', ['-i', os.path.join('{directory}', 'image.png'), '-l', '6000', '--seed', '1', '-t', '120'])):
+    benchmark(f'segments-identical-{name}', check=True)(functools.partial(bench_segments_identical, name, argv))
+
+def bench_send(name):
+    import socket
+    from pbl import live
+    frames = output_frames(name)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 16)
+    def timed():
+        sender = live.ArtNetSender('127.0.0.1', receiver.getsockname()[1])
+        # Frame times at the canonical rate, without waiting for them.
+        for count, frame in enumerate(frames):
+            sender.send(frame, now=count / live.frame_rate)
+        sender.close()
+        return {'packets': sender.packets, 'skipped': sender.skipped,
+                'saved': f"{100.0 * sender.skipped / (sender.packets + sender.skipped):.0f}%"}
+    return timed
+
+@benchmark('calibration-lut')
+def bench_calibration_lut():
+    # The calibration lookup on the frames of the pythagorean show.
+    import numpy as np
+    from pbl import calibration
+    frames = output_frames('pythagorean')
+    table = calibration.Calibration((2.2, 2.0, 2.4), (1.0, 0.85, 0.7), 0.8)
+    out = np.zeros_like(frames[0])
+    def timed():
+        begin = time.perf_counter()
+        for frame in frames:
+            table.apply(frame, out)
+        return {'us/frame': f"{(time.perf_counter() - begin) / len(frames) * 1e6:.1f}"}
+    return timed
+
+# Allocations per frame with and without a ring of output frames.  After a
+# warm-up, each frame is generated with the traces cleared and a profile hook
+# that sums the bytes numpy holds for arrays at the return of every call, so
+# that the most of them at any point of a frame is its peak of new arrays,
+# temporaries included.  With a ring that peak must be zero for every frame,
+# and the memory held by numpy arrays may not grow at all over 1000 frames;
+# without a ring, the shows that allocate their frames must show up as
+# allocating a frame each, so that the measurement is known to see them.
+# The Python objects of a frame, such as the views of ring buffers and the
+# generators' integers and tuples, are allowed separately: the most memory
+# of any kind traced while generating one frame may not exceed
+# python_allowance.  Keyframe generation allocates per keyframe, so the
+# cross-fades run between fixed keyframes, with an overlay, and the score is
+# the sequence show, which draws no random colors.  The pi show converts its
+# whole video at once without a ring, so it is also traced from the start:
+# with a ring its peak may not exceed its timeline and one byte per pixel of
+# the frames generated.
+
+python_allowance = 2048
+
+def frame_allocations(frame_sequence, warmup=100, count=1000):
+    # After warmup frames: the most memory traced while generating one of
+    # count frames and the growth of the memory numpy holds for arrays over
+    # them, then the largest peak of new numpy arrays in count more frames.
+    import sys
+    import tracemalloc
+    import numpy as np
+    domain = tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)
+    def array_bytes():
+        return sum(trace.size for trace in tracemalloc.take_snapshot().filter_traces([domain]).traces)
+    arrays = 0
+    def sample(frame, event, arg):
+        nonlocal arrays
+        if event in ('return', 'c_return'):
+            arrays = max(arrays, array_bytes())
+    frame_sequence = iter(frame_sequence)
+    tracemalloc.start()
+    try:
+        for frame in itertools.islice(frame_sequence, warmup):
+            pass
+        base = array_bytes()
+        largest = 0
+        for i in range(count):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            next(frame_sequence)
+            largest = max(largest, tracemalloc.get_traced_memory()[1] - current)
+        growth = array_bytes() - base
+        for i in range(count):
+            tracemalloc.clear_traces()
+            sys.setprofile(sample)
+            try:
+                next(frame_sequence)
+            finally:
+                sys.setprofile(None)
+            arrays = max(arrays, array_bytes())
+    finally:
+        tracemalloc.stop()
+    return arrays, largest, growth
+
+def bench_allocations(sequence, allocating=True):
+    from pbl import video
+    frame_bytes = video.frame_height * video.frame_width * 3
+    def timed():
+        arrays, largest, growth = frame_allocations(sequence(video.FrameRing()))
+        report = {'array peak B/frame': arrays, 'growth B': growth, 'largest B/frame': largest,
+                  'allocation-free': arrays == 0 and growth == 0,
+                  'within Python allowance': largest <= python_allowance}
+        if allocating:
+            unbuffered = frame_allocations(sequence(None))[0]
+            report.update({'without ring B/frame': unbuffered, 'sees allocations': unbuffered >= frame_bytes})
+        return report
+    return timed
+
+def steady_keyframes():
+    import numpy as np
+    rng = np.random.default_rng(1)
+    frame0, frame1 = rng.integers(0, 256, (2, 8, 228, 3), dtype=np.uint8)
+    mask = np.zeros((8, 228), dtype=bool)
+    mask[:, 100:104] = True
+    return itertools.repeat((frame0, frame1, 0.5, (mask, (0, 165, 255))))
+
+@benchmark('alloc-crossfade', check=True)
+def bench_alloc_crossfade():
+    from pbl import keyframes
+    return bench_allocations(lambda ring: keyframes.crossfade(steady_keyframes(), ring=ring))
+
+@benchmark('alloc-table', check=True)
+def bench_alloc_table():
+    from pbl import keyframes
+    table = keyframes.KeyframeTable(steady_keyframes())
+    timing = keyframes.schedule(table.interval_seconds, 1.0, 2101)
+    arrays = table.arrays()
+    return bench_allocations(lambda ring: keyframes.table_frames(arrays, *timing, ring))
+
+@benchmark('alloc-score', check=True)
+def bench_alloc_score():
+    from pbl import cli
+    def sequence(ring):
+        show, args = cli.parse_show_args('sequence', ['-s', 'primes', '-t', '600', '--ring', str(len(ring or ()))])
+        return show.frames(args)
+    return bench_allocations(sequence)
+
+@benchmark('alloc-pi', check=True)
+def bench_alloc_pi():
+    import argparse
+    import tracemalloc
+    import numpy as np
+    from pbl import video
+    show = shows.load('pi')
+    length = 2101
+    def sequence(ring):
+        return show.frames(argparse.Namespace(length=length, ring=0 if ring is None else len(ring)))
+    def whole_peak(ring):
+        tracemalloc.start()
+        try:
+            for frame in sequence(ring):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    steady = bench_allocations(sequence, allocating=False)
+    limit = int(np.prod(show.timeline_shape)) * 8 + length * video.frame_height * video.frame_width * 3
+    def timed():
+        report = steady()
+        ring_peak = whole_peak(video.FrameRing())
+        report.update({'peak MB': f"{ring_peak / 1e6:.1f}", 'without ring MB': f"{whole_peak(None) / 1e6:.1f}",
+                       'no whole-video conversion': ring_peak < limit})
+        return report
+    return timed
+
+@benchmark('send-pi')
+def bench_send_pi():
+    return bench_send('pi')
+
+@benchmark('send-pythagorean')
+def bench_send_pythagorean():
+    return bench_send('pythagorean')
+
+# Live playback through the shared memory ring, with the dummy sender at ten
+# times the canonical frame rate: the pythagorean show in a worker process,
+# whose checksum must match playing it directly, and a producer that stalls
+# for 50 ms every 100 frames, which the consumer must ride out as underruns.
+# A show process killed after 100 frames must make the consumer raise an
+# error within the producer timeout instead of waiting for ever.
+
+def play_checksum(frame_sequence):
+    from pbl import live, transport
+    sender = transport.DummySender()
+    live.play(frame_sequence, sender, rate=10 * live.frame_rate)
+    return sender.checksum
+
+@benchmark('transport-pythagorean', check=True)
+def bench_transport_pythagorean():
+    import concurrent.futures
+    from pbl import cli, transport
+    argv = ['-l', '600', '--seed', '1']
+    show, args = cli.parse_show_args('pythagorean', argv)
+    cli.seed(args)
+    direct = play_checksum(show.frames(args))
+    def timed():
+        ring = transport.SharedFrameRing()
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+                future = pool.submit(transport.produce_show, 'pythagorean', argv, ring.name)
+                checksum = play_checksum(transport.ring_frames(ring))
+                future.result()
+            return dict(ring.stats(), identical=checksum == direct)
+        finally:
+            ring.close()
+            ring.unlink()
+    return timed
+
+@benchmark('transport-hiccups')
+def bench_transport_hiccups():
+    import threading
+    from pbl import transport
+    show = shows.load('pythagorean')
+    def stalling():
+        for count, frame in enumerate(itertools.islice(show.frame_generator(False, 30.0), 600)):
+            if count % 100 == 99:
+                time.sleep(0.05)
+            yield frame
+    def timed():
+        ring = transport.SharedFrameRing(slots=8)
+        try:
+            producer = threading.Thread(target=transport.produce, args=(stalling(), ring))
+            producer.start()
+            play_checksum(transport.ring_frames(ring))
+            producer.join()
+            return ring.stats()
+        finally:
+            ring.close()
+            ring.unlink()
+    return timed
+
+def dying_producer(ring_name):
+    from pbl import transport
+    ring = transport.SharedFrameRing(name=ring_name)
+    ring.start_heartbeat()
+    show = shows.load('pythagorean')
+    for frame in itertools.islice(show.frame_generator(False, 30.0), 100):
+        ring.put(frame)
+    os._exit(1)
+
+@benchmark('transport-dead-producer', check=True)
+def bench_transport_dead_producer():
+    import multiprocessing
+    from pbl import transport
+    def timed():
+        ring = transport.SharedFrameRing(slots=8)
+        timeout, transport.producer_timeout = transport.producer_timeout, 0.5
+        try:
+            producer = multiprocessing.Process(target=dying_producer, args=(ring.name,))
+            producer.start()
+            begin = time.perf_counter()
+            try:
+                play_checksum(transport.ring_frames(ring))
+                raised = False
+            except RuntimeError:
+                raised = True
+            elapsed = time.perf_counter() - begin
+            producer.join()
+            return dict(ring.stats(), **{'detected after s': f"{elapsed:.2f}", 'raised': raised})
+        finally:
+            transport.producer_timeout = timeout
+            ring.close()
+            ring.unlink()
+    return timed
+
+# The compositor on stored frames of the pythagorean show, reporting the time
+# per frame for 1, 2 and 4 layers at block and full resolution; a single
+# normal layer must come through unchanged with blocks on, although the
+# show's larger squares have detail inside a block.
+
+@benchmark('composite-layers', check=True)
+def bench_composite_layers():
+    import numpy as np
+    from pbl import compositor
+    frames = output_frames('pythagorean')
+    modes = ('normal', 'max', 'add', 'multiply')
+    def layers(count):
+        return [compositor.Layer(frames, mode, 0.5, 'key' if index == count - 1 else None)
+                for index, mode in zip(range(count), modes)]
+    def timed():
+        report = {}
+        for blocks in (True, False):
+            for count in (1, 2, 4):
+                begin = time.perf_counter()
+                for frame in compositor.composite(layers(count), blocks=blocks):
+                    pass
+                key = f"{'block' if blocks else 'pixel'}x{count} us/frame"
+                report[key] = f"{(time.perf_counter() - begin) / len(frames) * 1e6:.0f}"
+        single = compositor.composite([compositor.Layer(frames)])
+        report['identical'] = all(np.array_equal(frame, out) for frame, out in zip(frames, single))
+        return report
+    return timed
+
+# Shows compiled from scores against their scripts, generating 3000 frames
+# at a tempo of 300 with a ring; the frames must be identical.
+
+def bench_score(name, argv):
+    import numpy as np
+    from pbl import cli
+    def generate(show_name):
+        show, args = cli.parse_show_args(show_name, ['-l', '3000', '-t', '300', '--seed', '1'] + argv)
+        cli.seed(args)
+        begin = time.perf_counter()
+        checksum = 0
+        for frame in cli.show_frames(show, args):
+            checksum = (checksum * 31 + int(frame.sum(dtype=np.uint64))) % (1 << 32)
+        return time.perf_counter() - begin, checksum
+    def timed():
+        script_time, script_checksum = generate(name)
+        score_time, score_checksum = generate(name + '_score')
+        return {'script ms': f"{script_time * 1e3:.0f}", 'score ms': f"{score_time * 1e3:.0f}",
+                'identical': score_checksum == script_checksum}
+    return timed
+
+@benchmark('score-pythagorean', check=True)
+def bench_score_pythagorean():
+    return bench_score('pythagorean', [])
+
+for part in (1, 2, 3):
+    benchmark(f'score-perfect-squares-part{part}', check=True)(
+        functools.partial(bench_score, f'perfect_squares_part{part}', []))
+
+# Soak tests over two hours of show time, reporting every ten minutes: the
+# pythagorean show in one pass, and the fibonacci show, which starts its
+# sequence again once the image runs out, in one pass with its end fade.
+# Memory must not grow, the speed must stay flat and keyframes must start
+# within a frame of their exact time.
+
+def bench_soak(name, argv):
+    from pbl import soak
+    def timed():
+        summary = soak.soak(name, argv, hours=2.0, report_minutes=10.0, verbose=False)
+        return {'frames/sec': f"{summary['fps']:.0f}",
+                'slowest/fastest': f"{summary['min fps'] / summary['max fps']:.2f}",
+                'RSS growth kB': summary['rss growth'] // 1024, 'drift': summary['drift'], 'passes': summary['passes'],
+                'drift within a frame': (summary['drift'] or 0) <= 1}
+    return timed
+
+@benchmark('soak-pythagorean', check=True)
+def bench_soak_pythagorean():
+    return bench_soak('pythagorean', ['-l', '216000', '--seed', '1'])
+
+@benchmark('soak-fibonacci', check=True)
+def bench_soak_fibonacci():
+    import tempfile
+    import numpy as np
+    import cv2 as cv
+    filename = os.path.join(tempfile.mkdtemp(), 'image.png')
+    cv.imwrite(filename, np.random.default_rng(1).integers(0, 256, (140, 580, 3), dtype=np.uint8))
+    return bench_soak('fibonacci', ['-i', filename, '-l', '216000'])
+
+# A checkpointed render interrupted halfway and resumed, against a plain
+# render of the same show.
+
+@benchmark('checkpoint-resume', check=True)
+def bench_checkpoint_resume():
+    import filecmp
+    import tempfile
+    from pbl import checkpoint, cli, video
+    directory = tempfile.mkdtemp()
+    argv = ['-l', '9000', '--seed', '1', '-t', '120']
+    cli.render('pythagorean', argv + [os.path.join(directory, 'plain')])
+
+    class Interrupt(Exception):
+        pass
+
+    def timed():
+        basename = os.path.join(directory, 'resumed')
+        encode = video.FrameEncoder.encode
+        count = itertools.count(1)
+        def interrupted(encoder, frame):
+            if next(count) == 5000:
+                raise Interrupt()
+            return encode(encoder, frame)
+        video.FrameEncoder.encode = interrupted
+        try:
+            checkpoint.render('pythagorean', argv + [basename], 1000, verbose=False)
+        except Interrupt:
+            pass
+        finally:
+            video.FrameEncoder.encode = encode
+        checkpoint_bytes = os.path.getsize(checkpoint.checkpoint_name(basename))
+        checkpoint.render('pythagorean', argv + [basename], 1000, verbose=False)
+        return {'checkpoint bytes': checkpoint_bytes,
+                'identical': filecmp.cmp(os.path.join(directory, 'plain.avi'), basename + '.avi', shallow=False)}
+    return timed
+
+#================================================================
+# Palettes for the fibonacci show from a synthetic 1080p video, decoded and
+# reduced to 57x13 block colors on the background thread.
+
+@benchmark('palette-video')
+def bench_palette_video():
+    import tempfile
+    import numpy as np
+    import cv2 as cv
+    from pbl import palettes
+    filename = os.path.join(tempfile.mkdtemp(), 'clip.avi')
+    count = 120
+    out = cv.VideoWriter(filename, cv.VideoWriter.fourcc(*'MJPG'), 30.0, (1920, 1080))
+    rng = np.random.default_rng(1)
+    for i in range(count):
+        out.write(cv.resize(rng.integers(0, 256, (54, 96, 3), dtype=np.uint8), (1920, 1080)))
+    out.release()
+    def timed():
+        source = palettes.PaletteSource(filename)
+        try:
+            for grid in itertools.islice(source, count):
+                pass
+        finally:
+            source.close()
+        return {'grids': count, 'grid shape': grid.shape}
+    return timed
+
+@benchmark('palette-block-colors')
+def bench_palette_block_colors():
+    import numpy as np
+    from pbl import palettes
+    image = np.random.default_rng(1).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    def timed():
+        for i in range(10):
+            palettes.block_colors(image)
+        return {'images': 10}
+    return timed
+
+#================================================================
+# The pythagorean show's triangles: the schedule of every triple that fits,
+# computed at once, and the keyframes of ten passes over it.
+
+@benchmark('pythagorean-triples')
+def bench_pythagorean_triples():
+    show = shows.load('pythagorean')
+    def timed():
+        slots, (a, b, c), scale = show.triangle_schedule()
+        keyframe_count = 10 * 4 * show.phase_keyframes * len(slots)
+        begin = time.perf_counter()
+        for interval in itertools.islice(show.keyframe_generator(False), keyframe_count):
+            pass
+        elapsed = time.perf_counter() - begin
+        return {'triples': len(slots), 'largest': f"{a[-1]}-{b[-1]}-{c[-1]}",
+                'keyframes/sec': f"{keyframe_count / elapsed:.0f}"}
+    return timed
+
+#================================================================
+# Integer sequences: membership of a million numbers in one pass for each
+# sequence, and the reveal of the primes rendered through its score.
+
+@benchmark('sequence-membership')
+def bench_sequence_membership():
+    import numpy as np
+    from pbl import sequences
+    numbers = np.arange(1, 1000001)
+    def timed():
+        report = {}
+        for name in ('primes', 'squares', 'triangular', 'fibonacci'):
+            begin = time.perf_counter()
+            members = sequences.membership(name, numbers)
+            report[f"{name} ms"] = f"{(time.perf_counter() - begin) * 1e3:.1f}"
+            report[name] = int(members.sum())
+        return report
+    return timed
+
+@benchmark('sequence-primes')
+def bench_sequence_primes():
+    from pbl import cli
+    def timed():
+        show, args = cli.parse_show_args('sequence', ['-s', 'primes'])
+        count = sum(1 for frame in cli.show_frames(show, args))
+        return {'frames': count}
+    return timed
+
+#================================================================
+# The bridge simulator: 600 frames of pi drawn as 1528x96 images of the
+# bridge, by themselves and written to a preview file with the show's frames
+# generated alongside.
+
+@benchmark('simulate-draw')
+def bench_simulate_draw():
+    import numpy as np
+    from pbl import cli, simulator
+    show, args = cli.parse_show_args('pi', ['-l', '600'])
+    frames = np.array([frame.copy() for frame in cli.show_frames(show, args)])
+    bridge = simulator.BridgeSimulator()
+    def timed():
+        begin = time.perf_counter()
+        for images in bridge.batches(frames):
+            pass
+        elapsed = time.perf_counter() - begin
+        return {'image': f"{bridge.width}x{bridge.height}", 'frames/sec': f"{len(frames) / elapsed:.0f}",
+                'real time': f"{len(frames) / elapsed / 30:.1f}x"}
+    return timed
+
+@benchmark('simulate-pi')
+def bench_simulate_pi():
+    import tempfile
+    from pbl import simulator
+    basename = os.path.join(tempfile.mkdtemp(), 'pi')
+    def timed():
+        begin = time.perf_counter()
+        count = simulator.simulate('pi', ['-l', '600'], basename, verbose=False)
+        elapsed = time.perf_counter() - begin
+        return {'frames/sec': f"{count / elapsed:.0f}", 'real time': f"{count / elapsed / 30:.1f}x",
+                'bytes/frame': os.path.getsize(basename + '_bridge.avi') // count}
+    return timed
+
+#================================================================
+# Beat tracking on a synthetic ten minute click track at 128 bpm, 44.1 kHz.
+
+@benchmark('beats-analysis')
+def bench_beats_analysis():
+    import tempfile
+    import wave
+    import numpy as np
+    from pbl import beats
+
+    sample_rate, seconds, tempo = 44100, 600, 128.0
+    filename = os.path.join(tempfile.mkdtemp(), 'clicks.wav')
+    rng = np.random.default_rng(1)
+    click = (0.8 * np.exp(-np.arange(2000) / 300) * np.sin(2 * np.pi * 1000 * np.arange(2000) / sample_rate))
+    with wave.open(filename, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(sample_rate)
+        for start in range(0, seconds, 60):
+            samples = 0.05 * rng.standard_normal(60 * sample_rate)
+            for time_stamp in np.arange(0.5, 60.0, 60.0 / tempo):
+                index = int(time_stamp * sample_rate)
+                samples[index:index + len(click)] += click[:len(samples) - index]
+            file.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+
+    def timed():
+        begin = time.perf_counter()
+        beat_times = beats.analyze(filename)
+        elapsed = time.perf_counter() - begin
+        return {'beats': len(beat_times), 'x real time': f"{seconds / elapsed:.0f}",
+                'tempo': f"{60.0 * (len(beat_times) - 1) / (beat_times[-1] - beat_times[0]):.1f}"}
+    return timed
+
+#================================================================
+# Main script follows.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = """Benchmark harness for the Pausch Bridge generators.""")
+    parser.add_argument( '-r', '--repeat', type=int, default=5, help='Number of timed repetitions per benchmark.')
+    parser.add_argument( '--list', action='store_true', help='List the available benchmarks and exit.')
+    parser.add_argument( '--checks', action='store_true', help='Run the benchmarks that check results.')
+    parser.add_argument( 'names', nargs='*', help='Benchmarks to run (default: all).')
+
+    args = parser.parse_args()
+    if args.list:
+        print("\n".join(f"{name} (check)" if name in checks else name for name in benchmarks))
+    else:
+        names = args.names or [name for name in benchmarks if name in checks or not args.checks]
+        for name in names:
+            if name not in benchmarks:
+                parser.error(f"unknown benchmark {name}")
+        failures = [name for name in names if run_benchmark(name, args.repeat)]
+        if failures:
+            print(f"FAILED: {', '.join(failures)}")
+            sys.exit(1)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# composite.py: several shows layered into one with blend modes and masks.
+
+# Each -L option adds a layer over the ones before it, as a blend, then the
+# show name and its options as they would be given to 'render':
+#
+#   python3 -m pbl render composite -L "normal pi" -L "max:1:key primes -t 60"
+#   python3 -m pbl render composite -L "normal color_bars -t 10" -L "normal:0.8:key fibonacci"
+#
+# The blend is MODE[:ALPHA[:MASK]], where MODE is normal, add, multiply or
+# max, ALPHA is the layer's opacity from 0 to 1, and MASK is 'key' to show
+# the layer only where it is not black, or a grayscale image file the size of
+# a frame.  Every layer is generated for the composite's --length unless its
+# own options say otherwise.  See pbl/compositor.py.
+
+#================================================================
+# Import standard Python modules.
+import itertools
+import shlex
+
+# Import the OpenCV module.
+import cv2 as cv
+
+from pbl import cli
+from pbl.compositor import Layer, composite, blend_modes
+
+#================================================================
+# Build a layer from its description.
+
+def layer(description, length):
+    blend, *show_argv = shlex.split(description)
+    mode, alpha, mask = (blend.split(':', 2) + ['1', ''][blend.count(':'):])
+    if mode not in blend_modes:
+        raise ValueError(f"unknown blend mode {mode} in layer '{description}'")
+    if not mask:
+        mask = None
+    elif mask != 'key':
+        image = cv.imread(mask, cv.IMREAD_GRAYSCALE)
+        if image is None:
+            raise ValueError(f"cannot read mask {mask}")
+        mask = image / 255.0
+    show, args = cli.parse_show_args(show_argv[0], ['--length', str(length)] + show_argv[1:])
+    return Layer(cli.show_frames(show, args), mode, float(alpha), mask)
+
+#================================================================
+# Show interface for the pbl command line (python3 -m pbl render composite).
+
+def add_arguments(parser):
+    parser.add_argument( '-L', '--layer', action='append', required=True,
+                         help='Blend and show of a layer, e.g. "max:0.5:key primes -t 60"; repeat for each layer, bottom first.')
+    parser.add_argument( '--pixels', action='store_true', help='Always combine the layers at full resolution, not only the batches with detail inside a block.')
+    parser.add_argument( '--batch', type=int, default=64, help='Frames of each layer combined at once.')
+
+def frames(args):
+    layers = [layer(description, args.length) for description in args.layer]
+    return itertools.islice(composite(layers, args.batch, not args.pixels), args.length)
@@ -11,23 +11,16 @@
 
 #================================================================
 # Import standard Python modules.
-import argparse
+import itertools
 
 # Import the numpy and OpenCV modules.
 import numpy as np
 import cv2 as cv
 
-#================================================================
-# Define the video properties using the canonical video format for the Pausch
-# Bridge lighting system.
-frame_rate   = 30
-frame_width  = 228
-frame_height = 8
-
-# Specify a format code and file format.  The exact combinations of codec and
-# file formats available are different for each platform.
-codec_code = cv.VideoWriter.fourcc(*'png ') # PNG images, lossless, clean block edges
-file_extension = 'avi'
+# Import the canonical video format for the Pausch Bridge lighting system.
+from pbl.video import frame_width, frame_height, frame_ring
+from pbl.keyframes import crossfade
+from pbl import beats
 
 #================================================================
 # Define a set of colors as (B,G,R) triples of unsigned 8-bit integers.
@@ -43,15 +36,7 @@ colors = ((0,0,0),       # black
 #================================================================
 # Generate successive frames of the video sequence.
 
-def frame_generator(verbose, tempo):
-    count = 0             # count of generated frames
-    frame_time = 0.0      # time stamp for generated frame in seconds
-    keyframe_phase = 0.0  # unit phase for the cross-fade, cycles over 0 to 1
-
-    frame_interval = 1.0 / frame_rate                       # seconds between video frames
-    keyframe_interval = 60.0 / tempo                        # seconds between key frames
-    keyframe_rate = 1.0 / (frame_rate * keyframe_interval)  # phase / frame
-
+def keyframe_generator(verbose):
     # Generate a set of color bars aligned with 4x8 pixel blocks.
     small = np.array(colors,dtype=np.uint8).reshape((1,len(colors),3))
     bars = cv.resize(small, None, fx=4, fy=8, interpolation=cv.INTER_NEAREST)
@@ -71,55 +56,32 @@ def frame_generator(verbose, tempo):
     # cv.imwrite("color_bars_frame1.png", frame1)
     
     while True:
-        # Cross-fade between successive key frames at the given tempo.  This will
-        # return a new frame of integer pixels.
-        frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0)
+        # Cross-fade between the current key frames for one keyframe interval.
+        yield frame0, frame1
 
-        # Advance the cross-fade phase.
-        keyframe_phase += keyframe_rate
+        # Once the second keyframe is reached, generate the successor.
+        frame0 = frame1
+        frame1 = large[0:frame_height, next_offset:frame_width+next_offset, :]
+        next_offset = (next_offset + 4) % bars_width
 
-        # Once the second keyframe is reached, generate the successor and reset the fade.
-        if keyframe_phase >= 1.0:
-            keyframe_phase -= 1.0
-            frame0 = frame1
-            frame1 = large[0:frame_height, next_offset:frame_width+next_offset, :]
-            next_offset = (next_offset + 4) % bars_width
-        
-        # Return the frame and advance the generator state.
-        yield frame
-        count += 1
-        frame_time += frame_interval
+def frame_generator(verbose, tempo, beat_times=None, ring=None):
+    keyframe_interval = beats.keyframe_interval(60.0, tempo, beat_times)  # seconds between key frames
+    return crossfade(keyframe_generator(verbose), keyframe_interval, ring)
 
 #================================================================
-# Write a video file in the default format.
-
-def write_video_file(basename, length, verbose, *args):
-
-    # Open the writer with a path, format, frame rate, and size.
-    filename = basename + '.' + file_extension
-    out = cv.VideoWriter(filename, codec_code, frame_rate, (frame_width, frame_height))
+# Show interface for the pbl command line (python3 -m pbl render color_bars).
 
-    if verbose:
-        print(f"Open file {filename} for output.")
-
-    # Set up the frame generator.
-    frame_sequence = frame_generator(verbose, *args)
-
-    # Synthesize some frames and write them to the stream.
-    for count in range(length):
-        out.write(next(frame_sequence))
-
-    # Release everything when done.
-    out.release()
-
-#================================================================
-# Main script follows.
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description = """Color bar video generator for the Pausch Bridge.""")
-    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
-    parser.add_argument( '-l', '--length', type=int, default=480, help='Number of frames to generate (at 30 fps)')
+def add_arguments(parser):
     parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
-    parser.add_argument( 'basename', default='color_bars', nargs='?', help='Base name of output file (not including .mp4 extension).')
-
-    args = parser.parse_args()
-    write_video_file(args.basename, args.length, args.verbose, args.tempo)
\ No newline at end of file
+    parser.add_argument( '-b', '--beats', type=beats.load, help='WAV file, or text file of beat times in seconds, to time the key frames by instead of the tempo.')
+
+def keyframes(args):
+    # The tempo-independent keyframes and their interval, for parameter sweeps.
+    return keyframe_generator(args.verbose), beats.keyframe_interval(60.0, args.tempo, args.beats)
+
+def frames(args, frame_sequence=None):
+    # Synthesize the requested number of frames, or fewer if the show ends first.
+    ring = frame_ring(args)
+    if frame_sequence is None:
+        frame_sequence = frame_generator(args.verbose, args.tempo, args.beats, ring)
+    return itertools.islice(frame_sequence, args.length)
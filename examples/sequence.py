@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# sequence.py: the members of an integer sequence revealed along the bridge.
+
+# Block i shows the number --start + i; the blocks appear one keyframe at a
+# time, members of the sequence in their own color and held a little longer:
+#
+#   python3 -m pbl render sequence -s primes
+#   python3 -m pbl render sequence -s triangular --start 0 -t 60
+#   python3 -m pbl render sequence -s b000045.txt      # an OEIS b-file
+#
+# See pbl/sequences.py for the sequences, and for a show of one sequence in a
+# few lines.
+
+from pbl.sequences import SequenceShow
+
+#================================================================
+# Show interface for the pbl command line (python3 -m pbl render sequence).
+
+show = SequenceShow()
+add_arguments, keyframes, frames = show.add_arguments, show.keyframes, show.frames
@@ -0,0 +1,5 @@
+# pbl: shared tooling for Pausch Bridge lighting shows.
+#
+# The shows themselves live in their own folders and register with pbl.shows;
+# pbl.video holds the canonical video format and the file writer, and pbl.cli
+# is the command line entry point (python3 -m pbl).
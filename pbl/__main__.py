@@ -0,0 +1,3 @@
+from pbl.cli import main
+
+main()
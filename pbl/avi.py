@@ -0,0 +1,104 @@
+# avi.py: minimal AVI file writer for already encoded video frames.
+
+# OpenCV's VideoWriter encodes every frame it is given, so it cannot reuse the
+# payload of a repeated frame.  This writer takes each frame as its encoded
+# bytes (e.g. a PNG image from cv.imencode) and stores it in a plain AVI 1.0
+# container with a single video stream and an idx1 index, which OpenCV, ffmpeg
+# and the usual players read like the files VideoWriter produces.  AVI 1.0
+# offsets are 32 bits, which limits a file to 4 GB.
+
+#================================================================
+# Import standard Python modules.
+import struct
+from fractions import Fraction
+
+#================================================================
+# RIFF chunk flags.
+AVIF_HASINDEX  = 0x10
+AVIIF_KEYFRAME = 0x10
+
+class AviWriter:
+    def __init__(self, filename, width, height, frame_rate, fourcc=b'png '):
+        # The frame rate may be a Fraction, e.g. 30000/1001, which the stream
+        # header stores as rate / scale.
+        self.file = open(filename, 'wb')
+        self.width = width
+        self.height = height
+        self.frame_rate = Fraction(frame_rate).limit_denominator(1 << 16)
+        self.fourcc = fourcc
+        self.index = []         # (offset, size) of each frame within the movi list
+        self.max_size = 0
+
+        # The headers are written with placeholder counts and rewritten by close().
+        self.write_headers()
+        self.file.write(b'LIST\0\0\0\0movi')
+        self.movi_start = self.file.tell() - 4
+
+    def write_headers(self):
+        self.file.seek(0)
+        frames = len(self.index)
+        avih = struct.pack('<14I', round(1e6 / self.frame_rate), 0, 0, AVIF_HASINDEX, frames, 0, 1,
+                           self.max_size, self.width, self.height, 0, 0, 0, 0)
+        strh = struct.pack('<4s4sI2H8I4h', b'vids', self.fourcc, 0, 0, 0, 0, self.frame_rate.denominator,
+                           self.frame_rate.numerator, 0, frames, self.max_size, 0xffffffff, 0, 0, 0,
+                           self.width, self.height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, self.width, self.height, 1, 24, self.fourcc,
+                           self.width * self.height * 3, 0, 0, 0, 0)
+        strl = b'strl' + chunk(b'strh', strh) + chunk(b'strf', strf)
+        hdrl = b'hdrl' + chunk(b'avih', avih) + chunk(b'LIST', strl)
+        self.file.write(b'RIFF\0\0\0\0AVI ' + chunk(b'LIST', hdrl))
+
+    def write(self, payload):
+        # Append one encoded frame.
+        self.index.append((self.file.tell() - self.movi_start, len(payload)))
+        self.max_size = max(self.max_size, len(payload))
+        self.file.write(chunk(b'00dc', payload))
+
+    def close(self):
+        movi_end = self.file.tell()
+        index = b''.join(struct.pack('<4sIII', b'00dc', AVIIF_KEYFRAME, offset, size) for offset, size in self.index)
+        self.file.write(chunk(b'idx1', index))
+        riff_end = self.file.tell()
+
+        self.write_headers()
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', riff_end - 8))
+        self.file.seek(self.movi_start - 4)
+        self.file.write(struct.pack('<I', movi_end - self.movi_start))
+        self.file.close()
+
+def read_payloads(filename):
+    # The encoded frames of a file written by AviWriter, in order.
+    with open(filename, 'rb') as file:
+        data = file.read()
+    position = 12
+    movi_start = index = None
+    while position < len(data):
+        fourcc, size = struct.unpack('<4sI', data[position:position + 8])
+        if fourcc == b'LIST' and data[position + 8:position + 12] == b'movi':
+            movi_start = position + 8
+        elif fourcc == b'idx1':
+            index = data[position + 8:position + 8 + size]
+        position += 8 + size + size % 2
+    if movi_start is None or index is None:
+        raise ValueError(f"{filename} has no indexed frames")
+    for fourcc, flags, offset, size in struct.iter_unpack('<4sIII', index):
+        yield data[movi_start + offset + 8:movi_start + offset + 8 + size]
+
+def join(filename, part_filenames, width, height, rate, codec):
+    # Copy the encoded frames of files written by AviWriter into one file, in
+    # order and without decoding them, and return the number of frames.
+    out = AviWriter(filename, width, height, rate, codec)
+    count = 0
+    try:
+        for part in part_filenames:
+            for payload in read_payloads(part):
+                out.write(payload)
+                count += 1
+    finally:
+        out.close()
+    return count
+
+def chunk(fourcc, data):
+    # A RIFF chunk, padded to an even length.
+    return fourcc + struct.pack('<I', len(data)) + data + (b'\0' if len(data) % 2 else b'')
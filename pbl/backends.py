@@ -0,0 +1,181 @@
+# backends.py: output backends for rendered frames.
+
+# A backend stores the frames of a render somewhere.  'render --backend NAME'
+# selects one:
+#
+#   png-avi     PNG images in an AVI file (the default), the format the bridge
+#               plays; repeated frames reuse their encoded image.
+#   ffv1        lossless FFV1 video in a Matroska file, through OpenCV's
+#               VideoWriter, if OpenCV was built with FFmpeg.
+#   npy         the raw frames as one (frames, 8, 228, 3) uint8 array in a
+#               .npy file, to be opened with np.load(..., mmap_mode='r').
+#   png-dir     one PNG file per frame in a directory, encoded and written by
+#               a pool of threads.
+#   null        frames are counted and dropped, to time a show by itself.
+#
+# Every backend has write(frame) and close(), write_batch(frames) for the
+# background writer in pbl/video.py, and counts its frames.  A frame is only
+# valid during the call that is given it (see video.FrameRing), so a backend
+# that keeps a frame copies it.  bench.py reports frames/sec and bytes/frame
+# for each backend ('python3 bench.py --list').
+
+#================================================================
+# Import standard Python modules.
+import collections
+import concurrent.futures
+import os
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+from pbl.avi import AviWriter
+from pbl.video import frame_width, frame_height, frame_rate, codec_code, file_extension, png_parameters, FrameEncoder
+
+#================================================================
+class Backend:
+    def __init__(self, filename):
+        self.filename = filename
+        self.frames = 0
+
+    def write_batch(self, frames, executor=None, threads=1):
+        # Write an array of frames; the executor is for backends that can
+        # encode a batch on several threads.
+        for frame in frames:
+            self.write(frame)
+
+    def report(self):
+        return f"{self.frames} frames"
+
+#================================================================
+# PNG images in an AVI file.
+
+class PngAvi(Backend):
+    def __init__(self, basename, rate=frame_rate):
+        super().__init__(basename + '.' + file_extension)
+        self.out = AviWriter(self.filename, frame_width, frame_height, rate, codec_code)
+        self.encoder = FrameEncoder()
+
+    def write(self, frame):
+        self.out.write(self.encoder.encode(frame))
+        self.frames += 1
+
+    def write_batch(self, frames, executor=None, threads=1):
+        for payload in self.encoder.encode_batch(frames, executor, threads):
+            self.out.write(payload)
+        self.frames += len(frames)
+
+    def close(self):
+        self.out.close()
+
+    def report(self):
+        return self.encoder.report()
+
+#================================================================
+# Lossless FFV1 video.
+
+class Ffv1(Backend):
+    def __init__(self, basename, rate=frame_rate):
+        super().__init__(basename + '.mkv')
+        self.out = cv.VideoWriter(self.filename, cv.VideoWriter.fourcc(*'FFV1'), float(rate), (frame_width, frame_height))
+        if not self.out.isOpened():
+            raise ValueError("the ffv1 backend needs OpenCV built with FFmpeg")
+
+    def write(self, frame):
+        self.out.write(np.ascontiguousarray(frame))
+        self.frames += 1
+
+    def close(self):
+        self.out.release()
+
+#================================================================
+# Raw frames in a .npy file.  The frames are appended after room for the
+# header, which is written when the number of frames is known.
+
+npy_header_size = 128
+
+def npy_header(shape):
+    # A version 1.0 .npy header for a uint8 array, padded to npy_header_size.
+    text = repr({'descr': '|u1', 'fortran_order': False, 'shape': shape})
+    size = npy_header_size - 10
+    return b'\x93NUMPY\x01\x00' + size.to_bytes(2, 'little') + text.ljust(size - 1).encode('latin1') + b'\n'
+
+class NpyDump(Backend):
+    def __init__(self, basename, rate=frame_rate):
+        super().__init__(basename + '.npy')
+        self.file = open(self.filename, 'wb')
+        self.file.write(bytes(npy_header_size))
+
+    def write(self, frame):
+        self.file.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+
+    def write_batch(self, frames, executor=None, threads=1):
+        self.file.write(np.ascontiguousarray(frames).data)
+        self.frames += len(frames)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(npy_header((self.frames, frame_height, frame_width, 3)))
+        self.file.close()
+
+#================================================================
+# A directory of PNG files.  The frames are copied and handed to a thread
+# pool; OpenCV releases the GIL while it encodes.  At most a few frames per
+# thread are waiting at once, so memory stays bounded.
+
+def write_png(filename, frame):
+    if not cv.imwrite(filename, frame, png_parameters):
+        raise ValueError(f"cannot write {filename}")
+
+class PngDirectory(Backend):
+    def __init__(self, basename, rate=frame_rate, threads=None):
+        super().__init__(basename + '_frames')
+        os.makedirs(self.filename, exist_ok=True)
+        threads = threads or os.cpu_count() or 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.pending = collections.deque()
+        self.max_pending = 4 * threads
+
+    def write(self, frame):
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        filename = os.path.join(self.filename, f"{self.frames:06d}.png")
+        self.pending.append(self.executor.submit(write_png, filename, frame.copy()))
+        self.frames += 1
+
+    def close(self):
+        # Wait for every frame, raising the first error.
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            self.executor.shutdown()
+
+#================================================================
+class NullBackend(Backend):
+    def __init__(self, basename, rate=frame_rate):
+        super().__init__(os.devnull)
+
+    def write(self, frame):
+        self.frames += 1
+
+    def write_batch(self, frames, executor=None, threads=1):
+        self.frames += len(frames)
+
+    def close(self):
+        pass
+
+#================================================================
+backends = {
+    'png-avi': PngAvi,
+    'ffv1':    Ffv1,
+    'npy':     NpyDump,
+    'png-dir': PngDirectory,
+    'null':    NullBackend,
+}
+
+def open_backend(name, basename, rate=frame_rate):
+    if name not in backends:
+        raise ValueError(f"unknown backend {name}")
+    return backends[name](basename, rate)
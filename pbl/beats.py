@@ -0,0 +1,224 @@
+# beats.py: beat tracking from audio files, for keyframe timing that follows music.
+
+# A WAV file is read in chunks and reduced to an onset strength envelope: the
+# spectral flux of a short-time Fourier transform, i.e. the summed increase in
+# log magnitude between successive spectra.  The tempo is estimated from the
+# autocorrelation of the envelope, and the beats are placed by dynamic
+# programming: each beat is an onset peak roughly one beat period after the
+# previous one (D. P. W. Ellis, "Beat Tracking by Dynamic Programming", 2007).
+#
+# Only the envelope is kept for the whole file, a few hundred values per
+# second of audio, so memory stays bounded for hour-long recordings and the
+# analysis runs many times faster than real time.
+#
+#   python3 -m pbl.beats song.wav              # report tempo and beat count
+#   python3 -m pbl.beats song.wav -o beats.txt # save the beat times
+#
+# Shows take the beats with --beats FILE, either a WAV file or a text file of
+# beat times in seconds, one per line, and then end each keyframe interval on
+# a beat instead of at a constant tempo.
+
+#================================================================
+# Import standard Python modules.
+import argparse
+import functools
+import time
+import wave
+
+# Import the numpy module.
+import numpy as np
+
+#================================================================
+# Analysis parameters, in samples at the file's own sample rate.
+fft_size = 2048
+hop_size = 512
+chunk_size = 1 << 18       # samples per chunk read from the file
+max_frequency = 8000.0     # upper limit of the bands used for onsets, in Hz
+min_tempo = 60.0           # range of tempos considered, in beats per minute
+max_tempo = 200.0
+tempo_prior = 120.0        # center of the tempo preference, in beats per minute
+tightness = 100.0          # penalty on beat spacing away from the period
+
+#================================================================
+# Reading audio.
+
+def read_chunks(filename, size=chunk_size):
+    # Yields the sample rate, then successive mono float32 chunks in [-1, 1].
+    with wave.open(filename, 'rb') as file:
+        channels = file.getnchannels()
+        width = file.getsampwidth()
+        yield file.getframerate()
+
+        while True:
+            data = file.readframes(size)
+            if not data:
+                return
+            if width == 1:
+                samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+            elif width == 2:
+                samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+            elif width == 3:
+                raw = np.frombuffer(data, dtype=np.uint8).reshape((-1, 3))
+                padded = np.zeros((len(raw), 4), dtype=np.uint8)
+                padded[:, 1:] = raw
+                samples = padded.view('<i4').ravel().astype(np.float32) / 2147483648.0
+            elif width == 4:
+                samples = np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648.0
+            else:
+                raise ValueError(f"unsupported sample width {width} in {filename}")
+            yield samples.reshape((-1, channels)).mean(axis=1)
+
+#================================================================
+# Onset strength.
+
+def onset_envelope(chunks, sample_rate):
+    # Spectral flux of the chunks at sample_rate / hop_size values per second.
+    window = np.hanning(fft_size).astype(np.float32)
+    bands = int(max_frequency * fft_size / sample_rate) + 1
+    carry = np.zeros(fft_size - hop_size, dtype=np.float32)
+    previous = None
+    envelope = []
+
+    for chunk in chunks:
+        buffer = np.concatenate((carry, chunk))
+        count = (len(buffer) - fft_size) // hop_size + 1
+        if count <= 0:
+            carry = buffer
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, fft_size)[::hop_size][:count]
+        spectrum = np.log1p(1000.0 * np.abs(np.fft.rfft(windows * window, axis=1)[:, :bands]))
+        if previous is None:
+            previous = spectrum[:1]
+        flux = np.diff(np.concatenate((previous, spectrum)), axis=0)
+        envelope.append(np.maximum(flux, 0.0).sum(axis=1))
+        previous = spectrum[-1:]
+        carry = buffer[count * hop_size:]
+
+    if not envelope:
+        return np.zeros(0)
+    envelope = np.concatenate(envelope).astype(np.float64)
+
+    # Remove the slowly varying level and normalize.  The first windows are
+    # padded with silence and see the audio switch on, which is not an onset.
+    level = np.convolve(envelope, np.ones(16) / 16, mode='same')
+    envelope = np.maximum(envelope - level, 0.0)
+    envelope[:fft_size // hop_size] = 0.0
+    scale = envelope.std()
+    return envelope / scale if scale > 0 else envelope
+
+#================================================================
+# Tempo and beats.
+
+def estimate_period(envelope, rate):
+    # The beat period in envelope samples, from the envelope autocorrelation
+    # weighted towards tempo_prior on a log scale.
+    size = 1 << int(np.ceil(np.log2(2 * len(envelope))))
+    spectrum = np.fft.rfft(envelope, size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(envelope)]
+
+    lags = np.arange(max(1, int(rate * 60.0 / max_tempo)), int(rate * 60.0 / min_tempo) + 1)
+    lags = lags[lags < len(envelope)]
+    if len(lags) == 0:
+        raise ValueError("audio too short to estimate a tempo")
+    weight = np.exp(-0.5 * np.log2(lags / (rate * 60.0 / tempo_prior)) ** 2)
+    lag = lags[np.argmax(autocorrelation[lags] * weight)]
+
+    # Refine to a fraction of a sample with a parabola through the peak.
+    before, peak, after = autocorrelation[lag - 1:lag + 2]
+    curvature = before - 2 * peak + after
+    return float(lag + (0.5 * (before - after) / curvature if curvature < 0 else 0.0))
+
+def track(envelope, rate, period=None):
+    # Beat times in seconds, placed by dynamic programming on the envelope.
+    if period is None:
+        period = estimate_period(envelope, rate)
+
+    # The predecessor of a beat lies between half and twice the period before it.
+    offsets = np.arange(int(round(2 * period)), int(round(period / 2)) - 1, -1)
+    penalty = -tightness * np.log(offsets / period) ** 2
+
+    score = envelope.copy()
+    previous = np.full(len(envelope), -1, dtype=np.intp)
+    for t in range(int(round(period / 2)), len(envelope)):
+        candidates = t - offsets
+        valid = candidates >= 0
+        values = score[candidates[valid]] + penalty[valid]
+        best = np.argmax(values)
+        if values[best] > 0:
+            score[t] += values[best]
+            previous[t] = candidates[valid][best]
+
+    # Backtrack from the best scoring beat in the last period.
+    tail = max(0, len(envelope) - int(round(period)))
+    t = tail + int(np.argmax(score[tail:]))
+    beats = []
+    while t >= 0:
+        beats.append(t)
+        t = previous[t]
+    beats = np.array(beats[::-1], dtype=np.intp)
+
+    # Drop the weak beats the chain runs through before the music starts and
+    # after it ends.
+    strong = np.nonzero(envelope[beats] >= 0.5 * np.median(envelope[beats]))[0]
+    if len(strong):
+        beats = beats[strong[0]:strong[-1] + 1]
+    return beats / rate
+
+def analyze(filename, verbose=False):
+    # Beat times in seconds of a WAV file.
+    start = time.perf_counter()
+    chunks = read_chunks(filename)
+    sample_rate = next(chunks)
+    envelope = onset_envelope(chunks, sample_rate)
+    rate = sample_rate / hop_size
+    period = estimate_period(envelope, rate)
+    beats = track(envelope, rate, period)
+    if verbose:
+        duration = len(envelope) / rate
+        elapsed = time.perf_counter() - start
+        print(f"{filename}: {duration:.1f} s of audio, {len(beats)} beats, tempo {60.0 * rate / period:.1f} bpm, "
+              f"analyzed in {elapsed:.2f} s ({duration / elapsed:.0f}x real time)")
+    return beats
+
+@functools.lru_cache(maxsize=None)
+def load(filename):
+    # Beat times in seconds from a WAV file or a text file of times.
+    if filename.lower().endswith('.wav'):
+        return analyze(filename)
+    return np.loadtxt(filename, dtype=np.float64, ndmin=1)
+
+#================================================================
+# Keyframe timing.
+
+def keyframe_intervals(beat_times, beats_per_keyframe):
+    # Lengths in seconds of successive keyframe intervals: the first ends on
+    # the first beat, and each later one spans beats_per_keyframe beats,
+    # interpolating between beats for fractional counts.
+    beat_times = np.asarray(beat_times, dtype=np.float64)
+    if len(beat_times) < 2:
+        raise ValueError("at least two beats are needed for keyframe timing")
+    positions = np.arange(0.0, len(beat_times) - 1 + 1e-9, beats_per_keyframe)
+    ends = np.interp(positions, np.arange(len(beat_times)), beat_times)
+    ends = ends[ends > 0]
+    return np.diff(ends, prepend=0.0)
+
+def keyframe_interval(keyframe_beats, tempo, beat_times=None):
+    # Seconds between keyframes for a show whose keyframes are keyframe_beats
+    # / tempo seconds apart at a tempo in beats per minute, i.e. keyframe_beats
+    # / 60 beats apart: a constant, or a sequence of interval lengths following
+    # the given beat times.
+    if beat_times is None:
+        return keyframe_beats / tempo
+    return keyframe_intervals(beat_times, keyframe_beats / 60.0)
+
+#================================================================
+# Main script follows.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = """Find the beats of a WAV file.""")
+    parser.add_argument( '-o', '--output', help='Text file for the beat times in seconds.')
+    parser.add_argument( 'input', help='WAV file to analyze.')
+    args = parser.parse_args()
+
+    beats = analyze(args.input, verbose=True)
+    if args.output is not None:
+        np.savetxt(args.output, beats, fmt='%.4f')
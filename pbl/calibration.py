@@ -0,0 +1,47 @@
+# calibration.py: color calibration of the output for the bridge's LEDs.
+
+# The LEDs are not perceptually linear and their channels differ in
+# brightness, so the output stage can pass every frame through a 256-entry
+# lookup table per channel, applied with cv.LUT as the frame is handed to
+# the video writer or the live sender.  The table combines a gamma curve, a
+# white balance gain and a maximum brightness:
+#
+#   out = round(255 * max_brightness * gain * (in / 255) ** gamma)
+#
+# clipped to 0..255.  A calibration file is JSON, with colors in RGB order,
+# e.g.
+#
+#   {"gamma": [2.2, 2.0, 2.4], "white": [1.0, 0.85, 0.7], "max_brightness": 0.8}
+#
+# where each entry is optional and gamma may be a single number.  The shows
+# keep producing uncalibrated colors; rendering or playing with
+# --calibration FILE applies the table.
+
+#================================================================
+# Import standard Python modules.
+import json
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+#================================================================
+class Calibration:
+    def __init__(self, gamma=1.0, white=(1.0, 1.0, 1.0), max_brightness=1.0):
+        # gamma and white are a number or per-channel RGB values.
+        gamma = np.broadcast_to(np.asarray(gamma, dtype=np.float64), (3,))[::-1]
+        white = np.broadcast_to(np.asarray(white, dtype=np.float64), (3,))[::-1]
+        levels = np.linspace(0.0, 1.0, 256)[:, np.newaxis]
+        table = np.rint(255.0 * max_brightness * white * levels ** gamma)
+        self.lut = np.clip(table, 0, 255).astype(np.uint8).reshape((1, 256, 3))   # BGR, as the frames
+
+    def apply(self, frame, out=None):
+        # The calibrated frame, written into out if given.
+        return cv.LUT(frame, self.lut, dst=out)
+
+def load(filename):
+    # A Calibration from a JSON file, e.g. as an argparse type.
+    with open(filename, 'r') as file:
+        settings = json.load(file)
+    return Calibration(settings.get('gamma', 1.0), settings.get('white', (1.0, 1.0, 1.0)),
+                       settings.get('max_brightness', 1.0))
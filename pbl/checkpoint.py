@@ -0,0 +1,184 @@
+# checkpoint.py: long renders that can resume after an interruption.
+
+# A checkpointed render writes its video in parts, and after every part a
+# small checkpoint file with the state of the show, so that a render killed
+# halfway (out of memory, a reboot) continues from its last checkpoint when
+# the same command is run again:
+#
+#   python3 -m pbl render --checkpoint 9000 pythagorean -l 2592000
+#
+# writes pythagorean.part0.avi, pythagorean.part1.avi, ... and
+# pythagorean.checkpoint.npz every 9000 frames, and at the end joins the
+# parts into pythagorean.avi, byte for byte the file of a plain render, and
+# removes the rest.  A part that was being written when the render stopped is
+# written again.
+#
+# The checkpoint holds the frames written, the parts, the state of the random
+# module when the show started, and the kind of the render with the state of
+# the show; a checkpoint of another kind than the render resuming it is
+# refused:
+#
+#   crossfade   a show built from keyframes: the cross-fade's state (see
+#               keyframes.CrossfadeState), with the current keyframes, phase
+#               and interval index.  On resuming, the keyframe generator is
+#               run again from the saved random state up to that interval,
+#               which is cheap next to rendering the frames, and its keyframes
+#               are checked against the saved ones.
+#   timeline    the same with --frame-rate, which samples the keyframes from
+#               any frame on.
+#   range       a show with frame_range(), such as pi, which starts anywhere.
+#   replay      other shows, which are run from the start again, discarding
+#               the frames already written.
+#
+# Checkpoints are only taken within the show's --length, not during a closing
+# transition after it.
+
+#================================================================
+# Import standard Python modules.
+import argparse
+import itertools
+import json
+import os
+import random
+
+# Import the numpy module.
+import numpy as np
+
+from pbl import avi, cli, keyframes, video
+
+#================================================================
+# Checkpoint files: the arrays of the cross-fade state and a JSON header.
+
+def checkpoint_name(basename):
+    return basename + '.checkpoint.npz'
+
+def part_name(basename, index):
+    return f"{basename}.part{index}.{video.file_extension}"
+
+def save(filename, header, arrays):
+    # Write to a temporary file and rename it, so that an interruption never
+    # leaves a broken checkpoint.
+    temporary = filename + '.tmp.npz'
+    np.savez_compressed(temporary, header=np.frombuffer(json.dumps(header).encode(), dtype=np.uint8), **arrays)
+    os.replace(temporary, filename)
+
+def load(filename):
+    with np.load(filename) as data:
+        header = json.loads(data['header'].tobytes().decode())
+        arrays = {key: data[key] for key in data.files if key != 'header'}
+    return header, arrays
+
+def random_state(state):
+    # The state of the random module from its JSON form.
+    version, internal, gauss_next = state
+    return version, tuple(internal), gauss_next
+
+#================================================================
+# The frames of a show from a given frame on, and a function returning the
+# state to save after each frame.
+
+def tail_args(args, start):
+    # The options of the show for the frames from start on.
+    tail = argparse.Namespace(**vars(args))
+    tail.length = args.length - start
+    return tail
+
+def resume_kind(show, args):
+    # How a render of the show resumes, one of the kinds above.
+    if hasattr(show, 'keyframes'):
+        return 'crossfade' if args.frame_rate is None else 'timeline'
+    return 'range' if hasattr(show, 'frame_range') else 'replay'
+
+def resumable_frames(show, args, header, arrays):
+    start = header['frames']
+    kind = resume_kind(show, args)
+    if start > 0 and header['kind'] != kind:
+        raise ValueError(f"the checkpoint is of a {header['kind']} render, which cannot resume as {kind}")
+    if kind == 'crossfade':
+        keyframe_sequence, keyframe_interval = show.keyframes(args)
+        state = keyframes.CrossfadeState()
+        if start > 0:
+            saved = header['crossfade']
+            for interval in itertools.islice(keyframe_sequence, saved['k'] + 1):
+                pass
+            interval = keyframes.Interval(*interval)
+            if not (np.array_equal(interval.frame0, arrays['frame0']) and np.array_equal(interval.frame1, arrays['frame1'])):
+                raise ValueError("the show's keyframes do not match the checkpoint")
+            state = keyframes.CrossfadeState(interval, saved['k'], saved['phase'], saved['rate'])
+        frame_sequence = keyframes.crossfade(keyframe_sequence, keyframe_interval, video.frame_ring(args), state)
+
+        def snapshot():
+            frame0, frame1, seconds, overlay = state.interval
+            crossfade = {'k': state.k, 'phase': state.phase, 'rate': state.rate}
+            return {'crossfade': crossfade}, {'frame0': frame0, 'frame1': frame1}
+        return show.frames(tail_args(args, start), frame_sequence), snapshot
+
+    if kind == 'timeline':
+        keyframe_sequence, keyframe_interval = show.keyframes(args)
+        frame_sequence = keyframes.timeline_frames(keyframe_sequence, keyframe_interval, args.frame_rate,
+                                                   args.length + 1 - start, video.frame_ring(args), start)
+        return show.frames(tail_args(args, start), frame_sequence), lambda: ({}, {})
+
+    if kind == 'range':
+        return show.frame_range(args, start, None), lambda: ({}, {})
+
+    return itertools.islice(cli.show_frames(show, args), start, None), lambda: ({}, {})
+
+#================================================================
+# Render a show in parts, resuming from its checkpoint if there is one.
+
+def render(name, argv, every, verbose=True):
+    show, args = cli.parse_show_args(name, argv)
+    if args.backend != 'png-avi':
+        raise ValueError("checkpointed renders are written as png-avi files")
+    filename = checkpoint_name(args.basename)
+    if os.path.exists(filename):
+        header, arrays = load(filename)
+        if header['show'] != name or header['argv'] != list(argv):
+            raise ValueError(f"{filename} is the checkpoint of a different render")
+        if verbose:
+            print(f"Resuming from frame {header['frames']} of {filename}.")
+    else:
+        cli.seed(args)
+        header = {'show': name, 'argv': list(argv), 'frames': 0, 'parts': 0, 'random': random.getstate()}
+        arrays = {}
+    random.setstate(random_state(header['random']))
+
+    frame_sequence, snapshot = resumable_frames(show, args, header, arrays)
+    rate = video.output_rate(args)
+    encoder = video.FrameEncoder()
+    calibrated = np.zeros((video.frame_height, video.frame_width, 3), dtype=np.uint8)
+    frames, parts = header['frames'], header['parts']
+    out = avi.AviWriter(part_name(args.basename, parts), video.frame_width, video.frame_height, rate, video.codec_code)
+    try:
+        for frame in frame_sequence:
+            if args.calibration is not None:
+                frame = args.calibration.apply(frame, calibrated)
+            out.write(encoder.encode(frame))
+            frames += 1
+            if frames % every == 0 and frames < args.length:
+                # Finish the part, then record it.
+                out.close()
+                parts += 1
+                state, arrays = snapshot()
+                header.update(state, frames=frames, parts=parts, kind=resume_kind(show, args))
+                save(filename, header, arrays)
+                if verbose:
+                    print(f"Checkpoint at frame {frames}.", flush=True)
+                out = avi.AviWriter(part_name(args.basename, parts), video.frame_width, video.frame_height, rate,
+                                    video.codec_code)
+    finally:
+        out.close()
+    parts += 1
+
+    # Copy the encoded frames into one file.
+    output = args.basename + '.' + video.file_extension
+    avi.join(output, [part_name(args.basename, index) for index in range(parts)],
+             video.frame_width, video.frame_height, rate, video.codec_code)
+    for index in range(parts):
+        os.remove(part_name(args.basename, index))
+    if os.path.exists(filename):
+        os.remove(filename)
+    if verbose:
+        print(f"Wrote {output}, {frames} frames in {parts} parts.")
+    return frames
@@ -0,0 +1,303 @@
+# cli.py: command line entry point for the Pausch Bridge shows.
+
+# Run from the top of the repository:
+#
+#   python3 -m pbl list
+#   python3 -m pbl render primes --tempo 30
+#   python3 -m pbl render-all -w 4 "primes -t 30 primes_30" "primes -t 60 primes_60"
+#   python3 -m pbl render-segments -w 4 pi
+#   python3 -m pbl sweep -t 30,60,90 -l 480,960 primes -v
+#   python3 -m pbl render primes --frame-rate 60 -l 960
+#   python3 -m pbl render --checkpoint 9000 pythagorean -l 2592000
+#   python3 -m pbl play --host 192.168.1.50 primes -t 60
+#   python3 -m pbl play --process --dummy pi
+#   python3 -m pbl soak --hours 24 primes -t 60
+#   python3 -m pbl simulate pythagorean -l 900
+#
+# Each render-all job is a show name followed by its options, exactly as they
+# would be given to 'render'.  Jobs can also be read from a file, one per line.
+# A sweep renders every combination of tempo and length of one show, sharing
+# its keyframes between the variants (see pbl/sweep.py).
+
+#================================================================
+# Import standard Python modules.
+import argparse
+import concurrent.futures
+import os
+import random
+import shlex
+import sys
+import time
+from fractions import Fraction
+
+from pbl import backends, calibration, keyframes, shows, video
+
+#================================================================
+# Per-show option parsing.  The options common to every show are defined here;
+# each show adds its own and may change the common defaults.
+
+def show_parser(name):
+    show = shows.load(name)
+    description = shows.registry[name][1] if name in shows.registry else None
+    parser = argparse.ArgumentParser(prog=f"pbl render {name}", description=description)
+    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
+    parser.add_argument( '-l', '--length', type=int, default=480, help=f'Number of frames to generate (at {video.frame_rate} fps or the --frame-rate)')
+    parser.add_argument( '--frame-rate', type=Fraction, help='Output frame rate, e.g. 60 or 30000/1001, for shows built from keyframes; '
+                         'their keyframes are then timed exactly (see pbl/keyframes.py).')
+    parser.add_argument( '--seed', type=int, help='Seed for the random choices of a show, to make a render repeatable.')
+    parser.add_argument( '--buffers', type=int, help='Buffers of 64 frames for the background encoder (0 encodes on the main thread; default 4 with more than one CPU).')
+    parser.add_argument( '--encoders', type=int, default=1, help='Number of threads encoding frames.')
+    parser.add_argument( '--backend', choices=backends.backends, default='png-avi',
+                         help='Output format (default png-avi, the format the bridge plays; see pbl/backends.py).')
+    parser.add_argument( '--calibration', type=calibration.load, help='Color calibration file (JSON) for the output, see pbl/calibration.py.')
+    parser.add_argument( '--ring', type=int, default=3, help='Number of preallocated output frames a show cycles through (0 allocates every frame).')
+    parser.add_argument( 'basename', default=os.path.splitext(os.path.basename(name))[0], nargs='?',
+                         help=f'Base name of output file (not including .{video.file_extension} extension).')
+    show.add_arguments(parser)
+    return show, parser
+
+def parse_show_args(name, argv):
+    show, parser = show_parser(name)
+    return show, parser.parse_args(argv)
+
+def seed(args):
+    if args.seed is not None:
+        random.seed(args.seed)
+
+def show_frames(show, args):
+    # The frames of a show, at the --frame-rate through an exact keyframe
+    # timeline if one is given.
+    if args.frame_rate is None:
+        return show.frames(args)
+    if not hasattr(show, 'keyframes'):
+        raise ValueError("--frame-rate needs a show built from keyframes")
+    keyframe_sequence, keyframe_interval = show.keyframes(args)
+    # One frame more than the length, for shows that end with a transition
+    # from the frame after the last one.
+    frame_sequence = keyframes.timeline_frames(keyframe_sequence, keyframe_interval, args.frame_rate,
+                                               args.length + 1, video.frame_ring(args))
+    return show.frames(args, frame_sequence)
+
+def looped_frames(show, args):
+    # The frames of a show, starting it again each time it ends.
+    while True:
+        count = 0
+        for frame in show_frames(show, args):
+            count += 1
+            yield frame
+        if count == 0:
+            return
+
+def render(name, argv):
+    show, args = parse_show_args(name, argv)
+    seed(args)
+    return video.write_video_file(args.basename, show_frames(show, args), args.verbose, args.buffers, args.encoders,
+                                  args.calibration, video.output_rate(args), args.backend)
+
+def render_job(name, argv):
+    # Render one job in a worker process, returning its frame count and time.
+    start = time.perf_counter()
+    count = render(name, argv)
+    return count, time.perf_counter() - start
+
+#================================================================
+# Subcommands.
+
+def list_shows(args):
+    width = max(len(name) for name in shows.registry)
+    for name, (path, description) in shows.registry.items():
+        print(f"{name:{width}s}  {description}")
+    return 0
+
+def render_show(args):
+    if args.checkpoint:
+        from pbl import checkpoint
+        checkpoint.render(args.show, args.options, args.checkpoint)
+    else:
+        render(args.show, args.options)
+    return 0
+
+def render_all(args):
+    jobs = list(args.jobs)
+    if args.file is not None:
+        with open(args.file, 'r') as file:
+            jobs += [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    if not jobs:
+        print("render-all: no jobs given", file=sys.stderr)
+        return 2
+
+    # Check every job's options before starting, so a typo does not surface
+    # only after the other renders have finished.
+    commands = []
+    for job in jobs:
+        argv = shlex.split(job)
+        parse_show_args(argv[0], argv[1:])
+        commands.append(argv)
+
+    failures = 0
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(render_job, argv[0], argv[1:]): job for job, argv in zip(jobs, commands)}
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            try:
+                count, elapsed = future.result()
+                print(f"{job}: {count} frames in {elapsed:.2f} s")
+            except Exception as error:
+                print(f"{job}: failed: {error!r}", file=sys.stderr)
+                failures += 1
+
+    print(f"Rendered {len(jobs) - failures} of {len(jobs)} jobs in {time.perf_counter() - start:.2f} s.")
+    return 1 if failures else 0
+
+def play_show(args):
+    # Imported here, so that rendering does not need the network modules.
+    from pbl import live, transport
+    show, show_args = parse_show_args(args.show, args.options)
+    if args.dummy:
+        sender = transport.DummySender()
+    else:
+        sender = live.ArtNetSender(args.host, args.port, args.universe, args.broadcast, show_args.calibration)
+    try:
+        if args.process:
+            play_process(args, show_args, sender)
+        else:
+            seed(show_args)
+            frame_sequence = looped_frames(show, show_args) if args.loop else show_frames(show, show_args)
+            live.play(frame_sequence, sender, verbose=True, rate=video.output_rate(show_args))
+    finally:
+        sender.close()
+    return 0
+
+def play_process(args, show_args, sender):
+    # Generate the show in a worker process, passing the frames through a
+    # shared memory ring (see pbl/transport.py).
+    from pbl import live, transport
+    ring = transport.SharedFrameRing(args.slots)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(transport.produce_show, args.show, args.options, ring.name, args.loop)
+            live.play(transport.ring_frames(ring), sender, verbose=True, rate=video.output_rate(show_args))
+            future.result()
+        print(f"Passed {ring.report()}.")
+    finally:
+        ring.close()
+        ring.unlink()
+
+def soak_show(args):
+    from pbl import soak
+    soak.soak(args.show, args.options, args.hours, args.report)
+    return 0
+
+def render_segmented(args):
+    # Imported here, as the segments module uses this one.
+    from pbl import segments
+    segments.render_segments(args.show, args.options, args.segments or args.workers, args.workers)
+    return 0
+
+def simulate_show(args):
+    # Imported here, as the simulator module uses this one.
+    from pbl import simulator
+    simulator.simulate(args.show, args.options, args.output, args.batch, args.encoders, scale=args.scale, gap=args.gap,
+                       core=args.core, glow=args.glow, bloom=args.bloom, layout=args.layout)
+    return 0
+
+def sweep_show(args):
+    # Imported here, as the sweep module uses this one.
+    from pbl import sweep
+    basename = args.basename or os.path.splitext(os.path.basename(args.show))[0]
+    return sweep.sweep(args.show, args.tempos, args.lengths, args.options, basename, args.workers, args.rates)
+
+#================================================================
+# Main entry point.
+
+def comma_list(convert):
+    def parse(text):
+        return [convert(item) for item in text.split(',')]
+    return parse
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pbl', description="""Render Pausch Bridge lighting shows.""")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparser = subparsers.add_parser('list', help='List the available shows.')
+    subparser.set_defaults(run=list_shows)
+
+    subparser = subparsers.add_parser('render', help='Render one show to a video file.',
+                                      description='Render one show; use "render SHOW -h" for its options.')
+    subparser.add_argument( '--checkpoint', type=int, metavar='FRAMES',
+                            help='Write the video in parts with a checkpoint every FRAMES frames, and resume from the '
+                            'checkpoint if the render was interrupted (see pbl/checkpoint.py).')
+    subparser.add_argument( 'show', help='Name of a registered show, or the path of a show module.')
+    subparser.add_argument( 'options', nargs=argparse.REMAINDER, help='Options for the show.')
+    subparser.set_defaults(run=render_show)
+
+    subparser = subparsers.add_parser('render-all', help='Render several shows or parameter sets in parallel.')
+    subparser.add_argument( '-w', '--workers', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    subparser.add_argument( '-f', '--file', help='File of jobs, one "SHOW [OPTIONS]" per line.')
+    subparser.add_argument( 'jobs', nargs='*', help='Jobs, each a quoted "SHOW [OPTIONS]".')
+    subparser.set_defaults(run=render_all)
+
+    subparser = subparsers.add_parser('render-segments', help='Render one long show in segments on several processes.',
+                                      description='Render one show in segments in parallel and join them into one file, '
+                                      'identical to a plain render.')
+    subparser.add_argument( '-w', '--workers', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    subparser.add_argument( '-n', '--segments', type=int, help='Number of segments (default: the number of workers).')
+    subparser.add_argument( 'show', help='Name of a registered show, or the path of a show module.')
+    subparser.add_argument( 'options', nargs=argparse.REMAINDER, help='Options for the show.')
+    subparser.set_defaults(run=render_segmented)
+
+    subparser = subparsers.add_parser('play', help='Play one show live over Art-Net.',
+                                      description='Send a show to Art-Net receivers in real time.')
+    subparser.add_argument( '--host', default='127.0.0.1', help='Address of the receiver or broadcast address.')
+    subparser.add_argument( '--port', type=int, default=6454, help='UDP port of the receiver.')
+    subparser.add_argument( '--universe', type=int, default=0, help='Art-Net universe of the first pixels.')
+    subparser.add_argument( '--broadcast', action='store_true', help='Allow sending to a broadcast address.')
+    subparser.add_argument( '--process', action='store_true', help='Generate the show in a separate process.')
+    subparser.add_argument( '--slots', type=int, default=64, help='Frames buffered between the show process and the sender.')
+    subparser.add_argument( '--dummy', action='store_true', help='Count the frames instead of sending them.')
+    subparser.add_argument( '--loop', action='store_true', help='Start the show again each time it ends.')
+    subparser.add_argument( 'show', help='Name of a registered show, or the path of a show module.')
+    subparser.add_argument( 'options', nargs=argparse.REMAINDER, help='Options for the show.')
+    subparser.set_defaults(run=play_show)
+
+    subparser = subparsers.add_parser('soak', help='Run one show for many hours of show time, faster than real time.',
+                                      description='Play a show into a null sink for a span of show time, restarting it '
+                                      'whenever it ends, and report its speed, memory and keyframe drift (see pbl/soak.py).')
+    subparser.add_argument( '--hours', type=float, default=24.0, help='Hours of show time to run.')
+    subparser.add_argument( '--report', type=float, default=60.0, help='Minutes of show time between reports.')
+    subparser.add_argument( 'show', help='Name of a registered show, or the path of a show module.')
+    subparser.add_argument( 'options', nargs=argparse.REMAINDER, help='Options for the show.')
+    subparser.set_defaults(run=soak_show)
+
+    subparser = subparsers.add_parser('simulate', help='Preview one show as it looks on the bridge.',
+                                      description='Draw each frame of a show, or of a rendered .avi file, as a large '
+                                      'image of the bridge with glowing fixtures (see pbl/simulator.py).')
+    subparser.add_argument( '--scale', type=int, default=6, help='Image pixels per video pixel.')
+    subparser.add_argument( '--gap', type=int, default=2, help='Image pixels between panels.')
+    subparser.add_argument( '--core', type=float, default=0.35, help='Width of the bright core of each fixture, in video pixels.')
+    subparser.add_argument( '--glow', type=float, default=2.0, help='Width of the soft bloom of each fixture, in video pixels.')
+    subparser.add_argument( '--bloom', type=float, default=0.15, help='Brightness of the bloom relative to the core.')
+    subparser.add_argument( '--layout', help='JSON fixture layout to draw instead of the bridge (see pi/fixtures.py).')
+    subparser.add_argument( '--batch', type=int, default=32, help='Frames drawn at once.')
+    subparser.add_argument( '--encoders', type=int, default=os.cpu_count(), help='Number of threads encoding images.')
+    subparser.add_argument( '-o', '--output', help='Base name of the output file (default: that of the show), '
+                            'to which _bridge.avi is added.')
+    subparser.add_argument( 'show', help='Name of a registered show, the path of a show module, or an .avi file.')
+    subparser.add_argument( 'options', nargs=argparse.REMAINDER, help='Options for the show.')
+    subparser.set_defaults(run=simulate_show)
+
+    subparser = subparsers.add_parser('sweep', help='Render one show at several tempos and lengths in parallel.',
+                                      description='Render every combination of tempo and length of one show.  '
+                                      'Each output is named BASENAME_tTEMPO_lLENGTH, with _rRATE for --rates.')
+    subparser.add_argument( '-w', '--workers', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    subparser.add_argument( '-t', '--tempos', type=comma_list(float), required=True, help='Comma-separated tempos in beats per minute.')
+    subparser.add_argument( '-l', '--lengths', type=comma_list(int), required=True, help='Comma-separated numbers of frames to generate.')
+    subparser.add_argument( '-r', '--rates', type=comma_list(Fraction), help='Comma-separated output frame rates, timing the keyframes exactly (default: 30 fps as usual).')
+    subparser.add_argument( '-b', '--basename', help='Base name of the output files (default: the show name).')
+    subparser.add_argument( 'show', help='Name of a registered show, or the path of a show module.')
+    subparser.add_argument( 'options', nargs=argparse.REMAINDER, help='Other options for the show.')
+    subparser.set_defaults(run=sweep_show)
+
+    args = parser.parse_args(argv)
+    sys.exit(args.run(args))
@@ -0,0 +1,160 @@
+# compositor.py: combine the frames of several shows as layers.
+
+# Each layer is a frame sequence with a blend mode, an opacity (alpha) and an
+# optional mask.  The layers are stacked bottom first, and each one is blended
+# over the result of those below it:
+#
+#   result = (1 - w) * below + w * B(below, layer)
+#
+# where w is the layer's alpha times its mask at each pixel and B is the blend
+# mode:
+#
+#   normal      B = layer
+#   add         B = min(below + layer, 255)
+#   multiply    B = below * layer / 255
+#   max         B = max(below, layer)
+#
+# A mask is an array of weights from 0 to 1 in the frame's shape, or 'key' to
+# use the layer only where it is not black, e.g. for markers drawn over a
+# black background.
+#
+# The compositor gathers a batch of frames from every layer into one float32
+# array, then blends each layer over the whole batch with a few array
+# operations, so the work per frame is a copy per layer and the cost grows
+# with the number of layers only.  Most shows paint whole 4x8 pixel blocks, so
+# by default each batch is combined at block resolution, reading one column
+# of each block and widening the result again, which is a quarter of the
+# blending work, as long as every frame of the batch and every mask paints
+# whole blocks; a batch with detail inside a block, such as the digits of pi
+# or the larger squares of the pythagorean show, is combined at full
+# resolution instead.  blocks=False always combines at full resolution.
+#
+# The composite ends with its bottom layer; a layer above that ends earlier
+# leaves the layers below it uncovered from then on.
+
+#================================================================
+# Import standard Python modules.
+import itertools
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+from pbl.video import frame_width, frame_height
+
+#================================================================
+block_width = 4
+
+blend_modes = ('normal', 'add', 'multiply', 'max')
+
+class Layer:
+    def __init__(self, frame_sequence, mode='normal', alpha=1.0, mask=None):
+        if mode not in blend_modes:
+            raise ValueError(f"unknown blend mode {mode}")
+        self.frames = iter(frame_sequence)
+        self.mode = mode
+        self.alpha = alpha
+        self.mask = mask
+
+    def weight(self, columns):
+        # The layer's weight at each pixel at the given resolution, shaped to
+        # broadcast over a batch of frames, or None for a keyed layer whose
+        # weight depends on its frames.
+        if isinstance(self.mask, str):
+            return None
+        if self.mask is None:
+            return np.float32(self.alpha)
+        mask = np.asarray(self.mask, dtype=np.float32)
+        if mask.shape != (frame_height, frame_width):
+            raise ValueError(f"a mask must be {frame_height}x{frame_width}, not {mask.shape}")
+        return (self.alpha * mask[:, ::frame_width // columns])[..., np.newaxis]
+
+#================================================================
+# Blend one layer into the result below it, in place, over a batch.
+
+def blend(below, layer, mode, weight):
+    if mode == 'normal':
+        target = layer
+    elif mode == 'add':
+        target = np.add(below, layer, out=layer)
+        np.minimum(target, 255, out=target)
+    elif mode == 'multiply':
+        target = np.multiply(below, layer, out=layer)
+        target *= np.float32(1 / 255)
+    else:
+        target = np.maximum(below, layer, out=layer)
+    target -= below
+    target *= weight
+    below += target
+
+def key_weight(layer, alpha):
+    # The weight of a keyed layer: its alpha where a pixel is not black.
+    # Summing the channels is much faster than reducing over the short axis.
+    return alpha * ((layer[..., 0] + layer[..., 1] + layer[..., 2]) > 0)[..., np.newaxis]
+
+#================================================================
+# Generate the composite frames.  The frames are views of one batch buffer,
+# valid until the next batch is started.
+
+def whole_blocks(frames, inside):
+    # Whether a batch of frames paints whole blocks.  Each row of bytes is
+    # compared with itself shifted by a pixel where both pixels fall inside
+    # one block, as given by the uint8 mask inside, in one OpenCV call.
+    rows = frames.reshape(-1, frame_width * 3)
+    return cv.norm(rows[:, 3:], rows[:, :-3], cv.NORM_INF, inside[:len(rows)]) == 0
+
+def composite(layers, batch=64, blocks=True):
+    blocks = blocks and all(layer.mask is None or isinstance(layer.mask, str) or
+                            np.array_equal(np.repeat(np.asarray(layer.mask)[:, ::block_width], block_width, axis=1), layer.mask)
+                            for layer in layers)
+    narrow_columns = frame_width // block_width
+    weights = {columns: [layer.weight(columns) for layer in layers] for columns in (frame_width, narrow_columns)}
+    inside = np.zeros((batch * frame_height, frame_width * 3 - 3), dtype=np.uint8)
+    inside[:] = np.arange(frame_width * 3 - 3) % (block_width * 3) < (block_width - 1) * 3
+    gathered = np.zeros((len(layers), batch, frame_height, frame_width, 3), dtype=np.uint8)
+    stack = np.zeros(gathered.shape, dtype=np.float32)
+    result = np.zeros(gathered.shape[1:], dtype=np.float32)
+    narrow = np.zeros((batch, frame_height, narrow_columns, 3), dtype=np.uint8)
+    output = np.zeros((batch, frame_height, frame_width, 3), dtype=np.uint8)
+
+    while True:
+        # Gather a batch from each layer, as many frames as it has left.
+        counts = []
+        for layer, frames in zip(layers, gathered):
+            count = 0
+            for frame in itertools.islice(layer.frames, batch if not counts else counts[0]):
+                np.copyto(frames[count], frame)
+                count += 1
+            counts.append(count)
+        count = counts[0]
+        if count == 0:
+            return
+
+        # Blend at block resolution only if no frame has detail inside a block.
+        columns = frame_width
+        if blocks and all(whole_blocks(frames[:n], inside) for frames, n in zip(gathered, counts) if n > 0):
+            columns = narrow_columns
+        step = frame_width // columns
+        stacked = stack.reshape(-1)[:stack.size * columns // frame_width].reshape(stack.shape[:3] + (columns, 3))
+        blended = result.reshape(-1)[:result.size * columns // frame_width].reshape(result.shape[:2] + (columns, 3))
+        for frames, gathered_frames, n in zip(stacked, gathered, counts):
+            np.copyto(frames[:n], gathered_frames[:n, :, ::step])
+
+        # The bottom layer is blended over black.
+        blended[:count] = 0
+        for layer, frames, weight, n in zip(layers, stacked, weights[columns], counts):
+            if n > 0:
+                if weight is None:
+                    weight = key_weight(frames[:n], np.float32(layer.alpha))
+                blend(blended[:n], frames[:n], layer.mode, weight)
+
+        np.rint(blended[:count], out=blended[:count])
+        np.clip(blended[:count], 0, 255, out=blended[:count])
+        if step == 1:
+            np.copyto(output[:count], blended[:count], casting='unsafe')
+        else:
+            # Widen the blocks again, all frames of the batch as one image.
+            np.copyto(narrow[:count], blended[:count], casting='unsafe')
+            cv.resize(narrow[:count].reshape((-1, columns, 3)), (frame_width, count * frame_height),
+                      dst=output[:count].reshape((-1, frame_width, 3)), interpolation=cv.INTER_NEAREST)
+        yield from output[:count]
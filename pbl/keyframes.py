@@ -0,0 +1,314 @@
+# keyframes.py: keyframe sequences and cross-fade timing for Pausch Bridge shows.
+
+# Most shows are a sequence of keyframe intervals: during each interval the
+# output cross-fades from one frame to another, and at the end of the interval
+# the show computes the next pair.  The content of the keyframes does not
+# depend on the tempo, only the timing of the cross-fade does.  A show's
+# keyframe generator therefore yields one tuple per interval,
+#
+#   (frame0, frame1)                     fade from frame0 to frame1, or
+#   (frame0, frame1, seconds, overlay)   with an interval length in seconds
+#                                        that overrides the tempo, and/or an
+#                                        overlay (mask, color) that paints the
+#                                        masked pixels of every output frame,
+#
+# and crossfade() turns it into frames at a given keyframe interval.  The
+# keyframe interval is either a constant in seconds or a sequence of interval
+# lengths, e.g. following the beats of a piece of music (see pbl/beats.py),
+# whose last entry repeats once it runs out.  The
+# generator may reuse and modify its frame arrays in place after yielding
+# them, as the original show loops did.
+#
+# KeyframeTable and table_frames() render the same frames from a table of
+# precomputed keyframes, so many tempo variants can share one keyframe pass.
+# A Timeline places the keyframe intervals at exact rational times and
+# samples them at any frame rate, so the same keyframes can be rendered at
+# e.g. 15, 30 or 60 fps without the phase drift of adding up float rates.
+#
+# Both write their frames into a FrameRing when given one (see pbl/video.py),
+# and otherwise return a new array for every frame.
+
+#================================================================
+# Import standard Python modules.
+import collections
+import math
+from fractions import Fraction
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+from pbl.video import frame_rate, output_buffer
+
+Interval = collections.namedtuple('Interval', ['frame0', 'frame1', 'seconds', 'overlay'], defaults=(None, None))
+
+#================================================================
+# Generate frames by cross-fading between successive keyframes.
+
+def keyframe_seconds(keyframe_interval, k):
+    # Length of keyframe interval k for a constant or sequence interval.
+    if np.ndim(keyframe_interval) == 0:
+        return keyframe_interval
+    return float(keyframe_interval[min(k, len(keyframe_interval) - 1)])
+
+class CrossfadeState:
+    # The position of a crossfade() between frames, enough to continue it
+    # later (see pbl/checkpoint.py): the current interval, its index k among
+    # the keyframe generator's intervals, and the phase and phase rate of the
+    # next frame.
+    def __init__(self, interval=None, k=0, phase=0.0, rate=None):
+        self.interval = interval
+        self.k = k
+        self.phase = phase
+        self.rate = rate
+
+def crossfade(keyframes, keyframe_interval=None, ring=None, state=None):
+    # With a state whose interval is set, continue from it, given the keyframe
+    # generator just after that interval; the state is kept up to date after
+    # every frame.
+    if state is None:
+        state = CrossfadeState()
+    if state.interval is None:
+        keyframe_phase = 0.0  # unit phase for the cross-fade, cycles over 0 to 1
+        k = 0                 # index of the current keyframe interval
+        frame0, frame1, seconds, overlay = Interval(*next(keyframes))
+        keyframe_rate = 1.0 / (frame_rate * (seconds or keyframe_seconds(keyframe_interval, k)))  # phase / frame
+    else:
+        frame0, frame1, seconds, overlay = state.interval
+        keyframe_phase, k, keyframe_rate = state.phase, state.k, state.rate
+
+    while True:
+        # Cross-fade between successive key frames at the given tempo.  This will
+        # return a new frame of integer pixels, or the next buffer of the ring.
+        frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0, dst=output_buffer(ring))
+
+        # Advance the cross-fade phase.
+        keyframe_phase += keyframe_rate
+
+        # Once the second keyframe is reached, move on to the successor and
+        # reset the fade.  The show ends when the keyframes run out.
+        if keyframe_phase >= 1.0:
+            keyframe_phase -= 1.0
+            try:
+                frame0, frame1, seconds, overlay = Interval(*next(keyframes))
+            except StopIteration:
+                return
+            k += 1
+            next_rate = 1.0 / (frame_rate * (seconds or keyframe_seconds(keyframe_interval, k)))
+            if seconds is None and np.ndim(keyframe_interval) > 0:
+                # Carry the time past the end of the interval over at the new
+                # rate, so that keyframes stay on the beats.
+                keyframe_phase *= next_rate / keyframe_rate
+            keyframe_rate = next_rate
+            state.interval = Interval(frame0, frame1, seconds, overlay)
+            state.k = k
+        elif state.interval is None:
+            state.interval = Interval(frame0, frame1, seconds, overlay)
+        state.phase = keyframe_phase
+        state.rate = keyframe_rate
+
+        if overlay is not None:
+            mask, color = overlay
+            np.copyto(frame, color, where=np.asarray(mask)[..., np.newaxis], casting='unsafe')
+
+        # Return the frame and advance the generator state.
+        yield frame
+
+#================================================================
+# Precomputed keyframes.
+
+class KeyframeTable:
+    # Collects the intervals of a keyframe generator on demand.  Identical
+    # frames and overlay masks are stored once: frames[index0[k]] and
+    # frames[index1[k]] are the keyframes of interval k, and masks[mask_index[k]]
+    # its overlay (mask_index -1 for none).
+    def __init__(self, keyframes):
+        self.keyframes = keyframes
+        self.finished = False
+        self.frames = []
+        self.masks = []
+        self.frame_lookup = {}
+        self.mask_lookup = {}
+        self.index0 = []
+        self.index1 = []
+        self.seconds = []
+        self.mask_index = []
+        self.colors = []
+
+    def __len__(self):
+        return len(self.index0)
+
+    def _store(self, array, arrays, lookup):
+        key = array.tobytes()
+        if key not in lookup:
+            lookup[key] = len(arrays)
+            arrays.append(array.copy())
+        return lookup[key]
+
+    def extend(self, count):
+        # Collect intervals until there are count of them, returning False if
+        # the show ends first.
+        while len(self) < count and not self.finished:
+            try:
+                frame0, frame1, seconds, overlay = Interval(*next(self.keyframes))
+            except StopIteration:
+                self.finished = True
+                break
+            self.index0.append(self._store(frame0, self.frames, self.frame_lookup))
+            self.index1.append(self._store(frame1, self.frames, self.frame_lookup))
+            self.seconds.append(np.nan if seconds is None else seconds)
+            if overlay is None:
+                self.mask_index.append(-1)
+                self.colors.append((0, 0, 0))
+            else:
+                self.mask_index.append(self._store(np.asarray(overlay[0], dtype=bool), self.masks, self.mask_lookup))
+                self.colors.append(overlay[1])
+        return len(self) >= count
+
+    def interval_seconds(self, k):
+        # Interval length of keyframe k in seconds (nan to use the tempo), or
+        # None if the show has ended before k.
+        if not self.extend(k + 1):
+            return None
+        return self.seconds[k]
+
+    def arrays(self):
+        # The table as arrays: frames, masks and the per-interval entries.
+        frames = np.array(self.frames, dtype=np.uint8)
+        masks = np.array(self.masks, dtype=bool).reshape((-1,) + frames.shape[1:3])
+        return {'frames': frames,
+                'masks': masks,
+                'index0': np.array(self.index0, dtype=np.intp),
+                'index1': np.array(self.index1, dtype=np.intp),
+                'seconds': np.array(self.seconds, dtype=np.float64),
+                'mask_index': np.array(self.mask_index, dtype=np.intp),
+                'colors': np.array(self.colors, dtype=np.uint8).reshape((-1, 3))}
+
+def schedule(interval_seconds, keyframe_interval, length):
+    # Reproduce the phase accumulation of crossfade() for length frames.
+    # interval_seconds(k) gives the length of interval k (nan to use the
+    # keyframe interval, constant or sequence) or None past the end of the show.  Returns, for each
+    # frame, its interval, its phase, and the interval whose overlay it gets
+    # (the next one if the interval ends on this frame).  The arrays are
+    # shorter than length if the show ends first.
+    keyframe = []
+    phase = []
+    overlay_keyframe = []
+
+    def rate(k):
+        # The phase rate of interval k, and whether it follows keyframe_interval.
+        seconds = interval_seconds(k)
+        if seconds is None:
+            return None, False
+        if np.isnan(seconds):
+            return 1.0 / (frame_rate * keyframe_seconds(keyframe_interval, k)), np.ndim(keyframe_interval) > 0
+        return 1.0 / (frame_rate * seconds), False
+
+    k = 0
+    keyframe_phase = 0.0
+    keyframe_rate, _ = rate(0)
+    for n in range(length):
+        keyframe.append(k)
+        phase.append(keyframe_phase)
+        keyframe_phase += keyframe_rate
+        if keyframe_phase >= 1.0:
+            keyframe_phase -= 1.0
+            next_rate, rescale = rate(k + 1)
+            if next_rate is None:
+                del keyframe[n:], phase[n:]
+                break
+            if rescale:
+                keyframe_phase *= next_rate / keyframe_rate
+            keyframe_rate = next_rate
+            k += 1
+        overlay_keyframe.append(k)
+    return np.array(keyframe, dtype=np.intp), np.array(phase, dtype=np.float64), np.array(overlay_keyframe, dtype=np.intp)
+
+def table_frames(table, keyframe, phase, overlay_keyframe, ring=None):
+    # Generate the frames of a schedule from the arrays of a keyframe table.
+    frames, masks, colors = table['frames'], table['masks'], table['colors']
+    index0, index1 = table['index0'].tolist(), table['index1'].tolist()
+    mask_index = table['mask_index'].tolist()
+
+    for k, keyframe_phase, m in zip(keyframe.tolist(), phase.tolist(), overlay_keyframe.tolist()):
+        frame = cv.addWeighted(frames[index0[k]], (1.0 - keyframe_phase), frames[index1[k]], keyframe_phase, 0.0,
+                               dst=output_buffer(ring))
+        if mask_index[m] >= 0:
+            np.copyto(frame, colors[m], where=masks[mask_index[m]][..., np.newaxis])
+        yield frame
+
+#================================================================
+# Exact keyframe timing.
+
+# Interval lengths are converted to the nearest fraction with a denominator
+# of at most max_denominator, which recovers lengths like 1/3 s exactly and
+# moves beat times by well under a microsecond.
+max_denominator = 10**6
+
+class Timeline:
+    # Maps time to keyframe intervals.  interval_seconds(k) gives the length
+    # of interval k as for schedule(); the start times of the intervals are
+    # kept as Fractions, collected on demand.
+    def __init__(self, interval_seconds, keyframe_interval=None):
+        self.interval_seconds = interval_seconds
+        self.keyframe_interval = keyframe_interval
+        self.starts = [Fraction(0)]   # starts[k + 1] is the end of interval k
+        self.finished = False
+
+    def extend(self, count):
+        # Find the ends of the first count intervals, returning False if the
+        # show ends first.
+        while len(self.starts) <= count and not self.finished:
+            k = len(self.starts) - 1
+            seconds = self.interval_seconds(k)
+            if seconds is None:
+                self.finished = True
+                break
+            if np.isnan(seconds):
+                seconds = keyframe_seconds(self.keyframe_interval, k)
+            self.starts.append(self.starts[-1] + Fraction(seconds).limit_denominator(max_denominator))
+        return len(self.starts) > count
+
+    def sample(self, frame_rate, length, start=0):
+        # The schedule of frames start to start + length at the given frame
+        # rate, as returned by schedule(): frame n shows the time n / frame_rate.
+        # Each frame's interval is found exactly, and its phase is the exact
+        # fraction (num0 + i * step) / den for the i-th frame of the interval,
+        # rounded once by a single division of integers, so it does not
+        # depend on the first frame sampled.  As in crossfade(), a frame
+        # takes its overlay from the interval of the next frame, and the show
+        # ends before the frame whose successor is past the last interval.
+        rate = Fraction(frame_rate)
+        stop = start + length + 1
+        keyframe = np.empty(length + 1, dtype=np.intp)
+        phase = np.empty(length + 1, dtype=np.float64)
+        n = start
+        k = 0
+        while n < stop and self.extend(k + 1):
+            # Interval k holds frames ceil(starts[k] * rate) up to its end.
+            end = min(stop, math.ceil(self.starts[k + 1] * rate))
+            if end > n:
+                seconds = self.starts[k + 1] - self.starts[k]
+                offset = (n / rate - self.starts[k]) / seconds
+                increment = 1 / (rate * seconds)
+                num0 = offset.numerator * increment.denominator
+                step = increment.numerator * offset.denominator
+                den = offset.denominator * increment.denominator
+                keyframe[n - start:end - start] = k
+                if max(num0 + (end - n) * step, den) < 2**53:
+                    # The integers are exact in float64, so numpy divides them
+                    # with a single rounding.
+                    phase[n - start:end - start] = (num0 + np.arange(end - n, dtype=np.int64) * step) / den
+                else:
+                    phase[n - start:end - start] = [(num0 + i * step) / den for i in range(end - n)]
+                n = end
+            k += 1
+        count = n - start
+        return keyframe[:count - 1], phase[:count - 1], keyframe[1:count]
+
+def timeline_frames(keyframes, keyframe_interval, frame_rate, length, ring=None, start=0):
+    # Up to length frames of a keyframe generator at the given frame rate,
+    # from frame start on.
+    table = KeyframeTable(keyframes)
+    timing = Timeline(table.interval_seconds, keyframe_interval).sample(frame_rate, length, start)
+    return table_frames(table.arrays(), *timing, ring)
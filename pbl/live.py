@@ -0,0 +1,104 @@
+# live.py: send shows to lighting controllers over Art-Net as they are generated.
+
+# Each frame is sent as ArtDmx packets, one per DMX universe of 512 channels.
+# The pixels go out in row-major order, three RGB channels each, 170 pixels
+# per universe, starting at a given universe number.  A universe whose data
+# has not changed since it was last sent is skipped, except that every
+# universe is refreshed at least once a second as Art-Net receivers expect.
+#
+#   python3 -m pbl play --host 192.168.1.50 primes -t 60
+#
+# With no --host the packets go to the local machine, where any Art-Net
+# monitor can show them.  A calibration (see pbl/calibration.py) is applied
+# to each frame before it is split into universes.
+
+#================================================================
+# Import standard Python modules.
+import socket
+import struct
+import time
+
+# Import the numpy module.
+import numpy as np
+
+from pbl.video import frame_rate, frame_width, frame_height
+
+#================================================================
+# Art-Net constants.
+artnet_port = 6454
+artnet_header = b'Art-Net\0' + struct.pack('<H', 0x5000) + struct.pack('>H', 14)  # ArtDmx, protocol 14
+pixels_per_universe = 170
+refresh_interval = 1.0  # seconds between retransmissions of unchanged universes
+
+class ArtNetSender:
+    def __init__(self, host='127.0.0.1', port=artnet_port, universe=0, broadcast=False, calibration=None):
+        self.address = (host, port)
+        self.calibration = calibration
+        self.calibrated = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
+        self.universe = universe
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if broadcast:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sequence = 0
+        self.last_data = {}     # universe -> last data sent
+        self.last_time = {}     # universe -> time it was sent
+        self.frames = 0         # frames sent
+        self.packets = 0        # packets sent
+        self.skipped = 0        # packets skipped because their universe was unchanged
+        self.bytes = 0          # bytes of DMX data sent
+
+    def send(self, frame, now=None):
+        # Send one BGR frame, skipping universes that have not changed.
+        if now is None:
+            now = time.monotonic()
+        self.frames += 1
+        self.sequence = self.sequence % 255 + 1   # 1 to 255, 0 would disable sequencing
+        if self.calibration is not None:
+            frame = self.calibration.apply(frame, self.calibrated)
+        channels = np.ascontiguousarray(frame[..., ::-1]).reshape(-1)
+        size = 3 * pixels_per_universe
+        for offset in range(0, len(channels), size):
+            universe = self.universe + offset // size
+            data = channels[offset:offset + size].tobytes()
+            data += b'\0' * (len(data) % 2)   # DMX lengths are even
+            if data == self.last_data.get(universe) and now - self.last_time[universe] < refresh_interval:
+                self.skipped += 1
+                continue
+            packet = artnet_header + struct.pack('<BBH', self.sequence, 0, universe) + struct.pack('>H', len(data)) + data
+            self.socket.sendto(packet, self.address)
+            self.last_data[universe] = data
+            self.last_time[universe] = now
+            self.packets += 1
+            self.bytes += len(data)
+
+    def report(self):
+        total = self.packets + self.skipped
+        saved = 100.0 * self.skipped / total if total else 0.0
+        return (f"{self.frames} frames: {self.packets} packets sent, {self.skipped} unchanged universes skipped "
+                f"({saved:.0f}% saved), {self.bytes} bytes of DMX data")
+
+    def close(self):
+        self.socket.close()
+
+#================================================================
+# Play a frame sequence in real time.
+
+def play(frame_sequence, sender, verbose=False, rate=frame_rate):
+    # Send each frame at its time at the given frame rate, counted from the
+    # first frame, so that a show's startup does not make the first frames
+    # late.  Frames that are generated late are sent at once, without trying
+    # to catch up by dropping any.
+    start = None
+    late = 0
+    for count, frame in enumerate(frame_sequence):
+        if start is None:
+            start = time.monotonic()
+        delay = start + count / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0 / rate:
+            late += 1
+        sender.send(frame)
+    if verbose:
+        print(f"Played {sender.report()}, {late} frames late.")
+    return sender.frames
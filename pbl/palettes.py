@@ -0,0 +1,152 @@
+# palettes.py: grids of colors taken from images, image sequences and videos.
+
+# A show that takes its colors from a picture, such as fibonacci, reduces it
+# to a grid of block colors: the picture is divided into (rows + 1) x
+# (columns + 1) cells and the average color of each of the first rows x
+# columns cells is taken, rounded down, as fibonacci's getimgcolor() did.  The
+# default grid is 13 rows of 57 blocks, one bridge width per row.
+#
+# A PaletteSource serves one grid after another from a still image (the same
+# grid every time), a directory of images (in order of their names) or a
+# video, starting again at the beginning when the images or frames run out:
+#
+#   source = PaletteSource('sunset.mp4', step=30)   # the grid of every 30th frame
+#   grid = next(source)                             # (13, 57, 3) uint8 (B,G,R)
+#
+# Images and frames are decoded on a background thread, which reduces each one
+# to its grid at once and keeps up to prefetch grids waiting, so memory stays
+# bounded however long the video is; OpenCV releases the GIL while it decodes.
+# Frames skipped by step are only grabbed, not decoded.  close() stops the
+# thread; a source is also closed when it is garbage collected.
+
+#================================================================
+# Import standard Python modules.
+import os
+import queue
+import threading
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+#================================================================
+image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+def block_colors(image, rows=13, columns=57):
+    # The grid of average colors of an image, as a (rows, columns, 3) uint8
+    # array, for all the cells at once.  Like getimgcolor() it averages the
+    # columns of each cell, then those averages, in floating point, so that
+    # the colors round down exactly as they did.
+    cell_height = image.shape[0] // (rows + 1)
+    cell_width = image.shape[1] // (columns + 1)
+    if cell_height == 0 or cell_width == 0:
+        raise ValueError(f"an image of {image.shape[1]}x{image.shape[0]} is too small for {columns}x{rows} colors")
+    cells = image[:rows * cell_height, :columns * cell_width].reshape((rows, cell_height, columns, cell_width, -1))
+    column_averages = cells.sum(axis=1, dtype=np.uint32) / cell_height
+    return (column_averages.sum(axis=2) / cell_width).astype(np.uint8)
+
+def read_image(filename):
+    image = cv.imread(filename, flags=cv.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"cannot read image {filename}")
+    return image
+
+#================================================================
+# Sources of images, each a generator of the images of one pass.
+
+def directory_images(path, step):
+    filenames = sorted(name for name in os.listdir(path) if os.path.splitext(name)[1].lower() in image_extensions)
+    if not filenames:
+        raise ValueError(f"{path} has no images")
+    for name in filenames[::step]:
+        yield read_image(os.path.join(path, name))
+
+def video_images(path, step):
+    capture = cv.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"cannot read video {path}")
+    try:
+        while True:
+            success, image = capture.read()
+            if not success:
+                return
+            yield image
+            for i in range(step - 1):
+                if not capture.grab():
+                    return
+    finally:
+        capture.release()
+
+#================================================================
+# The decoder thread.  It only holds the queue and the stop event, not the
+# source, so that a source nobody refers to any more is collected and stops
+# its thread.
+
+def put(grids, item, stopping):
+    # Wait for room in the queue, giving up once the source is closed.
+    while not stopping.is_set():
+        try:
+            grids.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def decode(images, path, step, rows, columns, grids, stopping):
+    # Decode passes over the source until stopped, handing over each grid, or
+    # the error that ended decoding.
+    try:
+        while not stopping.is_set():
+            count = 0
+            for image in images(path, step):
+                if not put(grids, block_colors(image, rows, columns), stopping):
+                    return
+                count += 1
+            if count == 0:
+                raise ValueError(f"{path} has no frames")
+    except BaseException as error:
+        put(grids, error, stopping)
+
+#================================================================
+class PaletteSource:
+    def __init__(self, path, step=1, rows=13, columns=57, prefetch=4):
+        self.path = path
+        self.grid = None
+        self.thread = None
+        if os.path.isdir(path):
+            images = directory_images
+        elif os.path.splitext(path)[1].lower() in image_extensions:
+            # A still image has a single grid.
+            self.grid = block_colors(read_image(path), rows, columns)
+            return
+        else:
+            images = video_images
+        self.grids = queue.Queue(prefetch)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=decode, name='palette decoder', daemon=True,
+                                       args=(images, path, max(1, step), rows, columns, self.grids, self.stopping))
+        self.thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.thread is None:
+            if self.grid is None:
+                raise StopIteration
+            return self.grid
+        grid = self.grids.get()
+        if isinstance(grid, BaseException):
+            self.close()
+            raise grid
+        return grid
+
+    def close(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+    def __del__(self):
+        if self.thread is not None:
+            self.stopping.set()
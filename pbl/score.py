@@ -0,0 +1,313 @@
+# score.py: shows described as data and compiled to event tables.
+
+# A score is a JSON (or, with PyYAML installed, YAML) description of a show
+# made of full-height columns of color, as a list of keyframe events:
+#
+#   {"description": "Pythagorean theorem video generator.",
+#    "keyframe_beats": 5.0,
+#    "length": 480,
+#    "colors": {"white": [255, 255, 255], "a": "random", "b": "random", "c": {"mean": ["a", "b"]}},
+#    "background": "white",
+#    "events": [
+#      {"fill": [{"columns": [32, 44], "color": "a"}, {"blocks": [12, 16], "color": "b"}], "hold": 11},
+#      {"clear": true, "fill": [{"columns": [32, 132], "color": "c"}], "hold": 10, "redraw": true},
+#      ...],
+#    "loop": 1,
+#    "end": {"fade": 5.0, "color": "black"}}
+#
+# Colors are (B,G,R) as in the show scripts; a "random" color is drawn from
+# the random module as (r, g, b) like the scripts' random_color(), and a
+# "mean" color is the average of two earlier ones, rounded down.  Each event
+# paints its fills, given in pixel columns or 4-pixel blocks (end exclusive),
+# over the keyframe of the event before it, or over the background if it
+# clears, and holds the result for its number of keyframe intervals.  An event
+# with "fade" cross-fades into its keyframe over its first interval instead of
+# switching at once.  After an event with "redraw" the random colors are drawn
+# again; blocks keep the name of their color, not its value.  When the events
+# run out the show returns to event "loop", or holds the last keyframe for
+# ever.  The keyframe interval is keyframe_beats / tempo seconds as for the
+# scripts (see pbl/beats.py), and "end" fades the frame after the last one to
+# a color over the given seconds.
+#
+# The compiler reduces the events to a table of distinct keyframes, each a
+# row of color indices, and expands the sequence of intervals with array
+# operations; the renderer looks up the colors of a whole batch of frames at
+# once and only cross-fades the frames that change.  A score registered in
+# pbl/shows.py, or a path to one, is used like a show module:
+#
+#   python3 -m pbl render pythagorean_score --seed 1
+#   python3 -m pbl render perfect_squares/perfect_squares_part3.json -t 60
+
+#================================================================
+# Import standard Python modules.
+import itertools
+import json
+import math
+import os
+import random
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+from pbl.video import frame_width, frame_height, frame_ring, output_buffer, output_rate
+from pbl import beats, keyframes
+
+#================================================================
+block_width = 4
+
+def load(filename):
+    # The description in a JSON or YAML file.
+    with open(filename, 'r') as file:
+        if os.path.splitext(filename)[1] in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(f"reading {filename} needs PyYAML (pip3 install pyyaml)") from None
+            return yaml.safe_load(file)
+        return json.load(file)
+
+#================================================================
+# Compilation.
+
+class Score:
+    def __init__(self, description):
+        self.description = description.get('description')
+        self.keyframe_beats = float(description.get('keyframe_beats', 1.0))
+        self.length = description.get('length')
+
+        # Color slots, in order of declaration.
+        self.colors = description['colors']
+        self.slots = {name: slot for slot, name in enumerate(self.colors)}
+        self.palettes = []      # drawn palettes, one per redraw epoch
+        self.palette_array = np.zeros((0, len(self.colors), 3), dtype=np.uint8)
+        background = self.slot(description.get('background', next(iter(self.colors))))
+
+        # The keyframe of each event, as the color slot of each column.
+        events = description['events']
+        if not events:
+            raise ValueError("a score needs at least one event")
+        self.loop = description.get('loop')
+        state = np.full(frame_width, background, dtype=np.intp)
+        states = []
+        for event in events:
+            state = self.paint(event, state, background)
+            states.append(state)
+        if self.loop is not None:
+            # A looped event paints over the end of the loop, which must come
+            # round to the same keyframes each time.
+            for event in events[self.loop:]:
+                state = self.paint(event, state, background)
+                states.append(state)
+            repeat = states[len(events):]
+            for event, expected in zip(events[self.loop:], repeat):
+                state = self.paint(event, state, background)
+                if (state != expected).any():
+                    raise ValueError("the events of the loop do not repeat the same keyframes")
+            events = events + events[self.loop:]
+        self.states = np.array(states)
+
+        # One row per occurrence of an event: the first pass, then the loop.
+        self.holds = np.array([event.get('hold', 1) for event in events], dtype=np.intp)
+        self.fades = np.array([bool(event.get('fade', False)) for event in events])
+        self.redraws = np.array([bool(event.get('redraw', False)) for event in events])
+        self.first_pass = len(description['events'])
+
+        end = description.get('end')
+        self.end = None if end is None else (float(end['fade']), self.slot(end.get('color', background)))
+        self.interval_cache = None
+
+    def slot(self, name):
+        if name not in self.slots:
+            raise ValueError(f"unknown color {name}")
+        return self.slots[name]
+
+    def paint(self, event, state, background):
+        state = np.full_like(state, background) if event.get('clear') else state.copy()
+        for fill in event.get('fill', []):
+            if 'blocks' in fill:
+                start, stop = (block_width * value for value in fill['blocks'])
+            else:
+                start, stop = fill['columns']
+            state[max(start, 0):min(stop, frame_width)] = self.slot(fill['color'])
+        return state
+
+    #----------------------------------------------------------------
+    # Colors.
+
+    def palette(self, epochs):
+        # The colors of each slot for at least redraw epochs 0 to epochs - 1,
+        # as a uint8 (epochs, slots, 3) array.  Random colors are drawn in
+        # order on first use, twice as many epochs at a time.
+        if len(self.palette_array) >= epochs:
+            return self.palette_array
+        epochs = max(epochs, 2 * len(self.palettes))
+        while len(self.palettes) < epochs:
+            values = {}
+            for name, color in self.colors.items():
+                if color == 'random':
+                    r, g, b = (random.randint(0, 255) for i in range(3))
+                    values[name] = (b, g, r)
+                elif isinstance(color, dict):
+                    first, second = (values[other] for other in color['mean'])
+                    values[name] = tuple((x + y) // 2 for x, y in zip(first, second))
+                else:
+                    values[name] = tuple(color)
+            self.palettes.append(list(values.values()))
+        self.palette_array = np.array(self.palettes, dtype=np.uint8)
+        return self.palette_array
+
+    #----------------------------------------------------------------
+    # The keyframe intervals.
+
+    def intervals(self, count):
+        # The keyframes of intervals 0 to count - 1, as arrays of the event
+        # keyframe and epoch of the frames faded from and to.
+        if self.interval_cache is None or len(self.interval_cache[0]) < count:
+            count = max(count, 2 * len(self.interval_cache[0]) if self.interval_cache else 256)
+            holds, fades, redraws = self.holds.copy(), self.fades, self.redraws
+            first = self.first_pass
+            if self.loop is None:
+                holds[-1] = count
+                occurrence = np.arange(first)
+            else:
+                repeats = max(1, -(-(count - holds[:first].sum()) // holds[first:].sum()))
+                occurrence = np.concatenate((np.arange(first), np.tile(np.arange(first, len(holds)), repeats)))
+            # The epoch of an occurrence counts the redraws before it.
+            epochs = np.cumsum(redraws[occurrence]) - redraws[occurrence]
+            interval_occurrence = np.repeat(np.arange(len(occurrence)), holds[occurrence])[:count]
+            state1 = occurrence[interval_occurrence]
+            epoch1 = epochs[interval_occurrence]
+            # An occurrence that fades starts from the keyframe before it.
+            starts = np.zeros(count, dtype=bool)
+            boundaries = (np.cumsum(holds[occurrence]) - holds[occurrence])
+            starts[boundaries[boundaries < count]] = True
+            fading = starts & fades[state1]
+            fading[0] = False
+            state0 = np.where(fading, np.roll(state1, 1), state1)
+            epoch0 = np.where(fading, np.roll(epoch1, 1), epoch1)
+            self.interval_cache = (state0, epoch0, state1, epoch1)
+        return self.interval_cache
+
+    def rows(self, states, epochs):
+        # The (n, frame_width, 3) rows of color of the given keyframes.
+        palette = self.palette(int(epochs.max()) + 1)
+        return palette[epochs[:, np.newaxis], self.states[states]]
+
+    def keyframe(self, state, epoch):
+        row = self.rows(np.array([state]), np.array([epoch]))
+        return np.repeat(row, frame_height, axis=0)
+
+    #----------------------------------------------------------------
+    # Rendering.
+
+    def keyframe_pairs(self):
+        # The keyframes as a keyframe generator (see pbl/keyframes.py), for
+        # the exact timeline and parameter sweeps.
+        for k in itertools.count():
+            state0, epoch0, state1, epoch1 = (array[k] for array in self.intervals(k + 1))
+            yield self.keyframe(state0, epoch0), self.keyframe(state1, epoch1)
+
+    def render(self, keyframe, phase, ring=None, batch=64):
+        # Generate the frames of a schedule (see keyframes.schedule()).  The
+        # colors of a batch of frames are looked up at once into work arrays
+        # allocated up front; each frame is then a copy of its keyframe's row,
+        # cross-faded from the keyframe before it only where the two differ.
+        # With a ring each frame is written into the ring's next buffer, so
+        # no memory is allocated per frame.
+        if len(keyframe) == 0:
+            return
+        intervals = self.intervals(int(keyframe.max()) + 1)
+        keys = np.zeros((4, batch), dtype=np.intp)             # state0, epoch0, state1, epoch1
+        indices, offsets = np.zeros((2, 2, batch, frame_width), dtype=np.intp)
+        spread = np.repeat(np.arange(batch), frame_width).reshape(batch, frame_width)
+        rows = np.zeros((2, batch, frame_width, 3), dtype=np.uint8)
+        fading, changed = np.zeros((2, batch), dtype=bool)
+        frame0 = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
+        for start in range(0, len(keyframe), batch):
+            k = keyframe[start:start + batch]
+            count = len(k)
+            for key, interval in zip(keys, intervals):
+                np.take(interval, k, out=key[:count], mode='clip')
+            state0, epoch0, state1, epoch1 = keys[:, :count]
+            np.not_equal(state0, state1, out=fading[:count])
+            np.not_equal(epoch0, epoch1, out=changed[:count])
+            np.logical_or(fading[:count], changed[:count], out=fading[:count])
+
+            # The colors of each row are palette[epoch, slot], looked up in
+            # the flattened palette; it grows with the latest epoch, as for
+            # self.rows().  The epoch offsets are spread over the rows with
+            # take(), as a broadcast add allocates a temporary.
+            palette = self.palette(int(epoch1.max()) + 1)
+            slots = palette.shape[1]
+            for side, (state, epoch) in enumerate(((state1, epoch1), (state0, epoch0))):
+                np.take(self.states, state, axis=0, out=indices[side, :count], mode='clip')
+                epoch *= slots
+                np.take(epoch, spread[:count], out=offsets[side, :count], mode='clip')
+                np.add(indices[side, :count], offsets[side, :count], out=indices[side, :count])
+                np.take(palette.reshape(-1, 3), indices[side, :count], axis=0, out=rows[side, :count], mode='clip')
+
+            for index in range(count):
+                frame = np.empty_like(frame0) if ring is None else ring.next()
+                np.copyto(frame, rows[0, index])
+                if fading[index]:
+                    np.copyto(frame0, rows[1, index])
+                    keyframe_phase = phase[start + index]
+                    cv.addWeighted(frame0, (1.0 - keyframe_phase), frame, keyframe_phase, 0.0, dst=frame)
+                yield frame
+
+    def end_frames(self, lastframe, rate, ring=None):
+        # Fade from lastframe to the end color, as the perfect squares shows'
+        # end_transition().
+        seconds, slot = self.end
+        frame0 = lastframe.copy()
+        frame1 = np.zeros_like(frame0)
+        frame1[:] = self.palette(1)[0, slot]
+        keyframe_rate = 1.0 / (seconds * rate)
+        keyframe_phase = 0.0
+        while True:
+            frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0, dst=output_buffer(ring))
+            keyframe_phase += keyframe_rate
+            if keyframe_phase >= 1.0:
+                return
+            yield frame
+
+#================================================================
+# A score as a show module (see pbl/shows.py).
+
+class ScoreShow:
+    def __init__(self, score):
+        # A score file, or a description built by a show module.
+        self.filename = score if isinstance(score, str) else None
+        self.score = load(score) if isinstance(score, str) else score
+        Score(self.score)       # check the description once
+
+    def description(self, args):
+        # The description to compile for the given options.
+        return self.score
+
+    def add_arguments(self, parser):
+        parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
+        parser.add_argument( '-b', '--beats', type=beats.load, help='WAV file, or text file of beat times in seconds, to time the key frames by instead of the tempo.')
+        if self.score.get('length') is not None:
+            parser.set_defaults(length=self.score['length'])
+
+    def keyframe_interval(self, score, args):
+        return beats.keyframe_interval(score.keyframe_beats, args.tempo, args.beats)
+
+    def keyframes(self, args):
+        # The tempo-independent keyframes and their interval, for parameter sweeps.
+        score = Score(self.description(args))
+        return score.keyframe_pairs(), self.keyframe_interval(score, args)
+
+    def frames(self, args, frame_sequence=None):
+        # The requested number of frames, then the end fade if there is one.
+        score = Score(self.description(args))
+        ring = frame_ring(args)
+        count = args.length + (score.end is not None)
+        if frame_sequence is None:
+            timing = keyframes.schedule(lambda k: math.nan, self.keyframe_interval(score, args), count)
+            frame_sequence = score.render(timing[0], timing[1], ring)
+        yield from itertools.islice(frame_sequence, args.length)
+        if score.end is not None:
+            yield from score.end_frames(next(frame_sequence), output_rate(args), ring)
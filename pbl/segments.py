@@ -0,0 +1,74 @@
+# segments.py: render one long show in segments on several processes.
+
+# The frame range of the show is split into segments, each rendered and
+# encoded to a temporary part file by its own worker process.  The encoded
+# frames of the parts are then copied in order into the final file, without
+# decoding or encoding them again, so the result is byte for byte the file a
+# single process would write.
+#
+# A show can provide frame_range(args, start, stop) to generate frames start
+# to stop directly; otherwise a segment runs the show from its beginning and
+# discards the frames before its start, which still saves the encoding.  The
+# last segment runs to the end of the show, including any closing transition
+# beyond the requested length.  Shows that make random choices are seeded
+# identically in every worker.
+
+#================================================================
+# Import standard Python modules.
+import concurrent.futures
+import itertools
+import os
+import random
+import time
+
+from pbl import avi, cli, video
+
+#================================================================
+# Render one segment in a worker process.
+
+def segment_frames(show, args, start, stop):
+    if hasattr(show, 'frame_range') and args.frame_rate is None:
+        return show.frame_range(args, start, stop)
+    return itertools.islice(cli.show_frames(show, args), start, stop)
+
+def render_segment(name, argv, start, stop, basename):
+    begin = time.perf_counter()
+    show, args = cli.parse_show_args(name, argv)
+    cli.seed(args)
+    count = video.write_video_file(basename, segment_frames(show, args, start, stop), buffers=0,
+                                   calibration=args.calibration, rate=video.output_rate(args))
+    return count, time.perf_counter() - begin
+
+#================================================================
+# Render a show in segments and join them.
+
+def render_segments(name, argv, segments, workers):
+    show, args = cli.parse_show_args(name, argv)
+    if args.backend != 'png-avi':
+        raise ValueError("segments are joined as png-avi files; use render --backend for other outputs")
+    if args.seed is None:
+        argv = argv + ['--seed', str(random.randrange(1 << 32))]
+
+    bounds = [args.length * i // segments for i in range(segments)] + [None]
+    parts = [f"{args.basename}.part{i}" for i in range(segments)]
+
+    start = time.perf_counter()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(render_segment, name, argv, bounds[i], bounds[i + 1], parts[i]) for i in range(segments)]
+            for i, future in enumerate(futures):
+                count, elapsed = future.result()
+                stop = '' if bounds[i + 1] is None else bounds[i + 1]
+                print(f"Segment {i} (frames {bounds[i]}:{stop}): {count} frames in {elapsed:.2f} s")
+
+        # Copy the encoded frames into one file.
+        filename = args.basename + '.' + video.file_extension
+        count = avi.join(filename, [part + '.' + video.file_extension for part in parts],
+                         video.frame_width, video.frame_height, video.output_rate(args), video.codec_code)
+    finally:
+        for part in parts:
+            if os.path.exists(part + '.' + video.file_extension):
+                os.remove(part + '.' + video.file_extension)
+
+    print(f"Wrote {filename}, {count} frames in {segments} segments in {time.perf_counter() - start:.2f} s.")
+    return count
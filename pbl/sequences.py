@@ -0,0 +1,155 @@
+# sequences.py: shows that reveal the members of an integer sequence.
+
+# The primes, perfect squares and fibonacci shows each mark the members of an
+# integer sequence along the bridge.  A sequence show does the same for any
+# sequence: block i stands for the number start + i, and the blocks are
+# revealed one keyframe at a time, each fading in the color of a member or of
+# another number, with a member held for a few keyframes more.  Whether each
+# number on the bridge is a member is worked out for all of them at once,
+# either by a vectorized predicate
+#
+#   primes       a sieve of Eratosthenes up to the last number
+#   squares      n == isqrt(n)**2
+#   triangular   8n + 1 is a square
+#
+# or by marking the values of an increasing generator or of a file:
+#
+#   fibonacci    0, 1, 1, 2, 3, 5, ...
+#   FILE         an OEIS b-file, lines of "index value" with # comments
+#
+# The reveal is compiled to a score (see pbl/score.py), which renders the
+# frames in batches and only cross-fades the frames that change.  A new
+# sequence show takes a few lines, e.g. a module with
+#
+#   from pbl.sequences import SequenceShow
+#   show = SequenceShow(lambda n: n % 7 == 0)
+#   add_arguments, keyframes, frames = show.add_arguments, show.keyframes, show.frames
+#
+# and examples/sequence.py shows any of the named sequences or a b-file:
+#
+#   python3 -m pbl render sequence -s primes
+#   python3 -m pbl render sequence -s b000045.txt --start 0
+
+#================================================================
+# Import standard Python modules.
+import itertools
+import math
+import os
+
+# Import the numpy module.
+import numpy as np
+
+from pbl.video import frame_width
+from pbl import beats
+from pbl.score import ScoreShow
+
+#================================================================
+# Vectorized predicates over an int64 array of numbers.
+
+def is_prime(n):
+    top = max(int(n.max()) + 1, 2)
+    sieve = np.ones(top, dtype=bool)
+    sieve[:2] = False
+    for p in range(2, math.isqrt(top - 1) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = False
+    return (n >= 0) & sieve[np.maximum(n, 0)]
+
+def is_square(n):
+    # The float square root, corrected where it rounds the wrong way, for
+    # numbers below 2**62.
+    root = np.sqrt(np.maximum(n, 0)).astype(np.int64)
+    root += (root + 1) * (root + 1) <= n
+    root -= root * root > n
+    return (n >= 0) & (root * root == n)
+
+def is_triangular(n):
+    return (n >= 0) & is_square(8 * n + 1)
+
+def fibonacci_numbers():
+    a, b = 0, 1
+    while True:
+        yield a
+        a, b = b, a + b
+
+def read_bfile(filename):
+    # The values of an OEIS b-file.
+    values = []
+    with open(filename, 'r') as file:
+        for line in file:
+            fields = line.split('#', 1)[0].split()
+            if len(fields) >= 2:
+                values.append(int(fields[1]))
+    return values
+
+predicates = {'primes': is_prime, 'squares': is_square, 'triangular': is_triangular}
+generators = {'fibonacci': fibonacci_numbers}
+
+def membership(sequence, numbers):
+    # Whether each of an array of numbers is in the sequence: a name above, a
+    # predicate, or the name of a b-file.
+    numbers = np.asarray(numbers, dtype=np.int64)
+    if callable(sequence):
+        return np.asarray(sequence(numbers), dtype=bool)
+    if sequence in predicates:
+        return predicates[sequence](numbers)
+    lowest, highest = int(numbers.min()), int(numbers.max())
+    if sequence in generators:
+        values = itertools.takewhile(lambda value: value <= highest, generators[sequence]())
+    elif os.path.exists(sequence):
+        values = read_bfile(sequence)
+    else:
+        raise ValueError(f"unknown sequence {sequence}")
+    values = np.array([value for value in values if lowest <= value <= highest], dtype=np.int64)
+    return np.isin(numbers, values)
+
+#================================================================
+# The reveal as a score.
+
+bridge_blocks = frame_width // 4
+
+default_colors = {'background': [0, 0, 0], 'number': [243, 207, 130], 'member': [24, 134, 240]}
+
+def reveal_score(members, keyframe_beats=1.0, member_hold=4, colors=default_colors):
+    # One event per block, fading in its color, after a keyframe of the bridge
+    # in the background color; the end fades to the background.
+    events = [{'hold': 1}]
+    for block, member in enumerate(members.tolist()):
+        events.append({'fill': [{'blocks': [block, block + 1], 'color': 'member' if member else 'number'}],
+                       'fade': True, 'hold': 1 + member_hold * member})
+    return {'keyframe_beats': keyframe_beats, 'colors': colors, 'background': 'background', 'events': events,
+            'end': {'fade': 5.0, 'color': 'background'}}
+
+def color(text):
+    # A B,G,R option value.
+    values = [int(value) for value in text.split(',')]
+    if len(values) != 3 or not all(0 <= value <= 255 for value in values):
+        raise ValueError(f"a color is B,G,R from 0 to 255, not {text}")
+    return values
+
+#================================================================
+# A sequence as a show module (see pbl/shows.py).  Without a sequence the
+# show takes it from its -s option.
+
+class SequenceShow(ScoreShow):
+    def __init__(self, sequence=None):
+        self.sequence = sequence
+        self.score = {}
+
+    def add_arguments(self, parser):
+        parser.add_argument( '-t', '--tempo', type=float, default=120.0, help='Tempo of key frames in beats per minute.')
+        parser.add_argument( '-b', '--beats', type=beats.load, help='WAV file, or text file of beat times in seconds, to time the key frames by instead of the tempo.')
+        if self.sequence is None:
+            parser.add_argument( '-s', '--sequence', required=True,
+                                 help=f"Sequence to show: {', '.join(list(predicates) + list(generators))}, or an OEIS b-file.")
+        parser.add_argument( '--start', type=int, default=1, help='Number shown by the first block.')
+        parser.add_argument( '--hold', type=int, default=4, help='Extra keyframes to hold each member of the sequence.')
+        parser.add_argument( '--number-color', type=color, default=default_colors['number'], help='B,G,R color of the other numbers.')
+        parser.add_argument( '--member-color', type=color, default=default_colors['member'], help='B,G,R color of the members.')
+        parser.set_defaults(length=2400)
+
+    def description(self, args):
+        numbers = np.arange(args.start, args.start + bridge_blocks)
+        members = membership(self.sequence or args.sequence, numbers)
+        colors = dict(default_colors, number=args.number_color, member=args.member_color)
+        return reveal_score(members, 1.0, args.hold, colors)
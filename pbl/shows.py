@@ -0,0 +1,90 @@
+# shows.py: registry of Pausch Bridge shows.
+
+# Shows are registered by name with the path of their module and a one-line
+# description, so that listing shows does not import any of them.  A show
+# module is only imported when it is selected, and is loaded from its own
+# folder the same way as when the script is run there, so it can import its
+# sibling modules (e.g. pi/rpbtools.py).
+#
+# A show module provides:
+#
+#   add_arguments(parser)   add show-specific options to an argparse parser,
+#                           and override common defaults with set_defaults()
+#   frames(args)            generate the uint8 BGR frames to write, given the
+#                           parsed options (args.verbose, args.length, ...)
+#
+# Shows built from cross-faded keyframes (see pbl/keyframes.py) also provide
+#
+#   keyframes(args)         return the show's keyframe generator and its
+#                           keyframe interval in seconds
+#   frames(args, frame_sequence)
+#                           finish the show from the given cross-faded frames
+#                           instead of generating its own
+#
+# A show can also be a score, a JSON or YAML description compiled by
+# pbl/score.py, which provides the same functions.
+
+#================================================================
+# Import standard Python modules.
+import importlib.util
+import os
+import sys
+
+#================================================================
+# The repository root, relative to which the built-in shows are located.
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+registry = {}
+
+def register(name, path, description):
+    registry[name] = (os.path.join(root, path), description)
+
+register('primes', 'primes/primes.py', 'Primes video generator for the Pausch Bridge.')
+register('fibonacci', 'fibonacci/fibonacci.py', 'Fibonacci video generator using the colors of an image.')
+register('pythagorean', 'pythagorean.py', 'Pythagorean theorem video generator for the Pausch Bridge.')
+register('perfect_squares_part1', 'perfect_squares/perfect_squares_part1.py', 'Perfect square video generator, part 1.')
+register('perfect_squares_part2', 'perfect_squares/perfect_squares_part2.py', 'Perfect square video generator, part 2.')
+register('perfect_squares_part3', 'perfect_squares/perfect_squares_part3.py', 'Perfect square video generator, part 3.')
+register('pi', 'pi/genvideo.py', 'Digits of pi in five phases.')
+register('color_bars', 'examples/pb_color_pars.py', 'Color bar video generator for the Pausch Bridge.')
+register('composite', 'examples/composite.py', 'Several shows layered with blend modes and masks.')
+register('sequence', 'examples/sequence.py', 'The members of an integer sequence revealed along the bridge.')
+register('pythagorean_score', 'pythagorean_score.py', 'The pythagorean show as a score.')
+register('perfect_squares_part1_score', 'perfect_squares/perfect_squares_part1.json', 'Perfect square video generator, part 1, as a score.')
+register('perfect_squares_part2_score', 'perfect_squares/perfect_squares_part2.json', 'Perfect square video generator, part 2, as a score.')
+register('perfect_squares_part3_score', 'perfect_squares/perfect_squares_part3.json', 'Perfect square video generator, part 3, as a score.')
+
+#================================================================
+# Load show modules on demand.
+
+loaded = {}
+
+score_extensions = ('.json', '.yaml', '.yml')
+
+def load(name):
+    # A name that is not registered may be the path of a show module or score.
+    if name in registry:
+        path = registry[name][0]
+    elif name.endswith(score_extensions + ('.py',)) and os.path.exists(name):
+        path = os.path.abspath(name)
+    else:
+        raise KeyError(f"unknown show {name}")
+
+    if path not in loaded and path.endswith(score_extensions):
+        from pbl import score
+        loaded[path] = score.ScoreShow(path)
+    elif path not in loaded:
+        folder = os.path.dirname(path)
+        if folder not in sys.path:
+            sys.path.insert(0, folder)
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+        loaded[path] = module
+    return loaded[path]
@@ -0,0 +1,166 @@
+# simulator.py: preview a show as it looks on the bridge.
+
+# A 228x8 video frame drives the LED fixtures of the bridge's 57 panels (see
+# pi/fixtures.py), but played back as it is, or as the block averages of
+# pi/rpbtools.py, it looks nothing like the bridge at night.  The simulator
+# draws each frame as a large image of the bridge: every lit pixel of the
+# fixture layout is a point of light at its place on its panel, with a small
+# bright core and a wide soft bloom, and light adds up where the blooms
+# overlap.
+#
+# Both glows are Gaussian, so each is separable, and the fixtures lie on a
+# grid of 8 rows and 228 columns: the image of a frame F is
+#
+#   image = Vcore @ F @ Hcore.T + bloom * Vbloom @ F @ Hbloom.T
+#
+# for each color channel, where H and V hold the horizontal and vertical
+# kernel of every fixture column and row, sampled at the pixels of the image.
+# The kernels are computed once, and a batch of frames is drawn with two
+# matrix products, which splat and blur every fixture of every frame at once;
+# a full show previews several times faster than real time.
+#
+#   python3 -m pbl simulate pythagorean -l 900          # writes pythagorean_bridge.avi
+#   python3 -m pbl simulate --scale 10 pi.avi           # a rendered video file
+
+#================================================================
+# Import standard Python modules.
+import concurrent.futures
+import importlib.util
+import itertools
+import os
+import time
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+from pbl.video import frame_width, frame_height, frame_rate, codec_code, file_extension, output_rate, FrameEncoder
+from pbl import avi, cli, shows
+
+block_width = 4
+
+def fixtures_module():
+    # pi/fixtures.py, which describes the layout of the fixtures.
+    path = os.path.join(shows.root, 'pi', 'fixtures.py')
+    spec = importlib.util.spec_from_file_location('fixtures', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def gaussian(distance, sigma):
+    return np.exp(-0.5 * (distance / sigma) ** 2).astype(np.float32)
+
+#================================================================
+class BridgeSimulator:
+    def __init__(self, layout=None, scale=6, gap=2, core=0.35, glow=2.0, bloom=0.15):
+        # scale is the image pixels per video pixel, gap the image pixels
+        # between panels; core and glow are the widths (standard deviations)
+        # of the two glows in video pixels, and bloom the strength of the wide
+        # one.
+        fixtures = fixtures_module()
+        fixture_map = fixtures.bridge_map() if layout is None else fixtures.FixtureMap.compile(layout)
+        self.lit = (fixture_map.index != fixtures.UNLIT).astype(np.float32)[..., np.newaxis]
+        self.work = None
+
+        # The centers of the fixture columns and rows in the image.
+        margin = int(np.ceil(2 * glow * scale))
+        column = np.arange(frame_width)
+        x = margin + (column // block_width) * (block_width * scale + gap) + (column % block_width + 0.5) * scale
+        y = margin + (np.arange(frame_height) + 0.5) * scale
+        self.width = margin * 2 + (frame_width // block_width) * (block_width * scale + gap) - gap
+        self.height = margin * 2 + frame_height * scale
+
+        # The kernels of every column and row at every image pixel, the
+        # horizontal ones side by side and the vertical ones stacked with the
+        # bloom strength folded in.
+        px = np.arange(self.width)[:, np.newaxis] + 0.5 - x
+        py = np.arange(self.height)[:, np.newaxis] + 0.5 - y
+        self.horizontal = np.concatenate((gaussian(px, core * scale), gaussian(px, glow * scale)), axis=0).T.copy()
+        self.vertical = np.concatenate((gaussian(py, core * scale), bloom * gaussian(py, glow * scale)), axis=1)
+
+    def buffers(self, count):
+        # Work arrays for a batch of count frames, kept for the next batch.
+        if self.work is None or self.work[0] != count:
+            self.work = (count,
+                         np.zeros((frame_height * count * 3, 2 * self.width), dtype=np.float32),
+                         np.zeros((2 * frame_height, count * 3 * self.width), dtype=np.float32),
+                         np.zeros((self.height, count * 3 * self.width), dtype=np.float32))
+        return self.work[1:]
+
+    def render(self, frames, out=None):
+        # Draw an (n, 8, 228, 3) array of frames as an (n, height, width, 3)
+        # uint8 array of images.  Each matrix product covers the whole batch:
+        # the rows of every channel of every frame are blurred horizontally
+        # at once, then every column vertically.
+        count = len(frames)
+        rows, stacked, image = self.buffers(count)
+        light = np.multiply(frames, self.lit, dtype=np.float32)                # (n, 8, 228, 3)
+        light = light.transpose(1, 0, 3, 2).reshape(frame_height * count * 3, frame_width)
+        np.matmul(light, self.horizontal, out=rows)                           # (8 * n * 3, 2 * width)
+        stacked.reshape(2, frame_height, count * 3, self.width)[...] = \
+            rows.reshape(frame_height, count * 3, 2, self.width).transpose(2, 0, 1, 3)
+        np.matmul(self.vertical, stacked, out=image)                          # (height, n * 3 * width)
+        image = cv.convertScaleAbs(image).reshape(self.height, count, 3, self.width)
+        if out is None:
+            out = np.zeros((count, self.height, self.width, 3), dtype=np.uint8)
+        for i in range(count):
+            cv.merge([image[:, i, 0], image[:, i, 1], image[:, i, 2]], out[i])
+        return out[:count]
+
+    def batches(self, frame_sequence, batch=32):
+        # The images of a sequence of frames, drawn batch frames at a time.
+        # Each batch is a view of one buffer, valid until the next batch.
+        frames = np.zeros((batch, frame_height, frame_width, 3), dtype=np.uint8)
+        out = np.zeros((batch, self.height, self.width, 3), dtype=np.uint8)
+        frame_sequence = iter(frame_sequence)
+        while True:
+            count = 0
+            for frame in itertools.islice(frame_sequence, batch):
+                np.copyto(frames[count], frame)
+                count += 1
+            if count == 0:
+                return
+            yield self.render(frames[:count], out)
+
+    def images(self, frame_sequence, batch=32):
+        for images in self.batches(frame_sequence, batch):
+            yield from images
+
+#================================================================
+# Simulate a show, or a rendered video file, into a video file of images.
+
+def video_frames(filename):
+    for payload in avi.read_payloads(filename):
+        yield cv.imdecode(np.frombuffer(payload, dtype=np.uint8), cv.IMREAD_COLOR)
+
+def simulate(name, argv, basename=None, batch=32, encoders=1, verbose=True, **options):
+    # Write the images of a show, or of a rendered video file, to
+    # BASENAME_bridge.avi, PNG encoding each batch on up to encoders threads;
+    # the options are those of BridgeSimulator.
+    if name.endswith('.' + file_extension):
+        frame_sequence, rate = video_frames(name), frame_rate
+        basename = basename or os.path.splitext(name)[0]
+    else:
+        show, args = cli.parse_show_args(name, argv)
+        cli.seed(args)
+        frame_sequence, rate = cli.show_frames(show, args), output_rate(args)
+        basename = basename or args.basename
+    simulator = BridgeSimulator(**options)
+    filename = basename + '_bridge.' + file_extension
+    out = avi.AviWriter(filename, simulator.width, simulator.height, rate, codec_code)
+    encoder = FrameEncoder()
+    executor = concurrent.futures.ThreadPoolExecutor(encoders) if encoders > 1 else None
+    start = time.perf_counter()
+    try:
+        for images in simulator.batches(frame_sequence, batch):
+            for payload in encoder.encode_batch(images, executor, encoders):
+                out.write(payload)
+    finally:
+        out.close()
+        if executor is not None:
+            executor.shutdown()
+    if verbose:
+        elapsed = time.perf_counter() - start
+        print(f"Wrote {filename}, {simulator.width}x{simulator.height}, {encoder.report()}, "
+              f"{encoder.frames / elapsed:.1f} frames/sec, {encoder.frames / (elapsed * float(rate)):.1f}x real time.")
+    return encoder.frames
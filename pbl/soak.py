@@ -0,0 +1,145 @@
+# soak.py: run a show for a simulated day, faster than real time.
+
+# The bridge runs shows for days on end, so a show must keep its frame rate
+# and its memory flat however long it plays.  A soak test plays a show into a
+# sink that discards the frames, as fast as it can generate them, for a given
+# span of show time, and reports at intervals of show time:
+#
+#   frames/sec      generation speed over the last interval
+#   RSS             resident memory, and its growth since the first report
+#   drift           how many frames the start of a keyframe interval lies
+#                   from its exact time, at worst over the last interval
+#   passes          times the show has been started
+#
+#   python3 -m pbl soak primes -t 60                  # 24 hours of show time
+#   python3 -m pbl soak --hours 2 --report 10 pythagorean -l 216000
+#
+# Like 'play --loop', the soak starts a show again from its beginning each
+# time it ends, so a show's state is bounded by its --length.  The drift is
+# measured for shows built from keyframes at the classic 30 fps timing, whose
+# cross-fade adds up a float phase; with --frame-rate the keyframes are timed
+# exactly (see pbl/keyframes.py) and have no drift.
+
+#================================================================
+# Import standard Python modules.
+import itertools
+import math
+import os
+import time
+from fractions import Fraction
+
+from pbl import cli, keyframes, video
+
+#================================================================
+class NullSink:
+    def __init__(self):
+        self.frames = 0
+
+    def send(self, frame, now=None):
+        self.frames += 1
+
+def resident_bytes():
+    # The resident memory of this process, or its peak where /proc is not
+    # available.
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+#================================================================
+# Keyframe timing.  A probe passes a show's keyframes on to crossfade() and
+# notes at which frame each interval starts, compared with the first frame at
+# or after its exact start time.  crossfade() takes the next interval while
+# it produces the last frame of the one before, so the new interval starts
+# with the frame after those already delivered.
+
+class IntervalProbe:
+    def __init__(self, keyframe_sequence, keyframe_interval, delivered):
+        self.keyframes = keyframe_sequence
+        self.keyframe_interval = keyframe_interval
+        self.delivered = delivered      # function giving the frames delivered so far in the pass
+        self.k = 0
+        self.start = Fraction(0)
+        self.drift = 0                  # largest drift in frames since the last reset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        interval = keyframes.Interval(*next(self.keyframes))
+        first_frame = self.delivered() + 1 if self.k > 0 else 0
+        drift = first_frame - math.ceil(self.start * video.frame_rate)
+        self.drift = max(self.drift, abs(drift))
+        seconds = interval.seconds or keyframes.keyframe_seconds(self.keyframe_interval, self.k)
+        self.start += Fraction(seconds).limit_denominator(keyframes.max_denominator)
+        self.k += 1
+        return interval
+
+#================================================================
+def soak(name, argv, hours=24.0, report_minutes=60.0, verbose=True):
+    show, args = cli.parse_show_args(name, argv)
+    cli.seed(args)
+    rate = video.output_rate(args)
+    total = round(hours * 3600 * rate)
+    report_frames = max(1, round(report_minutes * 60 * rate))
+    probes = []
+    passes = 0
+    delivered = 0       # frames of the current pass
+
+    def one_pass():
+        # The frames of one run of the show, through a probe if it has
+        # keyframes timed by crossfade().
+        if args.frame_rate is None and hasattr(show, 'keyframes'):
+            keyframe_sequence, keyframe_interval = show.keyframes(args)
+            probe = IntervalProbe(keyframe_sequence, keyframe_interval, lambda: delivered)
+            probes.append(probe)
+            return show.frames(args, keyframes.crossfade(probe, keyframe_interval, video.frame_ring(args)))
+        return cli.show_frames(show, args)
+
+    sink = NullSink()
+    reports = []
+    begin = window_start = time.perf_counter()
+    while sink.frames < total:
+        passes += 1
+        delivered = 0
+        for frame in itertools.islice(one_pass(), total - sink.frames):
+            sink.send(frame)
+            delivered += 1
+            if sink.frames % report_frames == 0 or sink.frames == total:
+                now = time.perf_counter()
+                window = sink.frames - (reports[-1]['frames'] if reports else 0)
+                drift = max((probe.drift for probe in probes), default=None)
+                del probes[:-1]
+                for probe in probes:
+                    probe.drift = 0
+                reports.append({'frames': sink.frames, 'fps': window / (now - window_start),
+                                'rss': resident_bytes(), 'drift': drift, 'passes': passes})
+                window_start = now
+                if verbose:
+                    print(report_line(reports, rate), flush=True)
+        if delivered == 0:
+            raise ValueError(f"show {name} produced no frames")
+        # Keep the drift of the finished pass until the next report, but let
+        # its keyframe generator go.
+        for probe in probes:
+            probe.keyframes = None
+
+    elapsed = time.perf_counter() - begin
+    summary = {'frames': sink.frames, 'seconds': elapsed, 'fps': sink.frames / elapsed,
+               'min fps': min(report['fps'] for report in reports), 'max fps': max(report['fps'] for report in reports),
+               'rss growth': reports[-1]['rss'] - reports[0]['rss'], 'passes': passes,
+               'drift': max((report['drift'] for report in reports if report['drift'] is not None), default=None)}
+    if verbose:
+        print(f"Soaked {sink.frames} frames ({sink.frames / rate / 3600:.2f} hours of show) in {elapsed:.0f} s, "
+              f"{summary['fps']:.0f} frames/sec; memory grew {summary['rss growth'] / 1e6:+.1f} MB after the first report.")
+    return summary
+
+def report_line(reports, rate):
+    report = reports[-1]
+    minutes = round(report['frames'] / rate / 60)
+    drift = '-' if report['drift'] is None else f"{report['drift']} frames"
+    return (f"{minutes // 60:3d}:{minutes % 60:02d}  {report['frames']:9d} frames  {report['fps']:8.0f} frames/sec  "
+            f"RSS {report['rss'] / 1e6:7.1f} MB ({(report['rss'] - reports[0]['rss']) / 1e6:+.1f})  "
+            f"drift {drift}  {report['passes']} passes")
@@ -0,0 +1,133 @@
+# sweep.py: render one show at many tempo and length combinations.
+
+# The keyframes of a show do not depend on the tempo, so a sweep collects
+# them once, far enough ahead for the longest variant, and places the keyframe
+# table in shared memory.  Each variant is then rendered in a worker process
+# that only recomputes the cross-fade timing for its tempo, and its frame
+# rate if the sweep has several.  The frames are identical to rendering each
+# variant on its own.
+
+#================================================================
+# Import standard Python modules.
+import concurrent.futures
+import itertools
+import sys
+import time
+from multiprocessing import shared_memory
+
+# Import the numpy module.
+import numpy as np
+
+from pbl import cli, keyframes, video
+
+#================================================================
+# Keyframe tables in shared memory.  The frames and masks are shared, the
+# small per-interval arrays are passed along with their descriptions.
+
+shared_arrays = ('frames', 'masks')
+
+def share_table(table):
+    segments = []
+    description = {}
+    for key, array in table.items():
+        if key in shared_arrays:
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+            segments.append(segment)
+            description[key] = (segment.name, array.shape, array.dtype.str)
+        else:
+            description[key] = array
+    return segments, description
+
+# Set in each worker process by attach_table().
+worker_segments = []
+worker_table = None
+
+def attach_table(description):
+    global worker_table
+    worker_table = {}
+    for key, value in description.items():
+        if key in shared_arrays:
+            name, shape, dtype = value
+            segment = shared_memory.SharedMemory(name=name)
+            worker_segments.append(segment)
+            worker_table[key] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        else:
+            worker_table[key] = value
+
+#================================================================
+# Render one variant from the shared keyframe table.
+
+def variant_timing(interval_seconds, keyframe_interval, args):
+    # One frame more than the length, for shows that end with a transition
+    # from the frame after the last one.
+    if args.frame_rate is None:
+        return keyframes.schedule(interval_seconds, keyframe_interval, args.length + 1)
+    return keyframes.Timeline(interval_seconds, keyframe_interval).sample(args.frame_rate, args.length + 1)
+
+def render_variant(name, argv):
+    start = time.perf_counter()
+    show, args = cli.parse_show_args(name, argv)
+    _, keyframe_interval = show.keyframes(args)
+
+    seconds = worker_table['seconds']
+    def interval_seconds(k):
+        return seconds[k] if k < len(seconds) else None
+
+    timing = variant_timing(interval_seconds, keyframe_interval, args)
+    frame_sequence = keyframes.table_frames(worker_table, *timing, video.frame_ring(args))
+    count = video.write_video_file(args.basename, show.frames(args, frame_sequence), args.verbose,
+                                   args.buffers, args.encoders, args.calibration, video.output_rate(args), args.backend)
+    return count, time.perf_counter() - start
+
+#================================================================
+# Run a sweep.
+
+def sweep(name, tempos, lengths, options, basename, workers, rates=None):
+    show, args = cli.parse_show_args(name, options)
+    if not hasattr(show, 'keyframes'):
+        raise ValueError(f"show {name} does not provide keyframes for sweeps")
+    cli.seed(args)
+
+    # Check every variant's options and find out how many keyframe intervals
+    # each one needs, collecting them from the show on demand.
+    keyframe_sequence, _ = show.keyframes(args)
+    table = keyframes.KeyframeTable(keyframe_sequence)
+    variants = []
+    for tempo, length, rate in itertools.product(tempos, lengths, rates or [None]):
+        argv = options + ['--tempo', repr(tempo), '--length', str(length)]
+        variant = f"{basename}_t{tempo:g}_l{length}"
+        if rate is not None:
+            argv += ['--frame-rate', str(rate)]
+            variant += f"_r{float(rate):g}"
+        argv.append(variant)
+        variant_show, variant_args = cli.parse_show_args(name, argv)
+        _, keyframe_interval = variant_show.keyframes(variant_args)
+        variant_timing(table.interval_seconds, keyframe_interval, variant_args)
+        variants.append(argv)
+
+    arrays = table.arrays()
+    print(f"Collected {len(table)} keyframe intervals, {len(arrays['frames'])} distinct frames.")
+
+    segments, description = share_table(arrays)
+    failures = 0
+    start = time.perf_counter()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=attach_table,
+                                                    initargs=(description,)) as pool:
+            futures = {pool.submit(render_variant, name, argv): argv[-1] for argv in variants}
+            for future in concurrent.futures.as_completed(futures):
+                variant = futures[future]
+                try:
+                    count, elapsed = future.result()
+                    print(f"{variant}: {count} frames in {elapsed:.2f} s")
+                except Exception as error:
+                    print(f"{variant}: failed: {error!r}", file=sys.stderr)
+                    failures += 1
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+    print(f"Rendered {len(variants) - failures} of {len(variants)} variants in {time.perf_counter() - start:.2f} s.")
+    return 1 if failures else 0
@@ -0,0 +1,238 @@
+# transport.py: hand frames from a show process to a live sender process.
+
+# For live playback the show runs in its own process and passes its frames
+# through a ring of frame slots in shared memory, so that a slow frame of the
+# show never holds up the sender, which plays whatever is ready at the frame
+# rate:
+#
+#   python3 -m pbl play --process primes -t 60
+#   python3 -m pbl play --process --dummy pi      # without sending, to test
+#
+# The ring has one producer and one consumer and needs no locks.  The header
+# holds 64-bit counters, each written by only one side: the producer copies
+# a frame into slot head % slots and then advances head, and the consumer
+# copies a frame out of slot tail % slots and then advances tail.  Aligned
+# 64-bit stores are atomic, and a counter is only advanced after its slot,
+# so a side never sees a slot the other is still using.
+#
+# An underrun is a frame time at which no new frame was ready, when the
+# sender holds the previous frame; an overrun is a frame the producer could
+# not store at once because the ring was full, when it waits for the sender.
+# Overruns are expected when the show is faster than real time.  Both counts
+# are kept in the header, so either process can report them.
+#
+# While it runs, the producer beats: a thread stores the monotonic clock in
+# the header every tenth of a second, whether or not the show is producing
+# frames.  A consumer waiting for frames checks the beat, and if there has
+# been none for producer_timeout seconds, or none at all that long after it
+# started waiting, the producer has died without finishing (killed, out of
+# memory) and the consumer raises an error instead of waiting for ever.
+
+#================================================================
+# Import standard Python modules.
+import threading
+import time
+from multiprocessing import shared_memory
+
+# Import the numpy module.
+import numpy as np
+
+from pbl import cli
+from pbl.video import frame_width, frame_height
+
+#================================================================
+# Header layout, in 64-bit words.
+HEAD      = 0   # frames written by the producer
+TAIL      = 1   # frames read by the consumer
+DONE      = 2   # set by the producer after its last frame
+CLOSED    = 3   # set by the consumer when it stops reading
+UNDERRUNS = 4   # frame times with no new frame, counted by the consumer
+OVERRUNS  = 5   # frames that waited for a free slot, counted by the producer
+SLOTS     = 6
+HEARTBEAT = 7   # the producer's time.monotonic_ns() at its last beat
+header_words = 8
+
+poll_interval = 0.002       # seconds between checks of a full or empty ring
+heartbeat_interval = 0.1    # seconds between beats of the producer
+producer_timeout = 5.0      # seconds without a beat after which the producer is taken for dead
+
+class SharedFrameRing:
+    def __init__(self, slots=64, name=None):
+        # Create a ring of the given number of frame slots, or attach to the
+        # ring with the given name.
+        frame_shape = (frame_height, frame_width, 3)
+        if name is None:
+            size = 8 * header_words + slots * int(np.prod(frame_shape))
+            self.segment = shared_memory.SharedMemory(create=True, size=size)
+            self.header = np.ndarray((header_words,), dtype=np.uint64, buffer=self.segment.buf)
+            self.header[:] = 0
+            self.header[SLOTS] = slots
+        else:
+            self.segment = shared_memory.SharedMemory(name=name)
+            self.header = np.ndarray((header_words,), dtype=np.uint64, buffer=self.segment.buf)
+            slots = int(self.header[SLOTS])
+        self.name = self.segment.name
+        self.slots = slots
+        self.beating = None
+        self.frames = np.ndarray((slots,) + frame_shape, dtype=np.uint8, buffer=self.segment.buf, offset=8 * header_words)
+
+    # Producer side.
+
+    def put(self, frame):
+        # Store one frame, waiting while the ring is full.  Returns False if
+        # the consumer has stopped.
+        head = int(self.header[HEAD])
+        if head - int(self.header[TAIL]) >= self.slots:
+            self.header[OVERRUNS] += 1
+            while head - int(self.header[TAIL]) >= self.slots:
+                if self.header[CLOSED]:
+                    return False
+                time.sleep(poll_interval)
+        if self.header[CLOSED]:
+            return False
+        np.copyto(self.frames[head % self.slots], frame)
+        self.header[HEAD] = head + 1
+        return True
+
+    def finish(self):
+        self.header[DONE] = 1
+        self.stop_heartbeat()
+
+    def start_heartbeat(self):
+        if self.beating is None:
+            self.header[HEARTBEAT] = time.monotonic_ns()
+            stopping = threading.Event()
+            thread = threading.Thread(target=beat, name='ring heartbeat', daemon=True, args=(self.header, stopping))
+            thread.start()
+            self.beating = thread, stopping
+
+    def stop_heartbeat(self):
+        if self.beating is not None:
+            thread, stopping = self.beating
+            stopping.set()
+            thread.join()
+            self.beating = None
+
+    # Consumer side.
+
+    def get(self, out):
+        # Copy the next frame into out.  Returns True for a frame, False if
+        # none is ready yet, and None once the producer has finished and
+        # every frame has been read.
+        done = self.header[DONE]
+        tail = int(self.header[TAIL])
+        if tail < int(self.header[HEAD]):
+            np.copyto(out, self.frames[tail % self.slots])
+            self.header[TAIL] = tail + 1
+            return True
+        return None if done else False
+
+    def check_producer(self, since):
+        # Raise an error if the producer has not beaten for producer_timeout
+        # seconds, counting from since (a time.monotonic_ns()) if it is later
+        # than the last beat.
+        last = max(int(self.header[HEARTBEAT]), since)
+        if not self.header[DONE] and time.monotonic_ns() - last > producer_timeout * 1e9:
+            raise RuntimeError(f"the show process stopped without finishing after {int(self.header[HEAD])} frames")
+
+    def stop(self):
+        self.header[CLOSED] = 1
+
+    # Either side.
+
+    def stats(self):
+        return {'frames': int(self.header[TAIL]), 'underruns': int(self.header[UNDERRUNS]),
+                'overruns': int(self.header[OVERRUNS])}
+
+    def report(self):
+        stats = self.stats()
+        return (f"{stats['frames']} frames through a ring of {self.slots}: {stats['underruns']} underruns, "
+                f"{stats['overruns']} overruns")
+
+    def close(self):
+        # Release the arrays before the memory under them.
+        self.stop_heartbeat()
+        del self.header, self.frames
+        self.segment.close()
+
+    def unlink(self):
+        self.segment.unlink()
+
+#================================================================
+# The producer: store the frames of a sequence until it ends or the consumer
+# stops.  produce_show() runs a show in a worker process given the name of
+# the ring, optionally starting it again each time it ends; it beats from
+# the start, while the show sets up, and finishes the ring if the show fails.
+
+def beat(header, stopping):
+    # The heartbeat thread, which close() stops and joins before releasing
+    # the memory under the header.
+    while not stopping.is_set():
+        header[HEARTBEAT] = time.monotonic_ns()
+        stopping.wait(heartbeat_interval)
+
+def produce(frame_sequence, ring):
+    ring.start_heartbeat()
+    try:
+        for frame in frame_sequence:
+            if not ring.put(frame):
+                break
+    finally:
+        ring.finish()
+
+def produce_show(name, argv, ring_name, loop=False):
+    ring = SharedFrameRing(name=ring_name)
+    ring.start_heartbeat()
+    try:
+        show, args = cli.parse_show_args(name, argv)
+        cli.seed(args)
+        produce(cli.looped_frames(show, args) if loop else cli.show_frames(show, args), ring)
+    finally:
+        ring.finish()
+        ring.close()
+
+#================================================================
+# The consumer: the frames of the ring as a sequence for live.play(), which
+# takes one at each frame time.  Playback starts once prefill frames are
+# ready, or the whole show if it is shorter.  When no new frame is ready the
+# previous one is repeated as an underrun.  The frames are views of one
+# buffer, valid until the next is requested.  If the producer dies without
+# finishing, the sequence raises RuntimeError.
+
+def ring_frames(ring, prefill=None):
+    if prefill is None:
+        prefill = ring.slots // 2
+    frame = np.zeros(ring.frames.shape[1:], dtype=np.uint8)
+    start = time.monotonic_ns()
+    try:
+        while int(ring.header[HEAD]) < prefill and not ring.header[DONE]:
+            ring.check_producer(start)
+            time.sleep(poll_interval)
+        while True:
+            ready = ring.get(frame)
+            if ready is None:
+                return
+            if not ready:
+                ring.header[UNDERRUNS] += 1
+                ring.check_producer(start)
+            yield frame
+    finally:
+        ring.stop()
+
+#================================================================
+# A sender that only counts frames, to test playback without a network.
+
+class DummySender:
+    def __init__(self):
+        self.frames = 0
+        self.checksum = 0
+
+    def send(self, frame, now=None):
+        self.frames += 1
+        self.checksum = (self.checksum + int(frame.sum(dtype=np.uint64))) % (1 << 32)
+
+    def report(self):
+        return f"{self.frames} frames (checksum {self.checksum:08x}), none sent"
+
+    def close(self):
+        pass
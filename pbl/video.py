@@ -0,0 +1,266 @@
+# video.py: canonical video format and file output for Pausch Bridge shows.
+
+#================================================================
+# Import standard Python modules.
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import os
+import queue
+import threading
+
+# Import the numpy and OpenCV modules.
+import numpy as np
+import cv2 as cv
+
+
+#================================================================
+# Define the video properties using the canonical video format for the Pausch
+# Bridge lighting system.
+frame_rate   = 30
+frame_width  = 228
+frame_height = 8
+
+# Specify a format code and file format.  Frames are stored as PNG images,
+# lossless with clean block edges, in an AVI file.
+codec_code = b'png '
+file_extension = 'avi'
+
+# Blocks of flat color compress best without PNG row filters, which also
+# saves libpng from trying every filter on every row.
+png_parameters = [cv.IMWRITE_PNG_COMPRESSION, 6, cv.IMWRITE_PNG_FILTER, cv.IMWRITE_PNG_FILTER_NONE]
+
+#================================================================
+# Output frame rings.  A generator given a ring writes each frame into the
+# next of its preallocated buffers (e.g. cv.addWeighted(..., dst=ring.next()))
+# instead of allocating a new array, so a long-running show does not churn
+# the allocator at the frame rate.  A yielded frame is only valid until the
+# generator has produced len(ring) - 1 more frames, after which its buffer is
+# overwritten: a consumer that keeps frames, such as a list of them, must copy
+# them or run without a ring.  The video writer, background writer and live
+# sender all finish with a frame before asking for the next.
+
+class FrameRing:
+    def __init__(self, count=3):
+        self.buffers = np.zeros((count, frame_height, frame_width, 3), dtype=np.uint8)
+        self.index = -1
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def next(self):
+        # The buffer for the next frame.
+        self.index = (self.index + 1) % len(self.buffers)
+        return self.buffers[self.index]
+
+def frame_ring(args):
+    # The ring for a show's frames given its options, or None to allocate
+    # every frame.
+    count = getattr(args, 'ring', 0)
+    return FrameRing(count) if count else None
+
+def output_rate(args):
+    # The frame rate to generate a show's frames at: its --frame-rate, kept
+    # as the exact Fraction it was given as, or the canonical rate.
+    rate = getattr(args, 'frame_rate', None)
+    return frame_rate if rate is None else rate
+
+def output_buffer(ring):
+    # The dst argument for an OpenCV call writing a frame into a ring.
+    return None if ring is None else ring.next()
+
+#================================================================
+# Frame encoding.  Many shows hold a frame for a while or return to an earlier
+# one, so the encoder remembers the PNG payloads of recent frames, keyed on a
+# 16-byte digest of each frame, and only encodes frames it has not seen.  A
+# batch of frames can have its new frames encoded on several threads; OpenCV
+# releases the GIL while it encodes.
+
+def frame_key(frame):
+    return hashlib.blake2b(np.ascontiguousarray(frame), digest_size=16).digest()
+
+def encode_png(frame):
+    success, buffer = cv.imencode('.png', frame, png_parameters)
+    if not success:
+        raise ValueError("frame could not be encoded")
+    return buffer.tobytes()
+
+def encode_pngs(frames):
+    return [encode_png(frame) for frame in frames]
+
+class FrameEncoder:
+    def __init__(self, cache_size=256):
+        self.cache = collections.OrderedDict()  # frame digest -> payload, least recent first
+        self.cache_size = cache_size
+        self.previous = None
+        self.frames = 0     # frames encoded or reused
+        self.encoded = 0    # frames actually encoded
+        self.held = 0       # frames identical to the one before
+        self.reused = 0     # other frames found in the cache
+
+    def encode(self, frame):
+        return self.payload(frame_key(frame), frame)
+
+    def encode_batch(self, frames, executor=None, threads=1):
+        # Payloads of an array of frames, encoding the new ones in up to
+        # threads chunks on the executor.
+        keys = [frame_key(frame) for frame in frames]
+        encoded = None
+        if executor is not None:
+            new = {}
+            for key, frame in zip(keys, frames):
+                if key not in self.cache:
+                    new.setdefault(key, frame)
+            new_keys, new_frames = list(new), list(new.values())
+            size = max(1, -(-len(new) // threads))
+            chunks = [new_frames[i:i + size] for i in range(0, len(new), size)]
+            encoded = dict(zip(new_keys, itertools.chain.from_iterable(executor.map(encode_pngs, chunks))))
+        return [self.payload(key, frame, encoded) for key, frame in zip(keys, frames)]
+
+    def payload(self, key, frame, encoded=None):
+        self.frames += 1
+        if key == self.previous:
+            self.held += 1
+            return self.cache[key]
+
+        payload = self.cache.get(key)
+        if payload is None:
+            payload = encoded[key] if encoded is not None and key in encoded else encode_png(frame)
+            self.encoded += 1
+            self.cache[key] = payload
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+            self.reused += 1
+        self.previous = key
+        return payload
+
+    def report(self):
+        return (f"{self.frames} frames: {self.encoded} encoded, {self.held} held, "
+                f"{self.reused} reused from earlier frames")
+
+#================================================================
+# Background writing.  The generator copies frames into a fixed ring of
+# preallocated buffers, each holding a batch of frames, and queues each buffer
+# as it fills; a writer thread hands the buffered frames to the output backend
+# (see pbl/backends.py), which encodes and writes them in order, and returns
+# the buffers.  Handing over whole batches keeps the per-frame cost of the
+# threads small next to the encoding.  A calibration (see pbl/calibration.py)
+# is applied as a frame is copied into its buffer, in place of the copy.  When
+# every buffer is in use the generator waits, so memory stays bounded however far
+# generation runs ahead.  An error on the writer thread is raised again in
+# the generator's thread, at the next batch or at the end.
+
+class BackgroundWriter:
+    def __init__(self, out, buffers=4, encoders=1, batch=64, calibration=None):
+        self.out = out
+        self.calibration = calibration
+        self.buffers = np.zeros((buffers, batch, frame_height, frame_width, 3), dtype=np.uint8)
+        self.free = queue.Queue()
+        for index in range(1, buffers):
+            self.free.put(index)
+        self.work = queue.Queue()
+        self.encoders = encoders
+        self.executor = concurrent.futures.ThreadPoolExecutor(encoders) if encoders > 1 else None
+        self.error = None
+        self.stalls = 0                 # batches the generator waited for a free buffer
+        self.index = 0                  # buffer being filled, and its frame count
+        self.count = 0
+        self.thread = threading.Thread(target=self.run, name='video writer', daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        if self.calibration is None:
+            np.copyto(self.buffers[self.index, self.count], frame)
+        else:
+            self.calibration.apply(frame, self.buffers[self.index, self.count])
+        self.count += 1
+        if self.count == self.buffers.shape[1]:
+            self.flush()
+
+    def flush(self):
+        # Queue the buffer being filled and start on a free one.
+        if self.error is not None:
+            raise self.error
+        if self.count > 0:
+            self.work.put((self.index, self.count))
+            try:
+                self.index = self.free.get_nowait()
+            except queue.Empty:
+                self.stalls += 1
+                self.index = self.free.get()
+            self.count = 0
+
+    def run(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                break
+            index, count = item
+            try:
+                if self.error is None:
+                    self.out.write_batch(self.buffers[index, :count], self.executor, self.encoders)
+            except BaseException as error:
+                # Keep returning buffers so the generator is never left waiting.
+                self.error = error
+            finally:
+                self.free.put(index)
+
+    def close(self):
+        # Wait for the queued frames, then raise any error from the writer thread.
+        try:
+            self.flush()
+        finally:
+            self.work.put(None)
+            self.thread.join()
+            if self.executor is not None:
+                self.executor.shutdown()
+        if self.error is not None:
+            raise self.error
+
+#================================================================
+# Write a video file, by default in the default format; backend names another
+# output (see pbl/backends.py).  With buffers > 0 frames are encoded on a
+# background thread while the generator runs, which only pays off with more
+# than one CPU; by default that is when it is used.  A calibration is applied
+# to each frame on its way to the encoder.  The file is marked with the given
+# frame rate, which may be a Fraction.
+
+def write_video_file(basename, frame_sequence, verbose=False, buffers=None, encoders=1, calibration=None,
+                     rate=frame_rate, backend='png-avi'):
+    from pbl import backends
+    if buffers is None:
+        buffers = 4 if (os.cpu_count() or 1) > 1 else 0
+
+    # Open the output with a path, frame rate, and size.
+    out = backends.open_backend(backend, basename, rate)
+
+    if verbose:
+        print(f"Open {out.filename} for output.")
+
+    # Write every frame of the sequence to the output.
+    try:
+        if buffers > 0:
+            writer = BackgroundWriter(out, buffers, encoders, calibration=calibration)
+            try:
+                for frame in frame_sequence:
+                    writer.write(frame)
+            finally:
+                writer.close()
+        else:
+            calibrated = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
+            for frame in frame_sequence:
+                if calibration is not None:
+                    frame = calibration.apply(frame, calibrated)
+                out.write(frame)
+    finally:
+        # Release everything when done.
+        out.close()
+
+    if verbose:
+        print(f"Wrote {out.filename}, {out.report()}.")
+        if buffers > 0:
+            print(f"The generator waited for a free buffer {writer.stalls} times.")
+    return out.frames
@@ -11,24 +11,16 @@
 
 #================================================================
 # Import standard Python modules.
-import argparse
 import math
 
 # Import the numpy and OpenCV modules.
 import numpy as np
 import cv2 as cv
 
-#================================================================
-# Define the video properties using the canonical video format for the Pausch
-# Bridge lighting system.
-frame_rate   = 30
-frame_width  = 228
-frame_height = 8
-
-# Specify a format code and file format.  The exact combinations of codec and
-# file formats available are different for each platform.
-codec_code = cv.VideoWriter.fourcc(*'png ') # PNG images, lossless, clean block edges
-file_extension = 'avi'
+# Import the canonical video format for the Pausch Bridge lighting system.
+from pbl.video import frame_rate, frame_width, frame_height, frame_ring, output_buffer, output_rate
+from pbl.keyframes import crossfade
+from pbl import beats
 
 #================================================================
 # Define a set of colors as (B,G,R) triples of unsigned 8-bit integers.
@@ -51,14 +43,8 @@ colors = ((255,255,255),      # white
 def isSquare(x):
   return (math.isqrt(x) ** 2 == x)
 
-def frame_generator(verbose, tempo):
-    count = 0             # count of generated frames
-    frame_time = 0.0      # time stamp for generated frame in seconds
-    keyframe_phase = 0.0  # unit phase for the cross-fade, cycles over 0 to 1
-
-    frame_interval = 1.0 / frame_rate                       # seconds between video frames
-    keyframe_interval = 7.0 / tempo                        # seconds between key frames
-    keyframe_rate = 1.0 / (frame_rate * keyframe_interval)  # phase / frame
+def keyframe_generator(verbose):
+    count = 0             # count of generated keyframes
 
     # Generate two frames to use as keyframes.
     frame0 = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
@@ -76,52 +62,41 @@ def frame_generator(verbose, tempo):
     pause = 0
     
     while True:
-        # Cross-fade between successive key frames at the given tempo.  This will
-        # return a new frame of integer pixels.
-        frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0)
+        # Cross-fade between the current key frames for one keyframe interval.
+        yield frame0, frame1
+
+        # Once the second keyframe is reached, generate the successor.
+        if (squared):
+          pause -= 1
+          if (pause == 0):
+            frame0 = frame1
+            squared = False
+            square += 1
+            frame1[:,offset:offset+4,:] = colors[square % 8]
+        elif (isSquare(count+2)):
+          frame0 = frame1
+          # frame1[:,0:offset+4,:] = colors[0]
+          count += 1
+          offset += 4
+          squared = True
+          pause = 10
+        else:
+          frame0 = frame1
+          frame1[:,offset+4:offset+8,:] = colors[square % 8]
+          count += 1
+          offset += 4
 
-        # Advance the cross-fade phase.
-        keyframe_phase += keyframe_rate
-
-        # Once the second keyframe is reached, generate the successor and reset the fade.
-        if keyframe_phase >= 1.0:
-            keyframe_phase -= 1.0
-            if (squared):
-              pause -= 1
-              if (pause == 0):
-                frame0 = frame1
-                squared = False
-                square += 1
-                frame1[:,offset:offset+4,:] = colors[square % 8]
-            elif (isSquare(count+2)):
-              frame0 = frame1
-              # frame1[:,0:offset+4,:] = colors[0]
-              count += 1
-              offset += 4
-              squared = True
-              pause = 10
-            else:
-              frame0 = frame1
-              frame1[:,offset+4:offset+8,:] = colors[square % 8]
-              count += 1
-              offset += 4 
-        
-        # Return the frame and advance the generator state.
-        yield frame
-        frame_time += frame_interval
+def frame_generator(verbose, tempo, beat_times=None, ring=None):
+    keyframe_interval = beats.keyframe_interval(7.0, tempo, beat_times)  # seconds between key frames
+    return crossfade(keyframe_generator(verbose), keyframe_interval, ring)
 
 
 blank = ((0,0,0))
-def end_transition(verbose, input, lastframe, tempo):
-    count = 0                  # count of generated frames
-    frame_time = 0.0           # time stamp for generated frame in seconds
+def end_transition(verbose, input, lastframe, tempo, ring=None, rate=frame_rate):
     keyframe_phase = 0.0       # unit phase for the cross-fade, cycles over 0 to 1
-    fibonacci_sequence = [0,1] # for generating fibonacci number
-    width_generated = 0        # for tracking width generated
 
-    frame_interval = 1.0 / frame_rate                       # seconds between video frames
     keyframe_interval = 60.0 / tempo                        # seconds between key frames
-    keyframe_rate = 1.0 / (frame_rate * keyframe_interval)  # phase / frame
+    keyframe_rate = 1.0 / (rate * keyframe_interval)        # phase / frame
 
     blank_main = np.array(blank,dtype=np.uint8).reshape((1,1,3))
     blank_bars = cv.resize(blank_main, None, fx=4, fy=8, interpolation=cv.INTER_NEAREST)
@@ -132,16 +107,16 @@ def end_transition(verbose, input, lastframe, tempo):
     copies = (frame_width + bars_width) // bars_width   
     large = np.tile(blank_bars, (1,copies,1))
 
-    frame0 = lastframe[0:frame_height, 0:frame_width, :]
+    frame0 = lastframe[0:frame_height, 0:frame_width, :].copy()
     frame1 = large[0:frame_height, 0:frame_width, :]
     
     while True:
         # Cross-fade between successive key frames at the given tempo.  This will
-        # return a new frame of integer pixels.
-        frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0)
+        # return a new frame of integer pixels, or the next buffer of the ring.
+        frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0, dst=output_buffer(ring))
 
         # Advance the cross-fade phase.
-        keyframe_rate = 1 / (5 * frame_rate)
+        keyframe_rate = 1 / (5 * rate)
         keyframe_phase += keyframe_rate
 
         # Once keyframe is reached, return null.
@@ -150,49 +125,34 @@ def end_transition(verbose, input, lastframe, tempo):
         
         # Return the frame and advance the generator state.
         yield frame
-        count += 1
-        frame_time += frame_interval
 
 #================================================================
-# Write a video file in the default format.
-
-def write_video_file(basename, length, verbose, *args):
+# Show interface for the pbl command line (python3 -m pbl render perfect_squares_part2).
 
-    # Open the writer with a path, format, frame rate, and size.
-    filename = basename + '.' + file_extension
-    out = cv.VideoWriter(filename, codec_code, frame_rate, (frame_width, frame_height))
+def add_arguments(parser):
+    parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
+    parser.add_argument( '-b', '--beats', type=beats.load, help='WAV file, or text file of beat times in seconds, to time the key frames by instead of the tempo.')
+    parser.set_defaults(length=1200)
 
-    if verbose:
-        print(f"Open file {filename} for output.")
+def keyframes(args):
+    # The tempo-independent keyframes and their interval, for parameter sweeps.
+    return keyframe_generator(args.verbose), beats.keyframe_interval(7.0, args.tempo, args.beats)
 
-    # Set up the frame generator.
-    frame_sequence = frame_generator(verbose, *args)
+def frames(args, frame_sequence=None):
+    ring = frame_ring(args)
+    if frame_sequence is None:
+        frame_sequence = frame_generator(args.verbose, args.tempo, args.beats, ring)
 
-    # Synthesize some frames and write them to the stream.
-    for count in range(length):
-        out.write(next(frame_sequence))
+    # Synthesize the requested number of frames.
+    for count in range(args.length):
+        yield next(frame_sequence)
 
     #Adding End Transition
-    end_sequence = end_transition(verbose, input, next(frame_sequence), *args)
+    end_sequence = end_transition(args.verbose, input, next(frame_sequence), args.tempo, ring, output_rate(args))
 
     while True:
         next_frame = next(end_sequence)
         if next_frame is None:
             break
         else:
-            out.write(next_frame)
-
-    # Release everything when done.
-    out.release()
-
-#================================================================
-# Main script follows.
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description = """Perfect square video generator for the Pausch Bridge.""")
-    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
-    parser.add_argument( '-l', '--length', type=int, default=1200, help='Number of frames to generate (at 30 fps)')
-    parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
-    parser.add_argument( 'basename', default='perfect_squares_part2', nargs='?', help='Base name of output file (not including .mp4 extension).')
-
-    args = parser.parse_args()
-    write_video_file(args.basename, args.length, args.verbose, args.tempo)
\ No newline at end of file
+            yield next_frame
@@ -0,0 +1,35 @@
+import os
+import numpy as np
+
+
+# Precomputed 256-entry colormap tables sampled from matplotlib by
+# make_colormaps.py, so rendering does not need matplotlib.  The tables keep
+# matplotlib's float64 RGB values and its lookup rule, so colors are identical.
+
+N = 256
+tables_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'colormaps.npz')
+
+
+class Colormap:
+  def __init__(self, name, table):
+    self.name = name
+    self.table = np.ascontiguousarray(table, dtype=np.float64)        # (N,3) RGB in 0..1
+
+  def index(self, values):
+    # Map values in 0..1 to table indices the way matplotlib does: truncate
+    # values*N, with 1.0 and anything above in the last entry.
+    return np.clip(np.asarray(values, dtype=np.float64) * N, 0, N-1).astype(np.intp)
+
+  def apply(self, values):
+    # Return the RGB colors in 0..1 for an array of values, shape values.shape + (3,).
+    return np.take(self.table, self.index(values), axis=0)
+
+
+def load(filename=tables_file):
+  with np.load(filename) as tables:
+    return {name: Colormap(name, tables[name]) for name in tables.files}
+
+
+_colormaps = load()
+plasma = _colormaps['plasma']
+hsv = _colormaps['hsv']
@@ -0,0 +1,111 @@
+import json
+import os
+import numpy as np
+import cv2
+
+
+# The fixture map says which logical pixel drives each physical pixel of the
+# bridge.  Logical frames are two strips of 228 pixels, the top and bottom
+# edge, in blocks of 4 per panel; physical frames are the 8x228 video layout.
+# In each block the edge rows show their strip directly, and the second
+# column carries the strip down the side of the panel, rotated by one pixel
+# per row: rows 0-3 show top pixels 1,2,3,0 and rows 4-7 bottom pixels
+# 1,2,3,0.  Only the pixels lit in the mask exist.
+#
+# The layout description gives the mask and may replace the lit pixels of
+# single panels, e.g. a panel with a different pixel count, as rows of '#'
+# (lit) and '.' (unlit):
+#
+#   {"mask": "mask.png", "panels": {"12": ["#.#.", ".#..", ...]}}
+#
+# The map compiles to one index array into the logical pixels, saved and
+# loaded as a small .npy file, so both projections are single gathers.
+
+folder = os.path.dirname(os.path.abspath(__file__))
+
+bridge_layout = {'mask': os.path.join(folder, 'mask.png'), 'panels': {}}
+
+STRIPS, WIDTH, ROWS, BLOCK = 2, 228, 8, 4
+BLOCKS = WIDTH // BLOCK
+UNLIT = STRIPS * WIDTH   # index of the black pixel appended to the logical pixels
+
+
+def load_layout(filename):
+  # A layout description from a JSON file; its mask is relative to the file.
+  with open(filename, 'r') as file:
+    layout = json.load(file)
+  layout['mask'] = os.path.join(os.path.dirname(os.path.abspath(filename)), layout.get('mask', bridge_layout['mask']))
+  layout.setdefault('panels', {})
+  return layout
+
+
+def compile_layout(layout=bridge_layout):
+  # The index of the logical pixel of each physical pixel, UNLIT for none.
+  column = np.arange(WIDTH)
+  source = np.full((ROWS, WIDTH), UNLIT)
+  source[0] = column
+  source[ROWS-1] = WIDTH + column
+  blocks = column[1::BLOCK] - 1
+  for row in range(ROWS):
+    strip, rotation = divmod(row, ROWS // STRIPS)
+    source[row, blocks + 1] = strip * WIDTH + blocks + (rotation + 1) % BLOCK
+
+  lit = cv2.imread(layout['mask'])[..., 0] != 0
+  for block, rows in layout['panels'].items():
+    block = int(block)
+    lit[:, block*BLOCK:(block+1)*BLOCK] = [[character == '#' for character in row] for row in rows]
+  return np.where(lit, source, UNLIT).astype(np.int16)
+
+
+class FixtureMap:
+  def __init__(self, index):
+    self.index = index
+    lit = index != UNLIT
+    self.pixel_counts = lit.reshape((ROWS, BLOCKS, BLOCK)).sum(axis=(0, 2))
+
+    # Each logical pixel is read back from its first fixture.
+    self.inverse = np.full(UNLIT, ROWS * WIDTH, dtype=np.int16)
+    positions = np.flatnonzero(lit)[::-1]
+    self.inverse[index.ravel()[positions]] = positions
+
+  @classmethod
+  def compile(cls, layout=bridge_layout):
+    if isinstance(layout, str):
+      layout = load_layout(layout)
+    return cls(compile_layout(layout))
+
+  @classmethod
+  def load(cls, filename):
+    return cls(np.load(filename))
+
+  def save(self, filename):
+    np.save(filename, self.index)
+
+  def to_physical(self, frames):
+    # (..., 2, 228, C) logical frames to (..., 8, 228, C) video frames.
+    flat = frames.reshape(frames.shape[:-3] + (UNLIT,) + frames.shape[-1:])
+    padded = np.concatenate((flat, np.zeros_like(flat[..., :1, :])), axis=-2)
+    return np.take(padded, self.index, axis=-2)
+
+  def to_logical(self, video):
+    # (..., 8, 228, C) video frames to (..., 2, 228, C) logical frames, black
+    # where a logical pixel has no fixture.
+    flat = video.reshape(video.shape[:-3] + (ROWS * WIDTH,) + video.shape[-1:])
+    padded = np.concatenate((flat, np.zeros_like(flat[..., :1, :])), axis=-2)
+    return np.take(padded, self.inverse.reshape((STRIPS, WIDTH)), axis=-2)
+
+  def block_means(self, video):
+    # (..., 8, 228, C) video frames to the (..., 57, C) mean color of the
+    # fixtures of each panel.
+    blocks = video.reshape(video.shape[:-3] + (ROWS, BLOCKS, BLOCK) + video.shape[-1:])
+    return blocks.sum(axis=(-4, -2)) / self.pixel_counts[:, np.newaxis]
+
+
+_bridge_map = None
+
+def bridge_map():
+  # The map of the bridge, compiled on first use.
+  global _bridge_map
+  if _bridge_map is None:
+    _bridge_map = FixtureMap.compile()
+  return _bridge_map
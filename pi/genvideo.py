@@ -1,126 +1,269 @@
+import concurrent.futures
+from multiprocessing import shared_memory
+
 import numpy as np
-import matplotlib.cm
 import rpbtools
-import random
-
-
-plasma = matplotlib.cm.get_cmap('plasma')
-hsv = matplotlib.cm.get_cmap('hsv')
+import fixtures
+import pidigits
+from colormaps import plasma, hsv
 
 
-# phase 1
-frames1 = [np.zeros((2,228,3))]
+# Every phase has a fixed number of frames, so the whole timeline is allocated
+# once and each phase writes into its own slice of it.
+PHASE_LENGTHS = (224*8,              # rainbow sweep
+                 32*57,              # digit reveal
+                 3*32 + 32*30,       # sine-masked digit field
+                 1 + 10*100,         # 3141592653 counting
+                 5*32 + 5*32 + 3*32) # linger and fade
 
-rainbow = hsv(np.arange(8)/8)[:,:3]
+PHASE_OFFSETS = tuple(np.cumsum((0,) + PHASE_LENGTHS[:-1]))
 
-for i in range(224):
-  reshaped_rainbow = np.roll(rainbow, i).reshape((2,4,3))
-  bg = np.zeros((2,228,3))
-  bg[:,i:i+4,:] = reshaped_rainbow
-  lastidx = len(frames1) - 1
-  fade = np.linspace(0,1,8)
-  for j in range(8):
-    frames1.append(frames1[lastidx]*(1-fade[j]) + bg*fade[j])
+timeline_shape = (sum(PHASE_LENGTHS), 2, 228, 3)
 
-frames1 = np.array(frames1[1:])
 
-for i in range(17):
-  #color = np.array(plasma(i/17)[:3])
-  #color = color*0.75+0.25
-  color = hsv(i/17)[:3]
-  fade = np.linspace(1,0,32*6)
-  frames1[i*32*3:(i+2)*32*3, :, i*3*4:(i*3+1)*4, :] = np.outer(fade, color)[:,np.newaxis,np.newaxis,:]
+def allocate_timeline(filename=None):
+  # The timeline is zero-initialized, which the phases rely on for their
+  # unlit regions.  With a filename it is memory-mapped to an .npy file.
+  if filename is None:
+    return np.zeros(timeline_shape)
+  return np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=timeline_shape)
 
 
-# phase 2
-with open('pi_digits.txt', 'r') as file:
-  digits = file.read()
-digits = digits[2:]
-digits = np.array(list(map(int, digits[:57])))[::-1]
+def phase_view(timeline, phase):
+  return timeline[PHASE_OFFSETS[phase]:PHASE_OFFSETS[phase] + PHASE_LENGTHS[phase]]
 
-colors = plasma(np.linspace(0,1,10))[:,:3]
 
-frames2 = np.zeros((32*57,57,3))
+def block_view(frames):
+  # View (n,2,228,3) frames as (n,2,57,4,3) so block-level colors can be
+  # broadcast into the four pixels of each block without an np.repeat copy.
+  return frames.reshape(frames.shape[:2] + (57, 4, 3))
 
-for i in range(57):
-  d = digits[i]
 
-  # fading
-  fade = np.linspace(0,1,32)
-  colorfade = np.outer(fade, colors[d])
-  frames2[i*32:(i+1)*32,56-i,:] = colorfade
+# phase 1
+def phase1(frames1):
+  rainbow = hsv.apply(np.arange(8)/8)
+  fade = np.linspace(0,1,8)
 
-  #persistence
-  frames2[(i+1)*32:,56-i,:] = colors[d]
+  # Position i shows the flattened rainbow rolled by i in pixels i..i+3 of
+  # both rows, and fades in over 8 frames from position i-1.  Each fade only
+  # touches the window of pixels i-1..i+3; the rest of the timeline is black.
+  positions = np.arange(224)
+  rolled = rainbow.ravel()[(np.arange(24) - positions[:,np.newaxis]) % 24].reshape((224,2,4,3))
+  previous = np.zeros((224,2,5,3))
+  previous[1:,:,:4] = rolled[:-1]
+  current = np.zeros((224,2,5,3))
+  current[:,:,1:] = rolled
+  window = previous[:,np.newaxis] * (1-fade)[:,np.newaxis,np.newaxis,np.newaxis]
+  window += current[:,np.newaxis] * fade[:,np.newaxis,np.newaxis,np.newaxis]
+
+  # The window of position 0 wraps to pixel 227, which it leaves black.
+  columns = (positions[:,np.newaxis] - 1 + np.arange(5)) % 228
+  steps = frames1.reshape((224,8,2,228,3))
+  steps[positions[:,np.newaxis], :, :, columns, :] = window.transpose((0,3,1,2,4))
+
+  for i in range(17):
+    #color = plasma.apply(i/17)
+    #color = color*0.75+0.25
+    color = hsv.apply(i/17)
+    fade = np.linspace(1,0,32*6)
+    frames1[i*32*3:(i+2)*32*3, :, i*3*4:(i*3+1)*4, :] = np.outer(fade, color)[:,np.newaxis,np.newaxis,:]
 
-frames2 = np.tile(np.repeat(frames2, 4, axis=1)[:,np.newaxis,:,:], (1,2,1,1))
 
+# phase 2
+def phase2_colors():
+  # The color each block settles on, from the first 57 digits.
+  colors = plasma.apply(np.linspace(0,1,10))
+  return colors[pidigits.digits(1, 1+57)]
 
-# phase 3
 
-with open('pi_digits.txt', 'r') as file:
-  digits = file.read()
-digits = digits[2:]
-digits = list(map(int, digits[:57*100]))
-digits = np.array(digits).reshape((100,57))
-colorbg = plasma(digits/9)[:,:,:3]
-colorbg = np.repeat(colorbg, 2, axis=0)
+def phase2(frames2):
+  colors = phase2_colors()[::-1]
 
+  blocks = block_view(frames2)
+  fade = np.linspace(0,1,32)
+  for i in range(57):
+    # fading
+    colorfade = np.outer(fade, colors[i])
+    blocks[i*32:(i+1)*32,:,56-i,:,:] = colorfade[:,np.newaxis,np.newaxis,:]
 
-sinemask = (np.sin(np.linspace(0,14*np.pi,228))+1)/2
-intensity = (np.cos(np.linspace(0,9*np.pi,32*30))+1)/2
+    #persistence
+    blocks[(i+1)*32:,:,56-i,:,:] = colors[i]
 
-frames3 = []
 
-firstdestination = sinemask[np.newaxis,:,np.newaxis] * frames2[-1]
-for i in range(3*32):
-  frames3.append(frames2[-1] * (1-i/96) + firstdestination * i/96)
+def phase2_lastframe():
+  # Every block has faded in fully by the last frame of phase 2.
+  lastframe = np.zeros((2,228,3))
+  block_view(lastframe[np.newaxis])[0] = phase2_colors()[:,np.newaxis,:]
+  return lastframe
 
-for i in range(32*30):
-  bg = colorbg[i//80] * (1-(i%80)/80) + colorbg[i//80+1] * ((i%80)/80)
-  bg = np.repeat(np.repeat(bg[np.newaxis,...], 4, axis=1), 2, axis=0)
-  mask = sinemask * intensity[i]
-  frames3.append(bg*mask[np.newaxis,:,np.newaxis])
 
-frames3 = np.array(frames3)
+# phase 3
+def phase3(frames3, lastframe2):
+  digits = pidigits.digits(1, 1+57*100).reshape((100,57))
+  colorbg = plasma.apply(digits/9)
+  colorbg = np.repeat(colorbg, 2, axis=0)
 
+  sinemask = (np.sin(np.linspace(0,14*np.pi,228))+1)/2
+  intensity = (np.cos(np.linspace(0,9*np.pi,32*30))+1)/2
 
-# phase 4
+  firstdestination = sinemask[np.newaxis,:,np.newaxis] * lastframe2
+  i = np.arange(3*32)[:,np.newaxis,np.newaxis,np.newaxis]
+  frames3[:3*32] = lastframe2 * (1-i/96) + firstdestination * i/96
 
-frames4 = np.zeros((1,57,3))
-numbers = list(map(int, '3141592653'))
+  # Each block color interpolates between successive digit rows every 80
+  # frames, under a sine mask whose intensity pulses over the phase.
+  i = np.arange(32*30)
+  weight = ((i%80)/80)[:,np.newaxis,np.newaxis]
+  bg = colorbg[i//80] * (1-weight) + colorbg[i//80+1] * weight
+  mask = intensity[:,np.newaxis] * sinemask
+  np.multiply(bg[:,np.newaxis,:,np.newaxis,:], mask.reshape((32*30,1,57,4,1)), out=block_view(frames3[3*32:]))
 
-curridx = 8
-for i in range(10):
-  repeating = frames4[-1]
-  newbigsegment = np.repeat(frames4[-1:], 100, axis=0)
-  color = np.array(hsv(i/10)[:3])
-  for j in range(numbers[i]):
-    start = int(j/numbers[i]*32)
-    end = int((j+1)/numbers[i]*32)
-    newbigsegment[64+start:64+end, curridx+j] = np.outer(np.linspace(0,1,end-start), color)
-    newbigsegment[64+end:, curridx+j] = color
-  curridx += numbers[i] + 1
-  frames4 = np.concatenate((frames4, newbigsegment), axis=0)
 
-frames4 = np.repeat(np.repeat(frames4[:,np.newaxis,:,:], 4, axis=2), 2, axis=1)
+# phase 4
+def phase4_digits():
+  # (digit, first block, color) of each counted digit of 3141592653, with one
+  # unlit block between the groups.
+  numbers = list(map(int, '3141592653'))
+  firstblocks = 8 + np.cumsum([0] + [n + 1 for n in numbers[:-1]])
+  return [(numbers[i], firstblocks[i], hsv.apply(i/10)) for i in range(10)]
+
+
+def phase4(frames4):
+  blocks = block_view(frames4)
+
+  # Frame 0 is the blank starting frame; each digit then adds a segment of 100
+  # frames that starts as a copy of the last frame of the previous segment.
+  for i, (number, curridx, color) in enumerate(phase4_digits()):
+    newbigsegment = blocks[1+i*100:1+(i+1)*100]
+    newbigsegment[:] = blocks[i*100]
+    for j in range(number):
+      start = int(j/number*32)
+      end = int((j+1)/number*32)
+      newbigsegment[64+start:64+end, :, curridx+j] = np.outer(np.linspace(0,1,end-start), color)[:,np.newaxis,np.newaxis,:]
+      newbigsegment[64+end:, :, curridx+j] = color
+
+
+def phase4_lastframe():
+  # Every counted block holds its color by the last frame of phase 4.
+  lastframe = np.zeros((2,228,3))
+  blocks = block_view(lastframe[np.newaxis])[0]
+  for number, curridx, color in phase4_digits():
+    blocks[:, curridx:curridx+number] = color
+  return lastframe
 
 
 # final lingering and fade
-
-frames5_1 = np.repeat(frames4[-1:], 5*32, axis=0)
-frames5_2 = np.einsum('a,bcd->abcd', np.linspace(1,0,5*32), frames4[-1])
-frames5_3 = np.zeros((3*32,2,228,3))
-frames5 = np.concatenate((frames5_1, frames5_2, frames5_3), axis=0)
-
-
-# combine
-
-frames = np.concatenate((frames1, frames2, frames3, frames4, frames5), axis=0)
-
-
-# convert to video
-video = rpbtools.array2video(frames)
-rpbtools.visualize_video(video)
-rpbtools.save_video('pi_allparts.avi', video)
-
+def phase5(frames5, lastframe4):
+  frames5[:5*32] = lastframe4
+  np.multiply(np.linspace(1,0,5*32)[:,np.newaxis,np.newaxis,np.newaxis], lastframe4, out=frames5[5*32:2*5*32])
+  # the remaining 3*32 frames stay black
+
+
+# Each phase depends only on its boundary input, the last frame of the
+# phase before it, which is computed directly rather than taken from the
+# timeline.  The phases can therefore be generated in any order or at once.
+def render_phase(timeline, phase):
+  frames = phase_view(timeline, phase)
+  if phase == 0:
+    phase1(frames)
+  elif phase == 1:
+    phase2(frames)
+  elif phase == 2:
+    phase3(frames, phase2_lastframe())
+  elif phase == 3:
+    phase4(frames)
+  else:
+    phase5(frames, phase4_lastframe())
+
+
+def build_timeline(timeline, workers=1):
+  if workers > 1:
+    return build_timeline_parallel(timeline, workers)
+  for phase in range(len(PHASE_LENGTHS)):
+    render_phase(timeline, phase)
+  return timeline
+
+
+# The parallel build runs the phases in worker processes, which write their
+# frames straight into one timeline in shared memory.  A new shared memory
+# segment is zero-filled like np.zeros.  The longest phases are submitted
+# first so they do not end up last in a worker's queue.
+def render_shared_phase(name, phase):
+  segment = shared_memory.SharedMemory(name=name)
+  try:
+    render_phase(np.ndarray(timeline_shape, buffer=segment.buf), phase)
+  finally:
+    segment.close()
+
+
+def build_timeline_parallel(timeline, workers):
+  segment = shared_memory.SharedMemory(create=True, size=timeline.nbytes)
+  try:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+      order = sorted(range(len(PHASE_LENGTHS)), key=lambda phase: -PHASE_LENGTHS[phase])
+      for future in [pool.submit(render_shared_phase, segment.name, phase) for phase in order]:
+        future.result()
+    timeline[:] = np.ndarray(timeline_shape, buffer=segment.buf)
+  finally:
+    segment.close()
+    segment.unlink()
+  return timeline
+
+
+# show interface for the pbl command line (python3 -m pbl render pi)
+def add_arguments(parser):
+  parser.add_argument('--phase-workers', type=int, default=1, help='Number of processes generating the phases (default 1).')
+  parser.add_argument('--layout', help='Fixture layout description (.json) or compiled fixture map (.npy) instead of the bridge.')
+  parser.set_defaults(length=sum(PHASE_LENGTHS), basename='pi_allparts')
+
+
+def fixture_map(layout):
+  if layout is None:
+    return None
+  if layout.endswith('.npy'):
+    return fixtures.FixtureMap.load(layout)
+  return fixtures.FixtureMap.compile(layout)
+
+
+def frames(args):
+  return frame_range(args, 0, args.length)
+
+
+def frame_range(args, start, stop):
+  # Only the requested part of the timeline is converted to video, so
+  # segments of the show can be rendered independently.
+  stop = args.length if stop is None else min(stop, args.length)
+  timeline = build_timeline(allocate_timeline(), getattr(args, 'phase_workers', 1))
+  layout = fixture_map(getattr(args, 'layout', None))
+  count = getattr(args, 'ring', 0)
+  if not count:
+    video = rpbtools.array2video(timeline[start:stop], layout)
+    video = (video*255).astype(np.uint8)
+    for frame in video:
+      yield frame[...,::-1]
+    return
+
+  # With --ring, each frame is projected, scaled and converted on its own
+  # into the next of count preallocated buffers, truncating like astype,
+  # instead of converting the whole video at once (see FrameRing in
+  # pbl/video.py for their lifetime).  The projection is the gather of
+  # FixtureMap.to_physical() from a padded copy of the frame.
+  index = (layout or fixtures.bridge_map()).index.astype(np.intp)
+  ring = np.zeros((count, fixtures.ROWS, fixtures.WIDTH, 3), dtype=np.uint8)
+  padded = np.zeros((fixtures.UNLIT + 1, 3))
+  scaled = np.empty((fixtures.ROWS, fixtures.WIDTH, 3))
+  for i, frame in enumerate(timeline[start:stop]):
+    np.copyto(padded[:fixtures.UNLIT], frame.reshape(fixtures.UNLIT, 3))
+    np.take(padded, index, axis=0, out=scaled, mode='clip')
+    np.multiply(scaled, 255, out=scaled)
+    np.copyto(ring[i % count], scaled[...,::-1], casting='unsafe')
+    yield ring[i % count]
+
+
+if __name__ == '__main__':
+  timeline = build_timeline(allocate_timeline())
+
+  # convert to video
+  video = rpbtools.array2video(timeline)
+  rpbtools.visualize_video(video)
+  rpbtools.save_video('pi_allparts.avi', video)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+# make_colormaps.py: regenerate colormaps.npz from matplotlib.
+#
+# This is run offline whenever a colormap is added; the render path only
+# loads the precomputed tables through colormaps.py and never imports
+# matplotlib.
+import os
+import numpy as np
+import matplotlib
+
+
+names = ('plasma', 'hsv')
+tables_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'colormaps.npz')
+
+
+if __name__ == '__main__':
+  tables = {}
+  for name in names:
+    cmap = matplotlib.colormaps[name].resampled(256)
+    # Integer indices select the lookup table entries exactly.
+    tables[name] = cmap(np.arange(256))[:,:3]
+  np.savez(tables_file, **tables)
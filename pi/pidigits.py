@@ -0,0 +1,176 @@
+import os
+import sys
+import math
+import tempfile
+import numpy as np
+
+
+# The digits of pi are kept as one uint8 per digit in an .npy store, which is
+# memory-mapped so any range of digits can be served without parsing text.
+# Position 0 is the leading 3, position 1 is the first decimal place.
+
+datadir = os.path.dirname(os.path.abspath(__file__))
+text_file = os.path.join(datadir, 'pi_digits.txt')
+store_file = os.path.join(datadir, 'pi_digits.npy')
+
+
+def temporary_file(store_filename):
+  # A new temporary file next to the store.  Each process writes its own, so
+  # processes that convert or extend the same store at once never share a
+  # file, and whichever replaces the store last leaves a whole one.
+  folder = os.path.dirname(os.path.abspath(store_filename))
+  with tempfile.NamedTemporaryFile(dir=folder, prefix=os.path.basename(store_filename) + '.',
+                                   suffix='.tmp', delete=False) as file:
+    return file.name
+
+
+def replace_store(temp_filename, store_filename, write):
+  # Write the store into the temporary file and move it into place.
+  try:
+    write(temp_filename)
+    os.replace(temp_filename, store_filename)
+  except BaseException:
+    if os.path.exists(temp_filename):
+      os.remove(temp_filename)
+    raise
+
+
+def convert(text_filename, store_filename, chunk_size=1<<24):
+  # Convert a text file of digits (e.g. '3.1415...') to an .npy store.  The
+  # text is read in chunks so arbitrarily large digit files convert in bounded
+  # memory; anything that is not a digit ('.', whitespace) is dropped.
+  def chunks():
+    with open(text_filename, 'rb') as file:
+      while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+          return
+        chunk = np.frombuffer(chunk, dtype=np.uint8)
+        yield chunk[(chunk >= ord('0')) & (chunk <= ord('9'))] - ord('0')
+
+  def write(temp_filename):
+    count = sum(len(chunk) for chunk in chunks())
+    store = np.lib.format.open_memmap(temp_filename, mode='w+', dtype=np.uint8, shape=(count,))
+    position = 0
+    for chunk in chunks():
+      store[position:position+len(chunk)] = chunk
+      position += len(chunk)
+    store.flush()
+    del store
+
+  replace_store(temporary_file(store_filename), store_filename, write)
+
+
+def compute_digits(count, guard=10):
+  # Compute the first count digits of pi with the Chudnovsky series, using
+  # binary splitting on Python integers.  This is exact but roughly quadratic
+  # in count (about a minute for a million digits), so it is meant for
+  # extending a store once, not for per-show use.
+  C3_24 = 640320**3 // 24
+
+  def split(a, b):
+    if b - a == 1:
+      if a == 0:
+        Pab = Qab = 1
+      else:
+        Pab = (6*a-5) * (2*a-1) * (6*a-1)
+        Qab = a*a*a * C3_24
+      Tab = Pab * (13591409 + 545140134*a)
+      if a & 1:
+        Tab = -Tab
+      return Pab, Qab, Tab
+    m = (a + b) // 2
+    Pam, Qam, Tam = split(a, m)
+    Pmb, Qmb, Tmb = split(m, b)
+    return Pam*Pmb, Qam*Qmb, Qmb*Tam + Pam*Tmb
+
+  places = count - 1 + guard
+  P, Q, T = split(0, places // 14 + 2)
+  scale = 10 ** places
+  scaled_pi = (426880 * math.isqrt(10005 * scale * scale) * Q) // T
+
+  if hasattr(sys, 'set_int_max_str_digits'):
+    limit = sys.get_int_max_str_digits()
+    sys.set_int_max_str_digits(0)
+  text = str(scaled_pi)[:count]
+  if hasattr(sys, 'set_int_max_str_digits'):
+    sys.set_int_max_str_digits(limit)
+
+  return np.frombuffer(text.encode('ascii'), dtype=np.uint8) - ord('0')
+
+
+class DigitStore:
+  def __init__(self, store_filename=store_file, text_filename=text_file, generate=False):
+    # The store is (re)built from the text file when it is missing or older.
+    # With generate=True, requests past the end of the store extend it with
+    # computed digits, which are saved so they are only computed once.
+    self.store_filename = store_filename
+    self.text_filename = text_filename
+    self.generate = generate
+
+    if text_filename is not None and os.path.exists(text_filename):
+      if (not os.path.exists(store_filename) or
+          os.path.getmtime(store_filename) < os.path.getmtime(text_filename)):
+        convert(text_filename, store_filename)
+    self.store = np.load(store_filename, mmap_mode='r')
+
+  def __len__(self):
+    return len(self.store)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      start, stop, step = index.start or 0, index.stop, index.step
+      if stop is None:
+        stop = len(self.store)
+      return self.digits(start, stop)[::step]
+    if index >= len(self.store):
+      self.extend(index + 1)
+    return int(self.store[index])
+
+  def digits(self, start, stop):
+    # Return digits start..stop-1 as a uint8 array.
+    if stop > len(self.store):
+      self.extend(stop)
+    return np.array(self.store[start:stop])
+
+  def stream(self, start=0, chunk_size=1<<16):
+    # Yield successive chunks of digits from start on, extending the store as
+    # needed when generation is enabled.
+    while self.generate or start < len(self.store):
+      stop = start + chunk_size
+      if not self.generate:
+        stop = min(stop, len(self.store))
+      yield self.digits(start, stop)
+      start = stop
+
+  def extend(self, count):
+    if not self.generate:
+      raise IndexError(f"{self.store_filename} only holds {len(self.store)} digits of pi")
+
+    # Grow geometrically so that streaming past the end does not recompute the
+    # series for every chunk.
+    count = max(count, 2 * len(self.store))
+    digits = compute_digits(count)
+    if not np.array_equal(digits[:len(self.store)], self.store):
+      raise ValueError(f"{self.store_filename} does not agree with the computed digits of pi")
+
+    def write(temp_filename):
+      with open(temp_filename, 'wb') as file:
+        np.save(file, digits)
+
+    del self.store
+    replace_store(temporary_file(self.store_filename), self.store_filename, write)
+    self.store = np.load(self.store_filename, mmap_mode='r')
+
+
+_default_store = None
+
+def default_store():
+  global _default_store
+  if _default_store is None:
+    _default_store = DigitStore()
+  return _default_store
+
+
+def digits(start, stop):
+  return default_store().digits(start, stop)
@@ -1,39 +1,24 @@
 import numpy as np
 import cv2
+import fixtures
 
 
-def array2video(frames):
+def array2video(frames, fixture_map=None):
+  # Project (n,2,228,3) logical frames onto the (n,8,228,3) pixels of the
+  # bridge, by default through its compiled fixture map (see fixtures.py).
   assert(frames.shape[1:] == (2,228,3))
-  numframes = len(frames)
+  if fixture_map is None:
+    fixture_map = fixtures.bridge_map()
+  return fixture_map.to_physical(frames)
 
-  video = np.zeros((numframes, 8, 228, 3))
 
-  for i in range(len(frames)):
-    for b in range(57):
-      topseq = frames[i,0,b*4:(b+1)*4,:]
-      bottomseq = frames[i,1,b*4:(b+1)*4,:]
 
-      video[i,0,b*4:(b+1)*4,:] = topseq
-      video[i,0:4,b*4+1,:] = np.roll(topseq, -1, axis=0)
 
-      video[i,7,b*4:(b+1)*4,:] = bottomseq
-      video[i,4:8,b*4+1,:] = np.roll(bottomseq, -1, axis=0)
 
-  mask = cv2.cvtColor(cv2.imread('mask.png'), cv2.COLOR_BGR2RGB)
-  mask = (mask[np.newaxis, :, :] != 0)
-  video *= mask
-
-  return video
-
-
-
-
-
-def visualize_video(video):
-  num_pixels = np.array([4,4,4,4,6,8,8,8,8,6,5,6] + [8]*35 + [6,5,8,8,8,8,8,8,4,8])
-  horizontal_sum = video[:,:,0::4,:] + video[:,:,1::4,:] + video[:,:,2::4,:] + video[:,:,3::4,:]
-  vertical_sum = np.sum(horizontal_sum, axis=1)
-  avg_video = vertical_sum[:,np.newaxis,:,:] / num_pixels[np.newaxis,np.newaxis,:,np.newaxis]
+def visualize_video(video, fixture_map=None):
+  if fixture_map is None:
+    fixture_map = fixtures.bridge_map()
+  avg_video = fixture_map.block_means(video)[:,np.newaxis,:,:]
   resized_video = np.repeat(np.repeat(avg_video, 10, axis=1), 4, axis=2)
 
   fourcc = cv2.VideoWriter_fourcc(*'png ')
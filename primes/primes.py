@@ -11,24 +11,15 @@
 
 #================================================================
 # Import standard Python modules.
-import argparse
-import math
+import itertools
 
-# Import the numpy and OpenCV modules.
+# Import the numpy module.
 import numpy as np
-import cv2 as cv
 
-#================================================================
-# Define the video properties using the canonical video format for the Pausch
-# Bridge lighting system.
-frame_rate   = 30
-frame_width  = 228
-frame_height = 8
-
-# Specify a format code and file format.  The exact combinations of codec and
-# file formats available are different for each platform.
-codec_code = cv.VideoWriter.fourcc(*'png ') # PNG images, lossless, clean block edges
-file_extension = 'avi'
+# Import the canonical video format for the Pausch Bridge lighting system.
+from pbl.video import frame_width, frame_height, frame_ring
+from pbl.keyframes import crossfade
+from pbl import beats
 
 #================================================================
 # Define a set of colors as (B,G,R) triples of unsigned 8-bit integers.
@@ -42,16 +33,11 @@ colors = ((255, 255, 255), #white
           (0, 0, 0), #black
           )
 #================================================================
-# Generate successive frames of the video sequence.
+# Generate successive pairs of keyframes to cross-fade between.  These do not
+# depend on the tempo.
 
-def frame_generator(verbose, tempo):
-    count = 0             # count of generated frames
-    frame_time = 0.0      # time stamp for generated frame in seconds
-    keyframe_phase = 0.0  # unit phase for the cross-fade, cycles over 0 to 1
-
-    frame_interval = 1.0 / frame_rate                       # seconds between video frames
-    keyframe_interval = 10.0 / tempo                        # seconds between key frames
-    keyframe_rate = 1.0 / (frame_rate * keyframe_interval)  # phase / frame
+def keyframe_generator(verbose):
+    count = 0             # count of generated keyframes
 
     # Generate two frames to use as keyframes.
     frame0 = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
@@ -71,64 +57,46 @@ def frame_generator(verbose, tempo):
     multiple = 2
     
     while True:
-        # Cross-fade between successive key frames at the given tempo.  This will
-        # return a new frame of integer pixels.
-        frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0)
-
-        # Advance the cross-fade phase.
-        keyframe_phase += keyframe_rate
-
-        # Once the second keyframe is reached, generate the successor and reset the fade.
-        if keyframe_phase >= 1.0:
-            keyframe_phase -= 1.0
-            frame0 = frame1
-            if (current_prime*multiple*offset <= frame_width):
-              print(str(current_prime) + " " + str(multiple))
-              frame1[:,current_prime*multiple*offset:current_prime*multiple*offset+offset,:] = colors[prime_index+1]
-              multiple += 1
-              count += 1
-            else:
-                prime_index += 1
-                if prime_index >= len(primes):
-                    break
-                current_prime = primes[prime_index]
-                count += 1
-                multiple = 2
-        
-        # Return the frame and advance the generator state.
-        yield frame
-        frame_time += frame_interval
+        # Cross-fade between the current key frames for one keyframe interval.
+        yield frame0, frame1
+
+        # Once the second keyframe is reached, generate the successor.
+        frame0 = frame1
+        if (current_prime*multiple*offset <= frame_width):
+          if verbose:
+            print(str(current_prime) + " " + str(multiple))
+          frame1[:,current_prime*multiple*offset:current_prime*multiple*offset+offset,:] = colors[prime_index+1]
+          multiple += 1
+          count += 1
+        else:
+            prime_index += 1
+            if prime_index >= len(primes):
+                break
+            current_prime = primes[prime_index]
+            count += 1
+            multiple = 2
 
 #================================================================
-# Write a video file in the default format.
-
-def write_video_file(basename, length, verbose, *args):
-
-    # Open the writer with a path, format, frame rate, and size.
-    filename = basename + '.' + file_extension
-    out = cv.VideoWriter(filename, codec_code, frame_rate, (frame_width, frame_height))
-
-    if verbose:
-        print(f"Open file {filename} for output.")
-
-    # Set up the frame generator.
-    frame_sequence = frame_generator(verbose, *args)
-
-    # Synthesize some frames and write them to the stream.
-    for count in range(length):
-        out.write(next(frame_sequence))
+# Generate successive frames of the video sequence.
 
-    # Release everything when done.
-    out.release()
+def frame_generator(verbose, tempo, beat_times=None, ring=None):
+    keyframe_interval = beats.keyframe_interval(10.0, tempo, beat_times)  # seconds between key frames
+    return crossfade(keyframe_generator(verbose), keyframe_interval, ring)
 
 #================================================================
-# Main script follows.
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description = """Primes video generator for the Pausch Bridge.""")
-    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
-    parser.add_argument( '-l', '--length', type=int, default=480, help='Number of frames to generate (at 30 fps)')
-    parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
-    parser.add_argument( 'basename', default='primes', nargs='?', help='Base name of output file (not including .mp4 extension).')
+# Show interface for the pbl command line (python3 -m pbl render primes).
 
-    args = parser.parse_args()
-    write_video_file(args.basename, args.length, args.verbose, args.tempo)
\ No newline at end of file
+def add_arguments(parser):
+    parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
+    parser.add_argument( '-b', '--beats', type=beats.load, help='WAV file, or text file of beat times in seconds, to time the key frames by instead of the tempo.')
+
+def keyframes(args):
+    # The tempo-independent keyframes and their interval, for parameter sweeps.
+    return keyframe_generator(args.verbose), beats.keyframe_interval(10.0, args.tempo, args.beats)
+
+def frames(args, frame_sequence=None):
+    # Synthesize the requested number of frames, or fewer if the show ends first.
+    ring = frame_ring(args)
+    if frame_sequence is None:
+        frame_sequence = frame_generator(args.verbose, args.tempo, args.beats, ring)
+    return itertools.islice(frame_sequence, args.length)
@@ -11,25 +11,16 @@
 
 #================================================================
 # Import standard Python modules.
-import argparse
-import math
+import itertools
 import random
 
-# Import the numpy and OpenCV modules.
+# Import the numpy module.
 import numpy as np
-import cv2 as cv
 
-#================================================================
-# Define the video properties using the canonical video format for the Pausch
-# Bridge lighting system.
-frame_rate   = 30
-frame_width  = 228
-frame_height = 8
-
-# Specify a format code and file format.  The exact combinations of codec and
-# file formats available are different for each platform.
-codec_code = cv.VideoWriter.fourcc(*'png ') # PNG images, lossless, clean block edges
-file_extension = 'avi'
+# Import the canonical video format for the Pausch Bridge lighting system.
+from pbl.video import frame_width, frame_height, frame_ring
+from pbl.keyframes import crossfade
+from pbl import beats
 
 #================================================================
 # Define a set of colors as (B,G,R) triples of unsigned 8-bit integers.
@@ -39,8 +30,6 @@ colors = ((255, 255, 0),      # yellow
           (0, 255, 0)         #green
           )
 #================================================================
-# Generate successive frames of the video sequence.
-
 def random_color():
     r = random.randint(0,255)
     g = random.randint(0,255)
@@ -58,135 +47,131 @@ def blend(x, y):
     r3 = (r1 + r2)/2
     return (b3,g3,r3)
 
-def frame_generator(verbose, tempo):
-    count = 0             # count of generated frames
-    frame_time = 0.0      # time stamp for generated frame in seconds
-    keyframe_phase = 0.0  # unit phase for the cross-fade, cycles over 0 to 1
-
-    frame_interval = 1.0 / frame_rate                       # seconds between video frames
-    keyframe_interval = 5.0 / tempo                        # seconds between key frames
-    keyframe_rate = 1.0 / (frame_rate * keyframe_interval)  # phase / frame
-
-    # Generate two frames to use as keyframes.
-    frame0 = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
-
-    # Fill the frames with the first two colors.
-   
-    color0 = random_color()
-    color1 = random_color()
-    color2 = blend(color0, color1)
-
-  
-    offset = 4
-    pause = 0
-    restart = False
-
-    side1 = 3
-    side2 = 4
-   
-
-    block1 = (side1*offset)
-
-
-    frame0[:,:,:] = (255,255,255)
-    frame0[:, 32:block1 + 32,:] = color0
-
-    frame1 = frame0
-    frame1[:,48:64,:] = color1
-
-    frame1[:,(block1 + offset + 32):(block1 + offset + (side2 * offset) + 8),:] = color1
-    
-    while True:
-        # Cross-fade between successive key frames at the given tempo.  This will
-        # return a new frame of integer pixels.
-        frame = cv.addWeighted(frame0, (1.0 - keyframe_phase), frame1, keyframe_phase, 0.0)
-
-        # Advance the cross-fade phase.
-        keyframe_phase += keyframe_rate
-
-        # Once the second keyframe is reached, generate the successor and reset the fade.
-        if keyframe_phase >= 1.0:
-            keyframe_phase -= 1.0
-
-            if (pause == 0 and restart):
-                frame0[:,:,:] = (255,255,255)
-                frame1[:,:,:] = (255,255,255)
-
-                frame0[:,32:44,:] = color0
-                frame1 = frame0
-                frame1[:,48:64,:] = color1
-
-                restart = False
-
-            if (pause == 10):
-                squared1 = (side1 ** 2) * offset
-                squared2 = (side2 ** 2) * offset
-
-
-                frame0[:,32:squared1 + 32,:] = color0
-                frame1[:,(squared1 + offset + 32):((squared1 + offset + 32) + squared2), :] = color1
-
-            
-            if (pause == 20):
-                side3 = (side1 ** 2) + (side2 ** 2)
-                frame0[:,:,:] = (255,255,255)
-                frame1[:,:,:] = (255,255,255)
-                frame1[:, 32:side3*offset + 32,:] = color2
-
-
-            if (pause == 30):
-                side3 = int(side3 ** (1/2))
-                frame1[:,:,:] = (255,255,255)
-                frame1[:, 32:side3*offset + 32,:] = color2
-
-                pause = 0
-                restart = True
-
-                color0 = random_color()
-                color1 = random_color()
-                color2 = blend(color0, color1)
-
-
-
-            pause += 1
-  
-        count += 1
-         
-        
-        # Return the frame and advance the generator state.
-        yield frame
-        frame_time += frame_interval
-
 #================================================================
-# Write a video file in the default format.
-
-def write_video_file(basename, length, verbose, *args):
+# The triangles.  The show draws each primitive Pythagorean triple (a, b, c)
+# as columns of color starting 8 blocks in: the sides a and b, a block per
+# unit, their squares, the square of the hypotenuse c*c, and c itself, each
+# held for 10 keyframes, then moves on to the next triple with new colors.
+# All three squares of a triple are drawn at one scale, a block per unit of
+# area as far as they fit and down to a pixel column per unit, so that the
+# squares of the sides always add up to the square of the hypotenuse on the
+# bridge; the triples whose squares do not fit even then are left out.  The
+# triples are shown smallest first, and after the last the show starts again.
+
+block_width = 4
+bridge_blocks = frame_width // block_width
+first_block = 8
+phase_keyframes = 10
+
+def primitive_triples(limit):
+    # The primitive triples with hypotenuse up to limit, by Euclid's formula:
+    # a = m*m - n*n, b = 2*m*n, c = m*m + n*n for coprime m > n of different
+    # parity, ordered by hypotenuse.
+    m, n = np.meshgrid(np.arange(2, limit), np.arange(1, limit))
+    m, n = m.ravel(), n.ravel()
+    keep = (n < m) & ((m - n) % 2 == 1) & (np.gcd(m, n) == 1) & (m * m + n * n <= limit)
+    m, n = m[keep], n[keep]
+    a, b, c = m * m - n * n, 2 * m * n, m * m + n * n
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    order = np.lexsort((a, c))
+    return a[order], b[order], c[order]
+
+def triangle_schedule():
+    # The keyframes of every triple that fits as rows of color slots, one
+    # per pixel column (0 white, 1 and 2 the sides' colors, 3 their blend),
+    # in a (triples, 4, columns) array, the triples, and the columns per unit
+    # of area of each triple's squares.
+    room = (bridge_blocks - first_block - 1) * block_width     # columns, less a block between the squares
+    a, b, c = primitive_triples(int(np.sqrt(room)))
+    scale = np.minimum(block_width, room // (c * c))
+    fits = (scale >= 1) & ((a + b) * block_width <= room)
+    a, b, c, scale = a[fits], b[fits], c[fits], scale[fits]
+
+    columns = np.arange(frame_width) - first_block * block_width
+    def span(start, width):
+        return (columns >= start[:, np.newaxis]) & (columns < (start + width)[:, np.newaxis])
+    zero = np.zeros_like(a)
+    side1, side2 = a * block_width, b * block_width
+    square1, square2 = a * a * scale, b * b * scale
+    slots = np.zeros((len(a), 4, frame_width), dtype=np.intp)
+    slots[:, 0] = 1 * span(zero, side1) + 2 * span(side1 + block_width, side2)
+    slots[:, 1] = 1 * span(zero, square1) + 2 * span(square1 + block_width, square2)
+    slots[:, 2] = 3 * span(zero, c * c * scale)
+    slots[:, 3] = 3 * span(zero, c * block_width)
+    return slots, (a, b, c), scale
 
-    # Open the writer with a path, format, frame rate, and size.
-    filename = basename + '.' + file_extension
-    out = cv.VideoWriter(filename, codec_code, frame_rate, (frame_width, frame_height))
+#================================================================
+# The show as a score (see pbl/score.py), built from the same schedule, which
+# pythagorean_score.py compiles: each keyframe row is an event filling the
+# runs of its color slots, and the random colors are drawn again after the
+# last keyframe of each triple.
+
+slot_colors = (None, 'side1', 'side2', 'hypotenuse')
+
+def slot_fills(row):
+    # The runs of the color slots of a keyframe row as fills in pixel columns.
+    edges = np.flatnonzero(np.diff(row, prepend=0, append=0))
+    return [{'columns': [int(start), int(stop)], 'color': slot_colors[row[start]]}
+            for start, stop in zip(edges[:-1], edges[1:]) if row[start]]
+
+def triangle_score():
+    slots, triples, scale = triangle_schedule()
+    events = [{'fill': slot_fills(slots[0, 0]), 'hold': 1}]
+    for triangle_slots in slots:
+        events.extend({'clear': True, 'fill': slot_fills(row), 'hold': phase_keyframes} for row in triangle_slots)
+        events[-1]['redraw'] = True
+    names = ", ".join(f"{a}-{b}-{c}" for a, b, c in zip(*triples))
+    return {'description': f"Pythagorean theorem video generator, as a score: for each primitive triple that fits, "
+                           f"{names}, the sides, their squares, the square of the hypotenuse and the hypotenuse.",
+            'keyframe_beats': 5.0,
+            'length': 480,
+            'colors': {'white': [255, 255, 255], 'side1': 'random', 'side2': 'random',
+                       'hypotenuse': {'mean': ['side1', 'side2']}},
+            'background': 'white',
+            'events': events,
+            'loop': 1}
 
+#================================================================
+def keyframe_generator(verbose):
+    # The show switches from one keyframe to the next without fading: frame0
+    # and frame1 are one array, painted in place with each new keyframe.
+    slots, triples, scale = triangle_schedule()
     if verbose:
-        print(f"Open file {filename} for output.")
-
-    # Set up the frame generator.
-    frame_sequence = frame_generator(verbose, *args)
-
-    # Synthesize some frames and write them to the stream.
-    for count in range(length):
-        out.write(next(frame_sequence))
-
-    # Release everything when done.
-    out.release()
+        print("Triples:", ", ".join(f"{a}-{b}-{c} ({s} columns per unit area)" for a, b, c, s in zip(*triples, scale)))
+    frame = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
+
+    # The first sides are held once more than the other keyframes.
+    holds = np.full(4, phase_keyframes)
+    first_holds = holds + (1, 0, 0, 0)
+
+    for triangle in itertools.count():
+        triangle_slots = slots[triangle % len(slots)]
+        color0 = random_color()
+        color1 = random_color()
+        palette = np.array(((255, 255, 255), color0, color1, blend(color0, color1)), dtype=np.uint8)
+        for row, hold in zip(triangle_slots, first_holds if triangle == 0 else holds):
+            np.copyto(frame, palette[row])
+            for i in range(hold):
+                yield frame, frame
+
+def frame_generator(verbose, tempo, beat_times=None, ring=None):
+    keyframe_interval = beats.keyframe_interval(5.0, tempo, beat_times)  # seconds between key frames
+    return crossfade(keyframe_generator(verbose), keyframe_interval, ring)
 
 #================================================================
-# Main script follows.
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description = """Perfect square video generator for the Pausch Bridge.""")
-    parser.add_argument( '-v', '--verbose', action='store_true', help='Enable more detailed output.' )
-    parser.add_argument( '-l', '--length', type=int, default=480, help='Number of frames to generate (at 30 fps)')
-    parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
-    parser.add_argument( 'basename', default='pythagorean', nargs='?', help='Base name of output file (not including .mp4 extension).')
+# Show interface for the pbl command line (python3 -m pbl render pythagorean).
 
-    args = parser.parse_args()
-    write_video_file(args.basename, args.length, args.verbose, args.tempo)
\ No newline at end of file
+def add_arguments(parser):
+    parser.add_argument( '-t', '--tempo', type=float, default=30.0, help='Tempo of key frames in beats per minute.')
+    parser.add_argument( '-b', '--beats', type=beats.load, help='WAV file, or text file of beat times in seconds, to time the key frames by instead of the tempo.')
+
+def keyframes(args):
+    # The tempo-independent keyframes and their interval, for parameter sweeps.
+    return keyframe_generator(args.verbose), beats.keyframe_interval(5.0, args.tempo, args.beats)
+
+def frames(args, frame_sequence=None):
+    # Synthesize the requested number of frames, or fewer if the show ends first.
+    ring = frame_ring(args)
+    if frame_sequence is None:
+        frame_sequence = frame_generator(args.verbose, args.tempo, args.beats, ring)
+    return itertools.islice(frame_sequence, args.length)
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# pythagorean_score.py: the pythagorean show as a score.
+
+# The score is built by pythagorean.triangle_score() from the same schedule of
+# triples as the script, and compiled by pbl/score.py, with the same frames:
+#
+#   python3 -m pbl render pythagorean_score --seed 1
+
+import pythagorean
+from pbl.score import ScoreShow
+
+#================================================================
+# Show interface for the pbl command line (python3 -m pbl render pythagorean_score).
+
+show = ScoreShow(pythagorean.triangle_score())
+add_arguments, keyframes, frames = show.add_arguments, show.keyframes, show.frames